@@ -0,0 +1,68 @@
+"""
+compare per-session botocore components against the shared ones used by
+AwsSessionProvisioner
+
+builds one boto3 session per credential x region, plus an ec2 and an s3 client for
+each session (what a fully used implementor namespace ends up holding), once with
+plain boto3 sessions and once with SharedBotocoreComponents. Each layout runs in its
+own process so resident memory is measured cleanly.
+
+usage: python benchmarks/shared_components.py [credentials] [regions]
+"""
+import json
+import resource
+import subprocess
+import sys
+import time
+
+REGIONS = [
+  'ap-northeast-1', 'ap-northeast-2', 'ap-south-1', 'ap-southeast-1', 'ap-southeast-2',
+  'ca-central-1', 'eu-central-1', 'eu-west-1', 'eu-west-2', 'eu-west-3', 'sa-east-1',
+  'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2'
+]
+
+
+def run_layout(mode, n_credentials, n_regions):
+    import boto3
+    if mode == 'shared':
+        from cush.implementor.default.boto3.aws.sharedcomponents import get_shared_components
+        make_session = get_shared_components().make_session
+    else:
+        make_session = boto3.session.Session
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    objects = list()
+    for cred_n in range(n_credentials):
+        for region in (REGIONS * (n_regions // len(REGIONS) + 1))[:n_regions]:
+            session = make_session(aws_access_key_id=f'AKIA{cred_n:016d}',
+                aws_secret_access_key='x' * 40, region_name=region)
+            objects.append((session, session.client('ec2'), session.client('s3')))
+    seconds = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return dict(mode=mode, sessions=len(objects), seconds=seconds,
+        rss_mib=(rss_after - rss_before) / 1024)
+
+
+def main(n_credentials=20, n_regions=15):
+    results = dict()
+    for mode in ('separate', 'shared'):
+        out = subprocess.run([sys.executable, __file__, '--child', mode,
+            str(n_credentials), str(n_regions)], check=True, capture_output=True, text=True)
+        results[mode] = json.loads(out.stdout.splitlines()[-1])
+        print("{mode:>8}: {sessions} sessions, {seconds:.2f}s, {rss_mib:.0f} MiB".format(
+            **results[mode]))
+
+    separate, shared = results['separate'], results['shared']
+    print("   saved: {:.2f}s ({:.0%}), {:.0f} MiB ({:.0%})".format(
+        separate['seconds'] - shared['seconds'],
+        1 - shared['seconds'] / separate['seconds'],
+        separate['rss_mib'] - shared['rss_mib'],
+        1 - shared['rss_mib'] / separate['rss_mib']))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        print(json.dumps(run_layout(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))))
+    else:
+        main(*map(int, sys.argv[1:3]))
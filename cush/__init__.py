@@ -6,17 +6,33 @@ import logging.config
 from thewired import Namespace
 
 from .app import CushApplication, get_cush
+import cush.defaults as defaults
+import cush.profiling as profiling
 
 
 
 
 init_namespaces = ['user', 'implementor', 'default', 'param', 'provider', 'sdk']
 
+#- which namespaces each namespace needs to be initialized before it
+#- implementor provisioners read the user namespace, params refer to defaults and sdk
+#- nodes are bound to providers at parse time. Providers only keep implementor nsids,
+#- so they do not wait for the implementors to be provisioned.
+init_namespace_deps = {
+    'user' : [],
+    'implementor' : ['user'],
+    'default' : [],
+    'param' : ['default'],
+    'provider' : ['param'],
+    'sdk' : ['provider'],
+}
+
 #- top level root namespace that contains even the cush application objects
 _rootns = Namespace()
 
 def init_cush(application_name='default', step=True,
-        namespaces=init_namespaces, overwrite=True):
+        namespaces=init_namespaces, overwrite=True, warm_start=defaults.warm_start,
+        profile=None, parallel=defaults.parallel_init):
     """
     call this after importing to initialize the cush namespaces
 
@@ -24,9 +40,66 @@ def init_cush(application_name='default', step=True,
     step: prompt before initializing each section of the application
     namespaces: list of which namespaces to initialize
     overwrite: whether or not to overwrite existing nodes
+    warm_start: restore the namespaces from the last snapshot if the config files and
+        implementor sources are unchanged; otherwise initialize them as normal and
+        save a new snapshot
+    profile: record the time and memory each phase of the initialization takes; the
+        report is written as JSON to the cache directory and kept as the
+        startup_profile attribute of the application. Defaults to on if the
+        CUSH_PROFILE environment variable is set.
+    parallel: initialize namespaces that do not depend on each other at the same time
+        (ignored when stepping through interactively)
+    """
+    if profile is None:
+        profile = profiling.profiling_requested()
+    if profile:
+        profiling.start_profiling()
+
+    try:
+        _init_cush(application_name, step, namespaces, overwrite, warm_start, parallel)
+    finally:
+        if profile:
+            report = profiling.stop_profiling()
+            app = CushApplication.get_application(application_name)
+            if app is not None:
+                app.startup_profile = report
+                report.save(profiling.get_report_path(app.name))
+
+
+
+def make_init_graph(name_to_init_method, namespaces=init_namespaces):
     """
+    Description:
+        TaskGraph that runs the init methods of the named namespaces in dependency
+        order. Dependencies on namespaces that are not being initialized are dropped.
+
+    Input:
+        name_to_init_method: dict of namespace name -> init method
+        namespaces: names of the namespaces to initialize
+
+    Output:
+        TaskGraph of namespace name -> profiled init method
+    """
+    from cush.taskgraph import TaskGraph
+
+    def profiled(ns_name):
+        def init_namespace():
+            with profiling.phase(f"init {ns_name}"):
+                name_to_init_method[ns_name]()
+        return init_namespace
+
+    graph = TaskGraph()
+    for priority, ns_name in enumerate(namespaces):
+        deps = [x for x in init_namespace_deps.get(ns_name, list()) if x in namespaces]
+        graph.add_task(ns_name, profiled(ns_name), deps=deps, priority=priority)
+    return graph
+
+
+
+def _init_cush(application_name, step, namespaces, overwrite, warm_start, parallel):
     from cush.util import load_yaml_file
-    logging.config.dictConfig(load_yaml_file(filename=defaults.logging_config_file))
+    with profiling.phase("logging"):
+        logging.config.dictConfig(load_yaml_file(filename=defaults.logging_config_file))
     if step:
         x = input("Initializing Bare Application Object: [Enter to continue]")
 
@@ -44,10 +117,33 @@ def init_cush(application_name='default', step=True,
         'sdk' : _cushapp.init_sdk_namespace
     }
 
-    for ns_name in namespaces:
-        if step:
-            ans = input('Initialize {} Namespace? (y/n) [Y]: '.format(ns_name))
-            if ans.lower() in ['y', 'yes', 'ye', '']:
-                name_to_init_method[ns_name]()
-        else:
-            name_to_init_method[ns_name]()
+    snapshot = None
+    if warm_start:
+        from cush.snapshot import ProvisioningSnapshot, get_fingerprint
+        fingerprint = get_fingerprint()
+        snapshot_path = ProvisioningSnapshot.get_path(_cushapp.name)
+        snapshot = ProvisioningSnapshot.load(fingerprint, snapshot_path)
+        _cushapp.use_snapshot(snapshot)
+
+    initialized = list()
+    if parallel and not step and namespaces:
+        graph = make_init_graph(name_to_init_method, namespaces)
+        graph.run(max_workers=len(namespaces))
+        initialized = list(namespaces)
+
+    else:
+        for ns_name in namespaces:
+            if step:
+                ans = input('Initialize {} Namespace? (y/n) [Y]: '.format(ns_name))
+                if ans.lower() in ['y', 'yes', 'ye', '']:
+                    with profiling.phase(f"init {ns_name}"):
+                        name_to_init_method[ns_name]()
+                    initialized.append(ns_name)
+            else:
+                with profiling.phase(f"init {ns_name}"):
+                    name_to_init_method[ns_name]()
+                initialized.append(ns_name)
+
+    #- only a fully initialized application is worth restoring
+    if warm_start and snapshot is None and initialized == init_namespaces:
+        _cushapp.save_snapshot(fingerprint, snapshot_path)
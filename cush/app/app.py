@@ -1,19 +1,32 @@
 import copy
+import functools
+import importlib
+import itertools
 import os
+import re
+import threading
+from collections.abc import Mapping
 
 from thewired import NamespaceConfigParser2, NamespaceLookupError, Namespace, Nsid, NamespaceNodeBase
 from thewired import CallableSecondLifeNode
 from thewired import DelegateNode
-from thewired.namespace.nsid import make_child_nsid
+from thewired.namespace.nsid import make_child_nsid, sanitize_nsid
 
 from cush.util import ProviderClassTable
 import cush.configuration as configuration
 import cush.defaults as defaults
-from cush.util import load_yaml_file
+import cush.profiling as profiling
+from cush.fanout import FanoutExecutor
+from cush.paginate import PaginatedStream
+from cush.util import load_yaml_file, diff_dict_config, ConfigDiff
+from cush.util import make_node_config_test, bulk_add_nodes
 from cush.namespace import SdkConfigParser, ProviderConfigParser
 from cush.namespace import ParamConfigParser
 import cush.implementorlib as implementorlib
-from cush.implementorlib.flipswitch import Flipswitch
+from cush.implementorlib.flipswitch import Flipswitch, FlipswitchTable
+from cush.implementorlib.flipswitchjournal import FlipswitchJournal
+from cush.implementorlib.leafindex import LeafIndex
+from cush.responsecache import ResponseCache, CachedCall
 import cush.implementor
 
 
@@ -82,6 +95,35 @@ class CushApplication(NamespaceNodeBase):
         self.name = name
         self._ns = namespace
 
+        #- warm-start snapshot the namespaces are being restored from, if any
+        self._snapshot = None
+        #- config file name -> parsed config, for every config this app has loaded
+        self._loaded_configs = dict()
+        #- runs provisioners on first use when the implementors are loaded lazily
+        self._implementor_loader = None
+        #- states of and links between the flipswitches of this application
+        self.flipswitch_graph = FlipswitchTable(namespace=self._ns)
+        self.flipswitch_graph.add_on_listener(self._provision_turned_on)
+        self.flipswitch_graph.add_change_listener(self._journal_flipswitch_changes)
+        #- where flipswitch state changes are saved; set by load_flipswitch_states()
+        self.flipswitch_journal = None
+        #- (cush namespace name, nsid) -> nsid of its flipswitch in flipswitch_graph
+        self._flipswitch_nsids = dict()
+        self._flipswitch_prefix = None
+        #- flipswitch nsid -> (cush namespace name, nsid) of inputs left out of
+        #- provisioning because they were switched off
+        self._skipped_inputs = dict()
+        #- (cush namespace name, nsid) of skipped inputs switched back on, waiting to
+        #- be provisioned; see provision_enabled_inputs()
+        self._enabled_inputs = list()
+        self._skipped_lock = threading.Lock()
+        #- reloads the namespace configs when they change; see watch_configs()
+        self._config_watcher = None
+        #- cush namespace name -> LeafIndex of its leaf nodes; see get_leaf_index()
+        self._leaf_indexes = dict()
+        #- responses of the sdk namespace calls with a cache_ttl in the sdk config
+        self.response_cache = ResponseCache()
+
         #- initialize the NamespaceNodeBase stuff
         super().__init__(nsid='.', namespace=self._ns)
 
@@ -129,6 +171,59 @@ class CushApplication(NamespaceNodeBase):
             self._ns.add_exactly_one('.' + nsname)
 
 
+    def load_config(self, filename):
+        """
+        Description:
+            load one of the namespace config files. When restoring from a snapshot, the
+            config parsed at the time of the snapshot is used instead of the file.
+
+        Input:
+            filename: name of the config file in the cush config directory
+
+        Output:
+            parsed config
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'CushApplication.load_config'})
+        if self._snapshot is not None and filename in self._snapshot.configs:
+            log.debug(f"using snapshot config: {filename}")
+            dictConfig = self._snapshot.configs[filename]
+        else:
+            dictConfig = load_yaml_file(filename)
+        self._loaded_configs[filename] = dictConfig
+        return dictConfig
+
+
+    def use_snapshot(self, snapshot):
+        """
+        Description:
+            restore the namespaces initialized from now on from a ProvisioningSnapshot
+        """
+        self._snapshot = snapshot
+
+
+    def save_snapshot(self, fingerprint, path):
+        """
+        Description:
+            snapshot the configs loaded and the implementors provisioned so far so the
+            next start can be a warm start. Provisioners that have not run yet (see
+            init_implementor_namespace(lazy)) are recorded as placeholders.
+        """
+        from cush.snapshot import ProvisioningSnapshot
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+
+        provisioners = [p for p in\
+            itertools.chain.from_iterable(ImplementorProvisioner.all_provisioners.values())\
+            if p.app_name == self.name]
+        #- with lazy implementors, the provisioners that have not run are recorded too
+        pending = None
+        if self._implementor_loader is not None:
+            pending = self._implementor_loader.pending_specs()
+        snapshot = ProvisioningSnapshot.capture(fingerprint, self._loaded_configs,\
+            provisioners, pending=pending)
+        snapshot.save(path)
+        return snapshot
+
+
     def init_user_namespace(self):
         """
         Description:
@@ -137,11 +232,16 @@ class CushApplication(NamespaceNodeBase):
         log = LoggerAdapter(logger, {'name_ext' : 'CushApplication.init_user_namespace'})
         log.debug("Entering")
         log.info('Initializing user namespace...')
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
 
-        user_ns_handle = self._ns.get_handle('.user', create_nodes=True)
-        user_ns_parser = NamespaceConfigParser2(namespace=user_ns_handle)
-        dictConfig = load_yaml_file(defaults.user_file)
-        user_ns_parser.parse(dictConfig)
+        dictConfig = self.load_config(defaults.user_file)
+        #- other namespaces may be initialized at the same time; see init_cush(parallel)
+        with ImplementorProvisioner._ns_lock:
+            user_ns_handle = self._ns.get_handle('.user', create_nodes=True)
+            user_ns_parser = NamespaceConfigParser2(namespace=user_ns_handle)
+            with profiling.phase("parse user"):
+                user_ns_parser.parse(dictConfig)
+        self.invalidate_leaf_index('.user')
 
         #- create empty controlling flipswitches for each user / credential object loaded
         #for user in self._ns.get_subnodes('.user'):
@@ -149,29 +249,616 @@ class CushApplication(NamespaceNodeBase):
         #log.debug("Exiting")
 
 
-    def init_implementor_namespace(self, mock=False, overwrite=True):
+    def update_user_namespace(self):
+        """
+        Description:
+            Reload the user config and apply only what changed since it was last loaded:
+            the changed entries of the user namespace are re-parsed and only the
+            implementors made from them are re-provisioned. All other implementors
+            (and the connections they hold) are kept.
+
+        Input:
+            None; rereads the user config file
+
+        Output:
+            dict with lists of the user nsids 'added', 'changed' and 'removed' and of the
+            implementor nsids 'implementors_added' and 'implementors_removed'
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'CushApplication.update_user_namespace'})
+        log.debug("Entering")
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+
+        old_config = self._loaded_configs.get(defaults.user_file, dict())
+        new_config = load_yaml_file(defaults.user_file, strict=True) or dict()
+        diff = diff_dict_config(old_config, new_config)
+        log.info(f"user config changes: {diff}")
+
+        if self._snapshot is not None:
+            #- the provisioners of a warm start have not run yet; they have to, against
+            #- the old user namespace, to know which implementors came from what
+            for root_nsid in self._snapshot.provisioners:
+                self._snapshot.provision(root_nsid)
+
+        self._apply_config_diff('.user', NamespaceConfigParser2, new_config, diff)
+        self._loaded_configs[defaults.user_file] = new_config
+
+        user_nsids = lambda key_paths: ['.'.join(x) for x in key_paths]
+        result = ImplementorProvisioner.reprovision(
+            changed=user_nsids(diff.changed + diff.added), removed=user_nsids(diff.removed))
+        log.debug("Exiting")
+        return dict(added=user_nsids(diff.added), changed=user_nsids(diff.changed),
+            removed=user_nsids(diff.removed), implementors_added=result['added'],
+            implementors_removed=result['removed'])
+
+
+    def _get_namespace_configs(self):
+        """
+        Description:
+            the config files that update_namespace() can reload
+
+        Output:
+            dict of config file name -> (root nsid of its namespace, function of a
+            namespace handle returning a parser for a part of the config, the parser's
+            callback target keys)
+        """
+        return {
+            defaults.defaults_ns_file : ('.default', self._make_default_parser, []),
+            defaults.params_ns_file : ('.param', self._make_param_parser, ['__params__']),
+            defaults.providers_ns_file : ('.provider', self._make_provider_parser,\
+                ProviderClassTable().keys()),
+            defaults.sdk_ns_file : ('.sdk', self._make_sdk_parser, ['__call__']),
+        }
+
+
+    def update_namespace(self, filename):
+        """
+        Description:
+            Reload a namespace config file and apply only what changed since it was
+            last loaded. Each part of the config that makes one node (a mapping with a
+            special key such as __call__, __params__ or a provider class name in it) is
+            compared as a whole; only the nodes of the changed parts are removed and
+            parsed again. Every other node, and the objects it holds, is kept.
+
+            sdk nodes that call a changed provider are made again as well, so they
+            call the new one.
+
+        Input:
+            filename: defaults, parameters, provider or sdk config file name; the user
+                config is handed to update_user_namespace()
+
+        Output:
+            dict with lists of the nsids (below the namespace root) 'added', 'changed'
+            and 'removed'
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'CushApplication.update_namespace'})
+        log.debug(f"Entering: {filename}")
+        if filename == defaults.user_file:
+            return self.update_user_namespace()
+
+        if filename == defaults.providers_ns_file:
+            #- the changed config may use provider classes defined since it was loaded
+            ProviderClassTable.refresh()
+        namespace_configs = self._get_namespace_configs()
+        if filename not in namespace_configs:
+            raise ValueError(f"update_namespace: not a namespace config file: {filename}")
+        root_nsid, make_parser, target_keys = namespace_configs[filename]
+
+        old_config = self._loaded_configs.get(filename, dict())
+        new_config = load_yaml_file(filename, strict=True) or dict()
+        diff = diff_dict_config(old_config, new_config, is_leaf=make_node_config_test(target_keys))
+        log.info(f"{filename} changes: {diff}")
+
+        self._apply_config_diff(root_nsid, make_parser, new_config, diff)
+        self._loaded_configs[filename] = new_config
+
+        if filename == defaults.providers_ns_file and defaults.sdk_ns_file in self._loaded_configs:
+            provider_nsids = ['.provider.' + '.'.join(x) for x in diff.changed + diff.removed]
+            sdk_config = self._loaded_configs[defaults.sdk_ns_file]
+            callers = self._find_sdk_callers(sdk_config, provider_nsids)
+            if callers:
+                log.info(f"remaking the sdk nodes that call changed providers: {callers}")
+                self._apply_config_diff('.sdk', self._make_sdk_parser, sdk_config,
+                    ConfigDiff(list(), list(), callers))
+
+        to_nsids = lambda key_paths: ['.'.join(x) for x in key_paths]
+        log.debug("Exiting")
+        return dict(added=to_nsids(diff.added), changed=to_nsids(diff.changed),
+            removed=to_nsids(diff.removed))
+
+
+    @staticmethod
+    def _find_sdk_callers(sdk_config, provider_nsids, path=()):
+        """
+        Description:
+            the parts of the sdk config whose __call__ provider is one of the providers,
+            or below one of them
+
+        Output:
+            list of key paths
+        """
+        callers = list()
+        for key, value in sdk_config.items():
+            if not isinstance(value, Mapping):
+                continue
+            call = value.get('__call__')
+            if isinstance(call, Mapping) and isinstance(call.get('provider'), str):
+                #- strip the nsid:// / nsid-ref:// scheme
+                provider = str(sanitize_nsid(call['provider'].split('://', 1)[-1]))
+                if any(provider == x or provider.startswith(f"{x}.") for x in provider_nsids):
+                    callers.append(path + (key,))
+            else:
+                callers.extend(CushApplication._find_sdk_callers(value, provider_nsids,\
+                    path + (key,)))
+        return callers
+
+
+    def _apply_config_diff(self, root_nsid, make_parser, config, diff):
+        """
+        Description:
+            remove the nodes of the removed and changed parts of a config and parse
+            the changed and added parts again
+
+        Input:
+            root_nsid: nsid of the root of the namespace the config is parsed into
+            make_parser: function of a namespace handle returning a parser
+            config: the whole new config
+            diff: ConfigDiff of the old and the new config
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'CushApplication._apply_config_diff'})
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+
+        root_handle = self._ns.get_handle(root_nsid, create_nodes=True)
+        with ImplementorProvisioner._ns_lock:
+            for key_path in itertools.chain(diff.removed, diff.changed):
+                try:
+                    root_handle.remove('.'.join(key_path))
+                except NamespaceLookupError:
+                    log.debug(f"nothing to remove at {root_nsid}.{'.'.join(key_path)}")
+
+            for key_path in itertools.chain(diff.changed, diff.added):
+                *parents, name = key_path
+                value = config
+                for key in key_path:
+                    value = value[key]
+                parent_handle = self._ns.get_handle('.'.join([root_nsid] + parents),\
+                    create_nodes=True)
+                make_parser(parent_handle).parse({name : value})
+            self.invalidate_leaf_index(root_nsid)
+
+
+    def watch_configs(self, **kwargs):
+        """
+        Description:
+            reload the namespace config files whenever they change
+
+        Input:
+            kwargs: passed to ConfigWatcher
+
+        Output:
+            the started ConfigWatcher
+        """
+        from cush.configwatcher import ConfigWatcher
+        if self._config_watcher is not None:
+            self._config_watcher.stop()
+        self._config_watcher = ConfigWatcher(self, **kwargs)
+        self._config_watcher.start()
+        return self._config_watcher
+
+
+    def init_implementor_namespace(self, mock=False, overwrite=True,
+            lazy=defaults.lazy_implementors):
         """
         Description:
             initialize the implmentor namespace collection
         Load the Implementor objects and place them into a namespace
+
+        Input:
+            lazy: only import and run each provisioner when its implementors are first
+                used, using the implementor manifest to know which provisioners exist
         """
-        
+
         log = LoggerAdapter(logger, {'name_ext' :\
             'CushApplication.init_implementor_namespace'})
 
         log.debug("Entering")
         log.info("Initializing implementors namespace...")
 
+        #- before any provisioner runs, so that switched off inputs are left out
+        with profiling.phase("restore flipswitch states"):
+            self.load_flipswitch_states()
+
+        if self._snapshot is not None and self._snapshot.provisioners:
+            #- implementor modules are imported and run on first use
+            self._snapshot.restore_implementors(self)
+            if self._snapshot.pending_roots():
+                #- provisioners that had not run when the snapshot was taken
+                self._implementor_loader = self._snapshot
+            log.debug("Exiting")
+            return
+
+        if lazy:
+            self._init_lazy_implementors(overwrite=overwrite)
+            log.debug("Exiting")
+            return
+
         #- return value for debugging. The effect of this is to alter the run-time
         #- namespace by 'import'ing the available modules
-        _implementors = implementorlib.load_implementors(app_name=self.name)
+        with profiling.phase("import implementors"):
+            _implementors = implementorlib.load_implementors(app_name=self.name)
 
         log.debug("Loaded implementors: {}".format(_implementors))
-        self._make_implementors(overwrite=overwrite)
+        with profiling.phase("provision implementors"):
+            self._make_implementors(overwrite=overwrite)
         log.debug("Exiting")
         return
 
 
+    def _init_lazy_implementors(self, overwrite=False):
+        """
+        Description:
+            set up the implementor namespace to import and run provisioners on first use
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'CushApplication._init_lazy_implementors'})
+        from cush.implementorlib.manifest import ImplementorManifest, LazyProvisionerLoader
+
+        with profiling.phase("implementor manifest"):
+            manifest = ImplementorManifest.load(app_name=self.name)
+        self._implementor_loader = LazyProvisionerLoader(self, manifest)
+        self._implementor_loader.install()
+
+        #- modules the manifest could not describe are loaded the usual way
+        eager_modules = manifest.eager_modules
+        if eager_modules:
+            log.info(f"importing implementor modules not in the manifest: {eager_modules}")
+            with profiling.phase("import implementors"):
+                for module in eager_modules:
+                    importlib.import_module(module)
+            with profiling.phase("provision implementors"):
+                self._make_implementors(overwrite=overwrite)
+
+
+    def ensure_implementors(self, nsid):
+        """
+        Description:
+            make sure the provisioners of the implementors at, above or below nsid have
+            run. Nothing to do unless the implementors are loaded lazily.
+
+        Input:
+            nsid: implementor nsid (below .implementor)
+        """
+        if self._enabled_inputs:
+            self.provision_enabled_inputs()
+        if self._implementor_loader is not None:
+            self._implementor_loader.ensure_provisioned(nsid)
+
+
+    def flipswitch_nsid(self, nsid, ns_name='implementor'):
+        """
+        Description:
+            nsid of the flipswitch of a node in one of the cush namespaces, as it is
+            known in flipswitch_graph. It does not need to have been made yet.
+
+        Input:
+            nsid: nsid below the cush namespace
+            ns_name: name of the cush namespace; eg. 'implementor' or 'user'
+        """
+        key = (ns_name, nsid)
+        try:
+            return self._flipswitch_nsids[key]
+        except KeyError:
+            pass
+        fs_nsid = str(sanitize_nsid(f"{self._get_flipswitch_prefix()}.{ns_name}.{nsid}"))
+        self._flipswitch_nsids[key] = fs_nsid
+        return fs_nsid
+
+
+    def make_flipswitch_nodes(self, pattern=None):
+        """
+        Description:
+            make the .flipswitch namespace nodes of the flipswitches that only exist in
+            flipswitch_graph so far, so the flipswitch namespace can be browsed.
+            Provisioners only add flipswitches to the graph; their nodes are made here.
+
+        Input:
+            pattern: only make the nodes of the flipswitches matching this pattern
+                (see FlipswitchTable.match()); all of them by default
+
+        Output:
+            number of nodes made
+        """
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+        prefix = self._get_flipswitch_prefix()
+        with ImplementorProvisioner._ns_lock:
+            nodes = [(x[len(prefix):], Flipswitch, 'on', self.flipswitch_graph)\
+                for x in self.flipswitch_graph.without_nodes(pattern) if x.startswith(prefix)]
+            #- flipswitches that are above others are made before the nodes below them
+            nodes.sort(key=lambda x: x[0].count('.'))
+            bulk_add_nodes(self._ns.get_handle('.flipswitch'), nodes)
+        return len(nodes)
+
+
+    def _get_flipswitch_prefix(self):
+        #- nsid of the flipswitch namespace root that the flipswitch nodes' nsids start with
+        if self._flipswitch_prefix is None:
+            self._flipswitch_prefix = str(self._ns.get('.flipswitch').nsid).rstrip('.')
+        return self._flipswitch_prefix
+
+
+    def get_leaf_index(self, ns_name):
+        """
+        Description:
+            the index of the leaf nodes of one of the cush namespaces, made on first use
+
+        Input:
+            ns_name: name of the cush namespace; eg. 'user' or 'implementor'
+
+        Output:
+            LeafIndex
+        """
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+        try:
+            return self._leaf_indexes[ns_name]
+        except KeyError:
+            index = LeafIndex(self._ns, ns_name, ImplementorProvisioner._get_node_nsid)
+            return self._leaf_indexes.setdefault(ns_name, index)
+
+
+    def invalidate_leaf_index(self, nsid):
+        """
+        Description:
+            make the leaf index of the cush namespace nsid is in walk the namespace again
+            on its next lookup. For code that changes a namespace without keeping the
+            index up to date, like the config parsers.
+
+        Input:
+            nsid: nsid of the changed node, starting with the cush namespace name
+        """
+        parts = [x for x in str(nsid).split('.') if x]
+        if parts and parts[0] in self._leaf_indexes:
+            self._leaf_indexes[parts[0]].invalidate()
+
+
+    def is_active(self, nsid, ns_name='implementor'):
+        """
+        Description:
+            True if the implementor at nsid may be used: its flipswitch and every
+            flipswitch controlling it (region, user, session, ...) are on
+
+        Input:
+            nsid: implementor nsid (below .implementor)
+            ns_name: cush namespace nsid is in, for the flipswitches of other nodes
+                (eg. 'user')
+        """
+        return self.flipswitch_graph.is_active(self.flipswitch_nsid(nsid, ns_name))
+
+
+    def skip_input(self, nsid, ns_name='implementor'):
+        """
+        Description:
+            note that a provisioner left out an input because it is switched off, so
+            that it is provisioned when it is switched on again
+        """
+        fs_nsid = self.flipswitch_nsid(nsid, ns_name)
+        with self._skipped_lock:
+            self._skipped_inputs[fs_nsid] = (ns_name, nsid)
+
+
+    def _provision_turned_on(self, fs_nsids):
+        """
+        Description:
+            flipswitch_graph listener: queue the inputs that were skipped while they
+            were switched off, now that they are on. They are provisioned by the next
+            ensure_implementors() (so the next lookup or fan-out), not by whoever
+            flipped the switch, who may be holding locks provisioning needs.
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'CushApplication._provision_turned_on'})
+        if not self._skipped_inputs:
+            return
+        with self._skipped_lock:
+            enabled = [self._skipped_inputs.pop(x) for x in fs_nsids\
+                if x in self._skipped_inputs]
+            self._enabled_inputs.extend(enabled)
+        if enabled:
+            log.info(f"inputs switched back on, provisioned on next use: {enabled}")
+
+
+    def provision_enabled_inputs(self):
+        """
+        Description:
+            provision the inputs that were skipped while they were switched off and
+            have been switched on since
+
+        Output:
+            dict with lists of the implementor nsids 'added' and 'removed', as returned
+            by ImplementorProvisioner.reprovision()
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'CushApplication.provision_enabled_inputs'})
+        with self._skipped_lock:
+            enabled, self._enabled_inputs = self._enabled_inputs, list()
+        if not enabled:
+            return dict(added=list(), removed=list())
+
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+        log.info(f"provisioning inputs switched back on: {enabled}")
+        try:
+            return ImplementorProvisioner.reprovision(enabled=[nsid for _,nsid in enabled])
+        except Exception:
+            #- still left out; provisioned when they are switched on again
+            with self._skipped_lock:
+                for ns_name, nsid in enabled:
+                    self._skipped_inputs[self.flipswitch_nsid(nsid, ns_name)] = (ns_name, nsid)
+            raise
+
+
+    def load_flipswitch_states(self, journal=None):
+        """
+        Description:
+            restore the saved flipswitch states and save every change from now on. Run
+            before provisioning, so that the inputs that are switched off are left out.
+
+        Input:
+            journal: FlipswitchJournal; defaults to the one of this application in the
+                cush config directory
+
+        Output:
+            number of flipswitch states restored
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'CushApplication.load_flipswitch_states'})
+        if journal is None:
+            journal = FlipswitchJournal.for_app(self.name)
+        #- saved by nsid below .flipswitch, which is what they are already sanitized to
+        count = self.flipswitch_graph.restore(journal.load(), prefix=self._get_flipswitch_prefix())
+        self.flipswitch_journal = journal
+        log.info(f"restored {count} flipswitch states from {journal.snapshot_path}")
+        return count
+
+
+    def _journal_flipswitch_changes(self, changes):
+        """
+        Description:
+            flipswitch_graph listener: save state changes to the flipswitch journal
+        """
+        if self.flipswitch_journal is None:
+            return
+        prefix = self._get_flipswitch_prefix()
+        start = len(prefix)
+        self.flipswitch_journal.append([(nsid[start:], state) for nsid, state in changes\
+            if nsid.startswith(prefix + '.')])
+
+
+    def fanout(self, nsid, method, *args, **kwargs):
+        """
+        Description:
+            call method on every active implementor below nsid concurrently, with the
+            default limits (see cush.fanout.FanoutExecutor for other limits)
+
+        Input:
+            nsid: implementor nsid, eg. '.implementor.boto3.aws.ec2.client'
+            method: name of the method to call, or a callable passed each implementor
+            args, kwargs: passed to each call
+
+        Output:
+            generator of FanoutResult, in the order the calls finish
+        """
+        return FanoutExecutor(self).run(nsid, method, *args, **kwargs)
+
+
+    def paginate(self, nsid, operation, search=None, where=None, limit=None,
+            include_inactive=False, **kwargs):
+        """
+        Description:
+            stream the items of a paginated operation on every active client
+            implementor below nsid, page by page as they arrive from each region,
+            instead of waiting for all the pages of all the regions
+
+        Input:
+            nsid: client implementor nsid, eg. '.implementor.boto3.aws.ec2.client'
+            operation: name of the paginated client method; eg. 'describe_instances'
+            search: JMESPath expression picking the items out of each page; defaults to
+                the paginator's result keys
+            where: function of an item; only the items it returns True for are yielded
+            limit: stop after this many items, eg. the first 100 matches
+            include_inactive: also paginate on the implementors that are switched off
+            kwargs: passed to paginate(); eg. Filters, PaginationConfig
+
+        Output:
+            PaginatedStream of (implementor nsid, item); see cush.paginate
+        """
+        executor = FanoutExecutor(self)
+        return PaginatedStream(executor.select(nsid, include_inactive=include_inactive),\
+            operation, search=search, where=where, limit=limit, executor=executor,\
+            **kwargs)
+
+
+    def assume_roles(self, role_arns, source, user_nsid='aws', names=None,
+            session_name=None, regions=None, services=None, provision=True,
+            max_workers=defaults.sts_bulk_max_workers, cache=None):
+        """
+        Description:
+            Assume many roles (eg. the same role in every account of an organization)
+            and add a CushUser for each one to the user namespace, with the AwsRole as
+            its credential; the sessions provisioned for it use credentials that
+            refresh themselves (see AwsRole.get_refreshable_credentials).
+
+            The source is resolved once for all the roles: when it is a role itself,
+            it is assumed once and its credentials are used to assume all of them.
+            The STS calls are made concurrently and retried with backoff while STS is
+            throttling them (see StsCredentialCache).
+
+        Input:
+            role_arns: ARNs of the roles to assume
+            source: user nsid (eg. 'aws.admin') of the credentials to assume the roles
+                with, or a credential, CushUser or AwsRole object
+            user_nsid: nsid in the user namespace to add the CushUsers below
+            names: optional dict of role ARN -> user name; defaults to
+                <role name>_<account id>
+            session_name: role session name; defaults to cush_<user name>
+            regions, services: passed to each CushUser
+            provision: provision the implementors of the new users
+            max_workers: maximum number of roles assumed at the same time
+            cache: StsCredentialCache to use; defaults to the process-wide one
+
+        Output:
+            dict with lists of the user nsids 'added' and implementor nsids
+            'implementors_added', and a dict 'failed' of role ARN -> exception for the
+            roles that could not be assumed
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'CushApplication.assume_roles'})
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+        from cush.stscache import get_sts_cache
+        from cush.user import AwsRole, CushUser
+        log.debug(f"Entering: {len(role_arns)} roles")
+        if cache is None:
+            cache = get_sts_cache()
+        names = dict() if names is None else names
+
+        if isinstance(source, str):
+            source = self._ns.get(sanitize_nsid(f".user.{source}"))
+        #- the source of a role chain is assumed here, once
+        if callable(getattr(source, 'assume_role', None)):
+            source_creds = source.assume_role(cache=cache)
+        else:
+            source_creds = source
+
+        roles = list()
+        for arn in role_arns:
+            name = names.get(arn) or role_user_name(arn)
+            role = AwsRole(None, name, arn, None, role_session_name=session_name,
+                regions=regions, services=services, sts_cache=cache)
+            role.set_source(source)
+            roles.append(role)
+
+        results = cache.get_many([dict(role_arn=x.arn, source_creds=source_creds,\
+            session_name=x.role_session_name) for x in roles], max_workers=max_workers)
+
+        failed = dict()
+        assumed = list()
+        for role, result in zip(roles, results):
+            if isinstance(result, Exception):
+                log.warning(f"could not assume {role.arn}: {result}")
+                failed[role.arn] = result
+            else:
+                #- a cache hit now
+                role.assume_role()
+                assumed.append(role)
+
+        user_handle = self._ns.get_handle(sanitize_nsid(f".user.{user_nsid}"),\
+            create_nodes=True)
+        factory = functools.partial(CushUser, regions=regions, services=services)
+        with ImplementorProvisioner._ns_lock:
+            bulk_add_nodes(user_handle, [(f".{x.name}", factory, x.name, x) for x in assumed])
+            user_index = self.get_leaf_index('user')
+            for x in assumed:
+                user_index.add(f".{user_nsid}.{x.name}", user_handle.get(f".{x.name}"))
+
+        added = [str(sanitize_nsid(f"{user_nsid}.{x.name}")).lstrip('.') for x in assumed]
+        implementors_added = list()
+        if provision and added:
+            implementors_added = ImplementorProvisioner.reprovision(changed=added)['added']
+        log.info(f"assumed {len(assumed)} roles, {len(failed)} failed")
+        return dict(added=added, failed=failed, implementors_added=implementors_added)
+
+
     #- Note: this doesn't need to be passed a reference to the CushApplication object
     #-       because it will dynamically get the applicaiton object from the name of
     #-       the ImplementorProvisioner module, which, by default, is taken from the
@@ -222,12 +909,18 @@ class CushApplication(NamespaceNodeBase):
         log = LoggerAdapter(logger, {'name_ext': 'CushApplication.init_default_namespace'})
         log.debug("Entering")
         log.info("Initializing Defaults Namespace...")
-        parser = NamespaceConfigParser2(namespace=self._ns.get_handle('.default'))
-        dictConfig = load_yaml_file(defaults.defaults_ns_file)
-        parser.parse(dictConfig)
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+        parser = self._make_default_parser(self._ns.get_handle('.default'))
+        dictConfig = self.load_config(defaults.defaults_ns_file)
+        with profiling.phase("parse default"), ImplementorProvisioner._ns_lock:
+            parser.parse(dictConfig)
         log.debug("Exiting")
 
 
+    def _make_default_parser(self, namespace):
+        return NamespaceConfigParser2(namespace=namespace)
+
+
     def init_param_namespace(self, node=None):
         """
         Description:
@@ -235,6 +928,27 @@ class CushApplication(NamespaceNodeBase):
         Input:
             node: root node of the parameters namespace. (defaults to self.params)
         """
+        log = LoggerAdapter(logger, {'name_ext': 'CushApplication.init_parameter_namespace'})
+        log.debug("Entering")
+        log.info("Initializing Parameters Namespace...")
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+        dictConfig = self.load_config(defaults.params_ns_file)
+
+        parser = self._make_param_parser(self._ns.get_handle('.param'))
+
+        with profiling.phase("parse param"), ImplementorProvisioner._ns_lock:
+            parser.parse(dictConfig)
+        log.debug("Exiting")
+
+
+    def _make_param_parser(self, namespace):
+        """
+        Description:
+            parser for (a part of) the parameters config
+
+        Input:
+            namespace: handle to the node the parsed config goes below
+        """
         params_key = '__params__'
         def parse_input_mutator(dictConfig, key):
             new_key_name = "raw"
@@ -252,21 +966,11 @@ class CushApplication(NamespaceNodeBase):
             }
             return (mutated_config, new_key_name)
 
-
-
-        log = LoggerAdapter(logger, {'name_ext': 'CushApplication.init_parameter_namespace'})
-        log.debug("Entering")
-        log.info("Initializing Parameters Namespace...")
-        dictConfig = load_yaml_file(defaults.params_ns_file)
-
-        parser = NamespaceConfigParser2(
-                        namespace=self._ns.get_handle('.param'),
-                        callback_target_keys=["__params__"],
+        return NamespaceConfigParser2(
+                        namespace=namespace,
+                        callback_target_keys=[params_key],
                         input_mutator_callback=parse_input_mutator)
 
-        parser.parse(dictConfig)
-        log.debug("Exiting")
-
 
     def init_provider_namespace(self):
         log = LoggerAdapter(logger, {'name_ext' :\
@@ -274,11 +978,32 @@ class CushApplication(NamespaceNodeBase):
 
         log.debug("Entering")
         log.info("Initializing provider namespace...")
-        dictConfig = load_yaml_file(defaults.providers_ns_file)
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+        dictConfig = self.load_config(defaults.providers_ns_file)
+
+        parser = self._make_provider_parser(self._ns.get_handle('.provider'))
+
+        with profiling.phase("parse provider"), ImplementorProvisioner._ns_lock:
+            parser.parse(dictConfig)
+
+        log.debug("Exiting")
+        return
+
+
+    def _make_provider_parser(self, namespace):
+        """
+        Description:
+            parser for (a part of) the provider config
 
-        pct = ProviderClassTable()
-        trigger_keys = list(pct.keys())
+        Input:
+            namespace: handle to the node the parsed config goes below
+        """
+        log = LoggerAdapter(logger, {'name_ext' :\
+            'CushApplication._make_provider_parser'})
+        #- shared by all applications; a live view, so it sees classes added later
+        trigger_keys = ProviderClassTable().keys()
         log.debug(f"got parse callback trigger keys: {trigger_keys=}")
+        implementor_ns = self._ns.get_handle(".implementor")
 
         ########################################################################
         # begin parsing callback
@@ -291,15 +1016,13 @@ class CushApplication(NamespaceNodeBase):
             log.debug(f"Entering: {key=} | {dictConfig=}")
             new_key_name = None  #- special code to overwrite node with result of parsing this returned config
 
-            init_dictConfig = copy.copy(dictConfig[key])
-            init_dictConfig["implementor_namespace"] = self._ns.get_handle(".implementor")
-            log.debug(f"got handle to implementor ns: {init_dictConfig['implementor_namespace']=}")
+            init_dictConfig = dict(dictConfig[key], implementor_namespace=implementor_ns)
             mutated_config =  {
                 new_key_name: {
                     "__class__" : "thewired.CallableDelegateNode",
                     "__init__" : {
                         "delegate" : {
-                            "__class__" : f"thewired.{key}",
+                            "__class__" : ProviderClassTable.get_class_path(key),
                             "__init__" : init_dictConfig
                         }
                     }
@@ -311,17 +1034,12 @@ class CushApplication(NamespaceNodeBase):
         #
         # end parsing callback
         ########################################################################
-            
-        parser = NamespaceConfigParser2(
-                    namespace=self._ns.get_handle('.provider'),
+
+        return NamespaceConfigParser2(
+                    namespace=namespace,
                     callback_target_keys=trigger_keys,
                     input_mutator_callback=provider_mutator)
 
-        parser.parse(dictConfig)
-
-        log.debug("Exiting")
-        return
-
 
     def init_sdk_namespace(self, node=None):
         """
@@ -346,6 +1064,30 @@ class CushApplication(NamespaceNodeBase):
             log.debug("secondlife['__call__']() returned {x}")
             return x
         """
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+        parser = self._make_sdk_parser(sdk_ns)
+        dictConfig = self.load_config(defaults.sdk_ns_file)
+        with profiling.phase("parse sdk"), ImplementorProvisioner._ns_lock:
+            parser.parse(dictConfig)
+
+        #sdk_conf_parser = SdkConfigParser(provider_ns = self.provider,\
+        #    nsroot=self.app_nsroot)
+        #sdk_ns_roots = sdk_conf_parser.parse(dictConfig)
+        #for ns in sdk_ns_roots:
+        #    node._add_ns(ns)
+
+        log.debug("Exiting")
+
+
+    def _make_sdk_parser(self, namespace):
+        """
+        Description:
+            parser for (a part of) the sdk config
+
+        Input:
+            namespace: handle to the node the parsed config goes below
+        """
+        sdk_ns = self._ns.get_handle('.sdk')
         ###
         # begin parse callback
         def make_callable(dictConfig, key):
@@ -365,13 +1107,21 @@ class CushApplication(NamespaceNodeBase):
                 }
             }
             """
+            call_config = dictConfig[key]
+            call = self._ns.get(call_config['provider'])
+            ttl = call_config.get('cache_ttl', defaults.sdk_cache_default_ttl)
+            if ttl:
+                call = CachedCall(call, str(call_config['provider']), ttl,\
+                    self.response_cache, lambda: self.flipswitch_graph.epoch)
+                #- responses cached before the config was (re)parsed may be stale
+                call.invalidate()
             mutated_config = {
                 None: {
                     "__class__" : "thewired.CallableSecondLifeNode",
                     "__init__" : {
                         "namespace" : sdk_ns,
                         "secondlife" : {
-                            "__call__" : self._ns.get(dictConfig[key]['provider'])
+                            "__call__" : call
                         }
                     }
 
@@ -382,22 +1132,11 @@ class CushApplication(NamespaceNodeBase):
         # end parse callback
         ###
 
-
-        parser = NamespaceConfigParser2(
-                namespace=sdk_ns,
+        return NamespaceConfigParser2(
+                namespace=namespace,
                 lookup_ns=self._ns,
                 callback_target_keys="__call__",
                 input_mutator_callback=make_callable)
-        dictConfig = load_yaml_file(defaults.sdk_ns_file) 
-        parser.parse(dictConfig)
-
-        #sdk_conf_parser = SdkConfigParser(provider_ns = self.provider,\
-        #    nsroot=self.app_nsroot)
-        #sdk_ns_roots = sdk_conf_parser.parse(dictConfig)
-        #for ns in sdk_ns_roots:
-        #    node._add_ns(ns)
-
-        log.debug("Exiting")
 
 
 
@@ -423,6 +1162,19 @@ class CushApplication(NamespaceNodeBase):
 
 
 
+def role_user_name(role_arn):
+    """
+    Description:
+        default user name for an assumed role: <role name>_<account id>, eg.
+        arn:aws:iam::123456789012:role/ops/Admin -> Admin_123456789012
+    """
+    parts = role_arn.split(':')
+    account = parts[4] if len(parts) > 5 else ''
+    role_name = parts[-1].rsplit('/', 1)[-1]
+    return re.sub(r'[^A-Za-z0-9_]', '_', '_'.join(x for x in (role_name, account) if x))
+
+
+
 def get_cush(name='default'):
     """
     Description:
@@ -0,0 +1,253 @@
+"""
+reload the cush config files when they change
+
+A ConfigWatcher runs a thread that waits for the namespace config files to change and
+hands each changed file to CushApplication.update_namespace(), which applies only what
+changed to the live namespaces.
+
+On linux the config directory is watched with inotify (through ctypes, as the
+standard library has no binding); elsewhere, or when inotify can not be set up, the
+files' mtimes are polled. Editors that save by writing a new file and renaming it
+over the old one are caught either way, as the directory is watched rather than the
+files.
+"""
+from logging import getLogger, LoggerAdapter
+logger = getLogger(__name__)
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+import cush.defaults as defaults
+from cush.util import filename_to_fullpath
+
+
+
+#- from <sys/inotify.h>
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_Q_OVERFLOW = 0x00004000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+#- struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len]
+_inotify_event = struct.Struct('iIII')
+
+
+def _inotify_watch(directory):
+    """
+    Description:
+        an inotify file descriptor watching directory for files written or moved in
+
+    Output:
+        file descriptor, or None if inotify is not available
+    """
+    log = LoggerAdapter(logger, {'name_ext' : '_inotify_watch'})
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        inotify_init1 = libc.inotify_init1
+        inotify_add_watch = libc.inotify_add_watch
+    except (OSError, AttributeError, TypeError) as err:
+        log.debug(f"inotify not available: {err}")
+        return None
+
+    fd = inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+    if fd < 0:
+        log.debug(f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+        return None
+    if inotify_add_watch(fd, os.fsencode(directory), _IN_CLOSE_WRITE | _IN_MOVED_TO) < 0:
+        log.debug(f"inotify_add_watch {directory} failed: {os.strerror(ctypes.get_errno())}")
+        os.close(fd)
+        return None
+    return fd
+
+
+
+def _read_inotify_names(fd):
+    """
+    Description:
+        names of the files of the events waiting on an inotify file descriptor
+
+    Output:
+        set of file names; None if events were lost
+    """
+    names = set()
+    while True:
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _inotify_event.unpack_from(data, offset)
+            offset += _inotify_event.size
+            if mask & _IN_Q_OVERFLOW:
+                return None
+            names.add(os.fsdecode(data[offset:offset + length].rstrip(b'\0')))
+            offset += length
+
+
+
+class ConfigWatcher(object):
+    """
+    Description:
+        reloads changed config files into the namespaces of a CushApplication
+    """
+    def __init__(self, app, filenames=None, config_dir=defaults.config_dir,
+            poll_interval=defaults.config_poll_interval,
+            reload_delay=defaults.config_reload_delay, use_inotify=True, on_reload=None):
+        """
+        Input:
+            app: CushApplication to reload the config files of
+            filenames: config file names to watch; defaults to the user and the
+                namespace config files, in the order they are reloaded in
+            config_dir: directory the config files are in
+            poll_interval: seconds between checks when polling
+            reload_delay: seconds to wait after a change for more changes, so a file
+                saved in several writes is reloaded once
+            use_inotify: watch with inotify when it is available; poll if False
+            on_reload: callable(filename, result, error) called after each reload, with
+                what update_namespace() returned or the exception it raised
+        """
+        if filenames is None:
+            filenames = [defaults.user_file, defaults.defaults_ns_file,\
+                defaults.params_ns_file, defaults.providers_ns_file, defaults.sdk_ns_file]
+        self.app = app
+        self.filenames = list(filenames)
+        self.config_dir = filename_to_fullpath(config_dir, '.')
+        self.poll_interval = poll_interval
+        self.reload_delay = reload_delay
+        self.use_inotify = use_inotify
+        self.on_reload = on_reload
+        #- 'inotify' or 'poll' once started
+        self.mode = None
+
+        self._stats = {x : self._stat(x) for x in self.filenames}
+        self._inotify_fd = None
+        self._wake_r, self._wake_w = None, None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+
+    def _stat(self, filename):
+        try:
+            st = os.stat(os.path.join(self.config_dir, filename))
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+    def start(self):
+        log = LoggerAdapter(logger, {'name_ext' : 'ConfigWatcher.start'})
+        if self._thread is not None:
+            return
+        if self.use_inotify:
+            self._inotify_fd = _inotify_watch(self.config_dir)
+        self.mode = 'poll' if self._inotify_fd is None else 'inotify'
+        self._wake_r, self._wake_w = os.pipe()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='cush-configwatcher',\
+            daemon=True)
+        self._thread.start()
+        log.info(f"watching {self.config_dir} ({self.mode}): {self.filenames}")
+
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        os.write(self._wake_w, b'\0')
+        self._thread.join()
+        self._thread = None
+        for fd in (self._inotify_fd, self._wake_r, self._wake_w):
+            if fd is not None:
+                os.close(fd)
+        self._inotify_fd, self._wake_r, self._wake_w = None, None, None
+
+
+    def _wait(self, timeout):
+        """
+        Description:
+            wait for a change in the config directory, the timeout or stop()
+
+        Output:
+            set of changed file names when inotify says which, or None when every file
+            is to be checked
+        """
+        fds = [self._wake_r] if self._inotify_fd is None else [self._wake_r, self._inotify_fd]
+        ready, _, _ = select.select(fds, [], [], timeout)
+        if self._inotify_fd is not None and self._inotify_fd in ready:
+            return _read_inotify_names(self._inotify_fd)
+        return None if self._inotify_fd is None else set()
+
+
+    def _run(self):
+        log = LoggerAdapter(logger, {'name_ext' : 'ConfigWatcher._run'})
+        while not self._stop_event.is_set():
+            timeout = self.poll_interval if self._inotify_fd is None else None
+            names = self._wait(timeout)
+            if self._stop_event.is_set():
+                break
+            if names is None:
+                if all(self._stat(x) == self._stats[x] for x in self.filenames):
+                    continue
+            elif not names.intersection(self.filenames):
+                continue
+            #- let a save that takes several writes finish
+            time.sleep(self.reload_delay)
+            if self._inotify_fd is not None:
+                _read_inotify_names(self._inotify_fd)
+            try:
+                self.check()
+            except Exception as err:
+                log.exception(f"config reload failed: {err}")
+
+
+    def check(self):
+        """
+        Description:
+            reload the watched files that changed since they were last checked
+
+        Output:
+            dict of file name -> what update_namespace() returned, for the files that
+            were reloaded
+        """
+        changed = list()
+        for filename in self.filenames:
+            stat = self._stat(filename)
+            if stat != self._stats[filename]:
+                self._stats[filename] = stat
+                #- a removed file is left as it was last loaded
+                if stat is not None:
+                    changed.append(filename)
+        return self.reload(changed)
+
+
+    def reload(self, filenames):
+        """
+        Description:
+            apply the changes of config files to the application's namespaces; a file
+            that fails to reload (eg. it can not be parsed) leaves its namespace as it
+            was
+
+        Output:
+            dict of file name -> what update_namespace() returned, for the files that
+            were reloaded
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'ConfigWatcher.reload'})
+        results = dict()
+        for filename in filenames:
+            start = time.perf_counter()
+            try:
+                result, error = self.app.update_namespace(filename), None
+                results[filename] = result
+                log.info(f"reloaded {filename} in {time.perf_counter() - start:.3f}s")
+            except Exception as err:
+                result, error = None, err
+                log.error(f"not reloading {filename}: {err}")
+            if self.on_reload is not None:
+                self.on_reload(filename, result, error)
+        return results
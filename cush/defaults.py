@@ -10,6 +10,8 @@ information
 ##########################################################################################
 
 config_dir = "~/.config/cush"
+#- derived data that can be thrown away at any time
+cache_dir = "~/.config/cush/cache"
 user_file = "user.yaml"
 sdk_ns_file = "sdk_ns.yaml"
 runtime_config_file = "config.yaml"
@@ -17,6 +19,15 @@ logging_config_file = "logging.yaml"
 providers_ns_file = "provider.yaml"
 params_ns_file = "parameters.yaml"
 defaults_ns_file = "defaults.yaml"
+snapshot_file = "snapshot.pickle"
+manifest_file = "manifest.json"
+#- parsed YAML config files are cached in this directory below cache_dir
+yaml_cache_subdir = "yaml"
+#- saved flipswitch states: compacted snapshot and journal of the changes since
+flipswitch_file = "flipswitch.json"
+flipswitch_journal_file = "flipswitch.journal"
+#- temporary credentials of assumed roles, below cache_dir
+sts_credentials_file = "sts_credentials.json"
 
 
 
@@ -34,3 +45,114 @@ defaults_ns_file = "defaults.yaml"
 # #- the list of namespaces that will be initalized
 # init_namespaces = ['user', 'implementor', 'default', 'param', 'provider', 'sdk']
 
+
+
+
+##########################################################################################
+#                                                                                        #
+#                             Provisioning Settings                                      #
+#                                                                                        #
+##########################################################################################
+#- maximum number of implementor provisioners run at the same time
+provisioner_max_workers = 8
+
+#- initialize namespaces that do not depend on each other concurrently in init_cush
+parallel_init = True
+
+#- restore namespaces from the warm-start snapshot when nothing has changed
+warm_start = False
+
+#- import and run each implementor provisioner only when its implementors are first used
+lazy_implementors = True
+
+#- compact the flipswitch journal into its snapshot once it has this many lines
+flipswitch_compact_after = 1000
+
+
+
+
+##########################################################################################
+#                                                                                        #
+#                             Fan-out Settings                                           #
+#                                                                                        #
+##########################################################################################
+#- maximum number of implementor calls made at the same time by a fan-out
+fanout_max_workers = 32
+#- maximum number of calls at the same time to the implementors of one region
+fanout_max_per_region = 8
+#- maximum number of calls at the same time made with one credential
+fanout_max_per_credential = 8
+#- seconds to wait for each call before reporting it as timed out; None waits forever
+fanout_timeout = 120
+#- pages of a paginated stream (see cush.paginate) waiting to be read before its
+#- paginators wait for the reader
+stream_queue_pages = 8
+
+
+
+
+##########################################################################################
+#                                                                                        #
+#                             Config Watching Settings                                   #
+#                                                                                        #
+##########################################################################################
+#- seconds between checks of the config files when inotify is not available
+config_poll_interval = 1.0
+#- seconds to wait after a config file changes for more changes before reloading
+config_reload_delay = 0.05
+
+
+
+
+##########################################################################################
+#                                                                                        #
+#                             STS Credential Settings                                    #
+#                                                                                        #
+##########################################################################################
+#- seconds the credentials of an assumed role are requested for
+sts_duration = 3600
+#- cached credentials are not used once they have fewer seconds than this left
+sts_expiry_margin = 60
+#- cached credentials with fewer seconds than this left are refreshed in the background
+sts_refresh_ahead = 300
+#- STS endpoint to use instead of AWS's, eg. a local stand-in for testing
+sts_endpoint_url = None
+#- maximum number of background credential refreshes at the same time
+sts_refresh_workers = 4
+#- maximum number of roles assumed at the same time by a bulk assume
+sts_bulk_max_workers = 32
+#- attempts at each STS call when STS is throttling requests
+sts_max_attempts = 8
+#- seconds of the first backoff after a throttled STS call; doubled for each attempt
+#- and capped at sts_backoff_cap (with full jitter)
+sts_backoff_base = 0.2
+sts_backoff_cap = 10
+
+
+
+
+##########################################################################################
+#                                                                                        #
+#                             SDK Response Cache Settings                                #
+#                                                                                        #
+##########################################################################################
+#- responses of sdk namespace calls are only cached for the calls with a cache_ttl in
+#- the sdk config; this is the TTL of the ones without, None not caching them at all
+sdk_cache_default_ttl = None
+#- maximum number of responses kept
+sdk_cache_max_entries = 1024
+#- maximum (estimated) bytes of the responses kept
+sdk_cache_max_bytes = 64 * 1024 * 1024
+
+
+
+
+##########################################################################################
+#                                                                                        #
+#                             Profiling Settings                                         #
+#                                                                                        #
+##########################################################################################
+#- set this environment variable (to anything but 0 / no / false) to profile init_cush
+profile_env_var = "CUSH_PROFILE"
+#- the JSON profile report is written to cache_dir/<app name>.<profile_file>
+profile_file = "profile.json"
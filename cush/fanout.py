@@ -0,0 +1,302 @@
+"""
+concurrent fan-out of one call over the implementors below an nsid
+
+Selects the implementors below an implementor nsid, leaves out the ones that are not
+active (see CushApplication.is_active), and calls the same method on each of them on a
+bounded thread pool. Calls are limited per region and per credential as well as
+overall, and each result is yielded as soon as it is available, tagged with the nsid
+of the implementor it came from.
+
+A call that takes longer than the timeout is reported as timed out and no longer
+counts against the region and credential limits, but python threads can not be
+stopped: its worker thread stays busy until the call returns, and counts against
+max_workers until then, so no other call is queued behind it.
+"""
+from logging import getLogger, LoggerAdapter
+logger = getLogger(__name__)
+
+import collections
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from thewired.namespace.nsid import sanitize_nsid
+
+import cush.defaults as defaults
+
+
+
+#- region nsid component, eg. us_east_1, eu_central_1, us_gov_west_1
+_region_re = re.compile(r'^[a-z]{2}(_[a-z]+)+_[0-9]+$')
+
+
+def nsid_region(nsid):
+    """
+    Description:
+        the region an implementor nsid is for: its first component that looks like a
+        (sanitized) region name
+
+    Output:
+        region nsid component, or None
+    """
+    for part in str(nsid).split('.'):
+        if _region_re.match(part):
+            return part
+    return None
+
+
+
+def nsid_credential(nsid):
+    """
+    Description:
+        the user (credential) an implementor nsid is for: the part of the nsid from
+        its user namespace component on
+
+    Output:
+        user nsid, or None
+    """
+    nsid = str(nsid)
+    index = nsid.find('.user.')
+    if index == -1:
+        return None
+    return nsid[index:]
+
+
+
+class FanoutResult(object):
+    """
+    Description:
+        outcome of the call to one implementor in a fan-out
+    """
+    def __init__(self, nsid, value=None, error=None, elapsed=None, timed_out=False):
+        self.nsid = nsid
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+        self.timed_out = timed_out
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            outcome = "ok"
+        else:
+            outcome = "error={!r}".format(self.error)
+        return "FanoutResult(nsid={}, {}, elapsed={})".format(self.nsid, outcome,
+            None if self.elapsed is None else round(self.elapsed, 6))
+
+
+
+class FanoutExecutor(object):
+    """
+    Description:
+        calls a method on many implementors concurrently
+    """
+    def __init__(self, app=None, max_workers=defaults.fanout_max_workers,
+            max_per_region=defaults.fanout_max_per_region,
+            max_per_credential=defaults.fanout_max_per_credential,
+            timeout=defaults.fanout_timeout, region_key=nsid_region,
+            credential_key=nsid_credential):
+        """
+        Input:
+            app: CushApplication to select implementors from; only needed for run()
+            max_workers: maximum number of calls made at the same time
+            max_per_region: maximum number of calls at the same time per region; None
+                for no limit
+            max_per_credential: maximum number of calls at the same time per
+                credential; None for no limit
+            timeout: seconds to wait for each call; None waits forever
+            region_key, credential_key: functions of an implementor nsid returning the
+                region / credential it is for, or None if it is not for one
+        """
+        self.app = app
+        self.max_workers = max_workers
+        self.max_per_region = max_per_region
+        self.max_per_credential = max_per_credential
+        self.timeout = timeout
+        self.region_key = region_key
+        self.credential_key = credential_key
+
+
+    def select(self, nsid, include_inactive=False):
+        """
+        Description:
+            the implementors below nsid
+
+        Input:
+            nsid: implementor nsid, with or without the leading '.implementor'
+            include_inactive: also select the implementors whose flipswitches are off
+
+        Output:
+            list of (implementor nsid, implementor node)
+        """
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+        log = LoggerAdapter(logger, {'name_ext' : 'FanoutExecutor.select'})
+
+        nsid = str(sanitize_nsid(f".{nsid}"))
+        if nsid == '.implementor' or nsid.startswith('.implementor.'):
+            nsid = nsid[len('.implementor'):]
+        self.app.ensure_implementors(nsid or '.')
+
+        with ImplementorProvisioner._ns_lock:
+            nodes = self.app.get_leaf_index('implementor').lookup(nsid or '.')
+
+        selected = list()
+        skipped = 0
+        for node in nodes:
+            imp_nsid = ImplementorProvisioner._get_node_nsid(node, 'implementor')
+            if imp_nsid is None:
+                continue
+            if not include_inactive and not self.app.is_active(imp_nsid):
+                skipped += 1
+                continue
+            selected.append((imp_nsid, node))
+        log.debug(f"{nsid}: {len(selected)} implementors selected, {skipped} switched off")
+        return selected
+
+
+    def run(self, nsid, method, *args, **kwargs):
+        """
+        Description:
+            call method on every active implementor below nsid
+
+        Input:
+            nsid: implementor nsid, eg. '.implementor.boto3.aws.ec2.client'
+            method: name of the method to call on each implementor, or a callable that
+                is passed the implementor
+            args, kwargs: passed to each call
+
+        Output:
+            generator of FanoutResult, in the order the calls finish
+        """
+        return self.map(self.select(nsid), method, *args, **kwargs)
+
+
+    def map(self, implementors, method, *args, **kwargs):
+        """
+        Description:
+            call method on each of the implementors
+
+        Input:
+            implementors: iterable of (nsid, implementor)
+            method, args, kwargs: see run()
+
+        Output:
+            generator of FanoutResult, in the order the calls finish
+        """
+        if callable(method):
+            call = lambda implementor: method(implementor, *args, **kwargs)
+        else:
+            call = lambda implementor: getattr(implementor, method)(*args, **kwargs)
+        return self._run(list(implementors), call)
+
+
+    def _limits(self, nsid):
+        """
+        Description:
+            (key, limit) of every concurrency limit a call to the implementor at nsid
+            counts against
+        """
+        limits = list()
+        if self.max_per_region is not None:
+            region = self.region_key(nsid)
+            if region is not None:
+                limits.append((('region', region), self.max_per_region))
+        if self.max_per_credential is not None:
+            credential = self.credential_key(nsid)
+            if credential is not None:
+                limits.append((('credential', credential), self.max_per_credential))
+        return limits
+
+
+    @staticmethod
+    def _timed_call(call, implementor):
+        start = time.perf_counter()
+        try:
+            return call(implementor), None, time.perf_counter() - start
+        except Exception as err:
+            return None, err, time.perf_counter() - start
+
+
+    def _run(self, implementors, call):
+        log = LoggerAdapter(logger, {'name_ext' : 'FanoutExecutor._run'})
+        log.debug(f"Entering: {len(implementors)} calls")
+
+        pending = collections.deque((nsid, imp, self._limits(nsid)) for nsid,imp in implementors)
+        in_use = collections.Counter()      #- limit key -> calls running
+        running = dict()    #- future -> (nsid, limits, deadline)
+        #- timed out calls still holding on to their pool threads
+        abandoned = set()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers,\
+            thread_name_prefix='cush-fanout')
+
+        def release(limits):
+            for key, _ in limits:
+                in_use[key] -= 1
+
+        try:
+            while pending or running:
+                #- start the waiting calls the limits allow, in order
+                blocked = collections.deque()
+                abandoned = {x for x in abandoned if not x.done()}
+                while pending and len(running) + len(abandoned) < self.max_workers:
+                    nsid, implementor, limits = pending.popleft()
+                    if any(in_use[key] >= limit for key, limit in limits):
+                        blocked.append((nsid, implementor, limits))
+                        continue
+                    for key, _ in limits:
+                        in_use[key] += 1
+                    deadline = None if self.timeout is None else time.monotonic() + self.timeout
+                    future = executor.submit(self._timed_call, call, implementor)
+                    running[future] = (nsid, limits, deadline)
+                blocked.extend(pending)
+                pending = blocked
+
+                deadlines = [x[2] for x in running.values() if x[2] is not None]
+                wait_time = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+                #- an abandoned call finishing frees a thread for a waiting call
+                done, _ = wait(set(running) | abandoned, timeout=wait_time,\
+                    return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    if future in abandoned:
+                        continue
+                    nsid, limits, _ = running.pop(future)
+                    release(limits)
+                    value, error, elapsed = future.result()
+                    if error is not None:
+                        log.warning(f"{nsid}: {error!r}")
+                    yield FanoutResult(nsid, value, error, elapsed)
+
+                now = time.monotonic()
+                for future, (nsid, limits, deadline) in list(running.items()):
+                    if deadline is not None and now >= deadline:
+                        #- give up on it; it keeps its worker thread until it returns, and
+                        #- no other call is started on that thread until then
+                        del running[future]
+                        if not future.cancel():
+                            abandoned.add(future)
+                        release(limits)
+                        log.warning(f"{nsid}: timed out after {self.timeout}s")
+                        error = TimeoutError(f"{nsid}: no result after {self.timeout}s")
+                        yield FanoutResult(nsid, error=error, elapsed=self.timeout,
+                            timed_out=True)
+        finally:
+            #- also reached when the caller stops reading results early
+            executor.shutdown(wait=False, cancel_futures=True)
+        log.debug("Exiting")
+
+
+
+def fanout(nsid, method, *args, app_name='default', **kwargs):
+    """
+    Description:
+        call method on every active implementor below nsid with the default limits
+
+    Output:
+        generator of FanoutResult, in the order the calls finish
+    """
+    from cush import get_cush
+    return get_cush(app_name).fanout(nsid, method, *args, **kwargs)
@@ -2,6 +2,8 @@ from logging import getLogger, LoggerAdapter
 logger = getLogger(__name__)
 import boto3
 from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+from cush.implementorlib.lazy import LazyImplementor
+from cush.implementor.default.boto3.aws.plan import session_uses_service
 
 
 
@@ -17,9 +19,13 @@ class AwsEc2ClientProvisioner(ImplementorProvisioner):
         ec2_clients = list()
         session_imps = self.lookup_implementor(sessions)
         for session_x in session_imps:
-            ec2_c = session_x.client('ec2')
+            if not session_uses_service(session_x, 'ec2'):
+                continue
+            #- built on first use; nsid comes from the session's region and credential
+            ec2_c = LazyImplementor(session_x.client, 'ec2',
+                    metadata={'meta.region_name' : session_x.region_name},
+                    attrs={'_cush_credential_nsid' : session_x._cush_credential_nsid})
             if ec2_c:
-                ec2_c._cush_credential_nsid = session_x._cush_credential_nsid
                 ec2_clients.append(ec2_c)
                 fs = self.make_flipswitch(ec2_c)
                 session_fs = self.get_flipswitch_from_implementor(sessions, session_x)
@@ -2,6 +2,8 @@ import boto3
 from logging import getLogger, LoggerAdapter
 logger = getLogger(__name__)
 from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+from cush.implementorlib.lazy import LazyImplementor
+from cush.implementor.default.boto3.aws.plan import session_uses_service
 
 
 
@@ -21,9 +23,13 @@ class AwsEc2ResourceProvisioner(ImplementorProvisioner):
 
         ec2_resources = list()
         for session_x in self.lookup_implementor(sessions):
-            ec2_r = session_x.resource('ec2')
+            if not session_uses_service(session_x, 'ec2'):
+                continue
+            #- built on first use; nsid comes from the session's region and credential
+            ec2_r = LazyImplementor(session_x.resource, 'ec2',
+                    metadata={'meta.client.meta.region_name' : session_x.region_name},
+                    attrs={'_cush_credential_nsid' : session_x._cush_credential_nsid})
             if ec2_r:
-                ec2_r._cush_credential_nsid = session_x._cush_credential_nsid
                 ec2_resources.append(ec2_r)
 
                 fs = self.make_flipswitch(ec2_r)
@@ -0,0 +1,147 @@
+"""
+which credential x region pairs (and which services in each) get boto3 sessions
+
+Every credential or role in the user namespace can limit the regions and services it
+is used for:
+
+    aws:
+        prod:
+            access_key_id: ...
+            secret_access_key: ...
+            regions: [us-east-1, eu-west-*]
+            services: [ec2]
+
+Credentials without `regions` use every region; without `services` every service.
+Region entries are fnmatch patterns.
+"""
+from logging import getLogger, LoggerAdapter
+logger = getLogger(__name__)
+
+import collections
+import fnmatch
+
+
+
+class SessionPlanEntry(collections.namedtuple('SessionPlanEntry',\
+    ['credential_nsid', 'region', 'services'])):
+    """
+    Description:
+        one session to provision.
+        services is a tuple of service names, or None for all services
+    """
+    __slots__ = ()
+
+    def allows(self, service):
+        return self.services is None or service in self.services
+
+
+
+class AwsSessionPlan(object):
+    """
+    Description:
+        The list of sessions AwsSessionProvisioner will build, computed from the user
+        namespace and the region implementors before anything is constructed.
+    """
+    def __init__(self, entries, credentials=None):
+        """
+        Input:
+            entries: iterable of SessionPlanEntry
+            credentials: optional dict of credential nsid -> credential object used to
+                build the sessions
+        """
+        self.entries = list(entries)
+        self.credentials = dict() if credentials is None else credentials
+
+
+    @classmethod
+    def from_inputs(cls, credentials, regions):
+        """
+        Description:
+            make the plan for a set of credentials and regions
+
+        Input:
+            credentials: iterable of user namespace leaf nodes
+            regions: iterable of region names (or objects whose str() is one)
+
+        Output:
+            AwsSessionPlan
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'AwsSessionPlan.from_inputs'})
+        regions = [str(x) for x in regions]
+        entries = list()
+        credentials_by_nsid = dict()
+
+        for cred_x in credentials:
+            cred_nsid = str(cred_x.nsid)
+            credentials_by_nsid[cred_nsid] = cred_x
+
+            region_patterns = cls._get_config_list(cred_x, 'regions')
+            services = cls._get_config_list(cred_x, 'services')
+            if region_patterns is None:
+                cred_regions = regions
+            else:
+                cred_regions = [r for r in regions\
+                    if any(fnmatch.fnmatchcase(r, p) for p in region_patterns)]
+            log.debug(f"{cred_nsid}: regions={cred_regions} services={services}")
+
+            for region in cred_regions:
+                entries.append(SessionPlanEntry(cred_nsid, region,\
+                    None if services is None else tuple(services)))
+
+        return cls(entries, credentials_by_nsid)
+
+
+    @staticmethod
+    def _get_config_list(cred, name):
+        """
+        Description:
+            read an optional list setting from a credential; a single string is a list
+            of one
+        """
+        try:
+            value = getattr(cred, name)
+        except AttributeError:
+            return None
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return [value]
+        return [str(x) for x in value]
+
+
+    def __iter__(self):
+        return iter(self.entries)
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def regions_for(self, credential_nsid):
+        return [x.region for x in self.entries if x.credential_nsid == str(credential_nsid)]
+
+
+    def as_data(self):
+        """
+        Description:
+            the plan as plain python data, eg. for printing or dumping to YAML / JSON
+        """
+        return [dict(credential=x.credential_nsid, region=x.region,\
+            services=None if x.services is None else list(x.services))\
+            for x in self.entries]
+
+
+    def __repr__(self):
+        return "{}({} sessions, {} credentials)".format(self.__class__.__name__,
+            len(self.entries), len(set(x.credential_nsid for x in self.entries)))
+
+
+
+def session_uses_service(session, service):
+    """
+    Description:
+        True if a provisioned session was planned to be used for service.
+        Sessions not made from a plan are used for everything.
+    """
+    services = getattr(session, '_cush_services', None)
+    return services is None or service in services
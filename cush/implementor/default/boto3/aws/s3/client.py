@@ -2,6 +2,8 @@ from logging import getLogger, LoggerAdapter
 logger = getLogger(__name__)
 import boto3
 from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+from cush.implementorlib.lazy import LazyImplementor
+from cush.implementor.default.boto3.aws.plan import session_uses_service
 
 
 class AwsS3ClientProvisioner(ImplementorProvisioner):
@@ -16,9 +18,13 @@ class AwsS3ClientProvisioner(ImplementorProvisioner):
         s3_clients = list()
         session_imps = self.lookup_implementor(sessions)
         for session_x in session_imps:
-            s3_c = session_x.client('s3')
+            if not session_uses_service(session_x, 's3'):
+                continue
+            #- built on first use; nsid comes from the session's region and credential
+            s3_c = LazyImplementor(session_x.client, 's3',
+                    metadata={'meta.region_name' : session_x.region_name},
+                    attrs={'_cush_credential_nsid' : session_x._cush_credential_nsid})
             if s3_c:
-                s3_c._cush_credential_nsid = session_x._cush_credential_nsid
                 s3_clients.append(s3_c)
                 fs = self.make_flipswitch(s3_c)
                 session_fs = self.get_flipswitch_from_implementor(sessions, session_x)
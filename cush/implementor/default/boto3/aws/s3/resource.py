@@ -2,6 +2,8 @@ from logging import getLogger, LoggerAdapter
 logger = getLogger(__name__)
 import boto3
 from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+from cush.implementorlib.lazy import LazyImplementor
+from cush.implementor.default.boto3.aws.plan import session_uses_service
 
 
 class AwsS3ResourceProvisioner(ImplementorProvisioner):
@@ -21,9 +23,13 @@ class AwsS3ResourceProvisioner(ImplementorProvisioner):
         s3_resources = list()
         session_imps = self.lookup_implementor(sessions)
         for session_x in session_imps:
-            s3_r = session_x.resource('s3')
+            if not session_uses_service(session_x, 's3'):
+                continue
+            #- built on first use; nsid comes from the session's region and credential
+            s3_r = LazyImplementor(session_x.resource, 's3',
+                    metadata={'meta.client.meta.region_name' : session_x.region_name},
+                    attrs={'_cush_credential_nsid' : session_x._cush_credential_nsid})
             if s3_r:
-                s3_r._cush_credential_nsid = session_x._cush_credential_nsid
                 s3_resources.append(s3_r)
                 fs = self.make_flipswitch(s3_r)
                 session_fs = self.get_flipswitch_from_implementor(sessions, session_x)
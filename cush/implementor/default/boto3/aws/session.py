@@ -2,6 +2,8 @@ import boto3
 from logging import getLogger, LoggerAdapter
 logger = getLogger(__name__)
 from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+from cush.implementor.default.boto3.aws.sharedcomponents import get_shared_components
+from cush.implementor.default.boto3.aws.plan import AwsSessionPlan
 
 class AwsSessionProvisioner(ImplementorProvisioner):
     def __init__(self, root_nsid='.boto3.aws.session', priority=10):
@@ -16,6 +18,21 @@ class AwsSessionProvisioner(ImplementorProvisioner):
 
 
 
+    def plan(self, credentials='aws', regions='boto3.aws.ec2.regions'):
+        """
+        Description:
+            work out which sessions make_implementors() builds for these inputs, without
+            building any of them
+
+        Output:
+            AwsSessionPlan
+        """
+        creds = self.lookup_user(credentials)
+        region_imps = self.lookup_implementor(regions)
+        return AwsSessionPlan.from_inputs(creds, region_imps)
+
+
+
     def make_implementors(self, credentials='aws', regions='boto3.aws.ec2.regions'):
         log = LoggerAdapter(logger, dict(name_ext='make_implementors'))
         log.info('provisioning boto3 session implementors')
@@ -30,28 +47,44 @@ class AwsSessionProvisioner(ImplementorProvisioner):
         region_imps = list(self.lookup_implementor(regions))
         log.info(f"lookup_implementor returned these region implementors: {region_imps}")
 
-        #- create the implementors for each user credential
-        for cred_x in creds:
-            log.debug(f"using credential: {cred_x}")
+        #- only the credential x region pairs the user config allows
+        plan = AwsSessionPlan.from_inputs(creds, region_imps)
+        log.info(f"session plan: {plan}")
+        region_imps_by_name = {str(x) : x for x in region_imps}
+
+        #- all sessions share one botocore data loader / service model cache
+        components = get_shared_components()
+
+        for entry in plan:
+            cred_x = plan.credentials[entry.credential_nsid]
+            region_x = region_imps_by_name[entry.region]
+            log.debug(f"using credential: {cred_x} in region: {entry.region}")
 
-            #- create implementors for each region
-            for region_x in region_imps:
-                session = boto3.session.Session(aws_access_key_id=cred_x.access_key_id,
+            get_refreshable_credentials = getattr(cred_x, 'get_refreshable_credentials', None)
+            if get_refreshable_credentials is not None:
+                #- role: credentials refreshed in place for all its sessions and clients
+                session = components.make_session(
+                        credentials=get_refreshable_credentials(),
+                        region_name = entry.region)
+            else:
+                session = components.make_session(aws_access_key_id=cred_x.access_key_id,
                         aws_secret_access_key=cred_x.secret_access_key,
-                        region_name = str(region_x))
+                        region_name = entry.region)
 
-                if session:
-                    #- keep name of user credentials used to create
-                    #- used to further namespace the implementors based on user
-                    session._cush_credential_nsid = str(cred_x.nsid)
+            if session:
+                #- keep name of user credentials used to create
+                #- used to further namespace the implementors based on user
+                session._cush_credential_nsid = entry.credential_nsid
+                #- which services the client / resource provisioners make for this session
+                session._cush_services = entry.services
 
-                    #- control sessions with both users and regions
-                    region_fs = self.get_flipswitch_from_implementor(regions, region_x)
-                    user_fs = self.get_flipswitch_from_user(credentials, cred_x)
-                    session_fs = self.make_flipswitch(session)
-                    self.link_flipswitches(region_fs, session_fs)
-                    self.link_flipswitches(user_fs, session_fs)
+                #- control sessions with both users and regions
+                region_fs = self.get_flipswitch_from_implementor(regions, region_x)
+                user_fs = self.get_flipswitch_from_user(credentials, cred_x)
+                session_fs = self.make_flipswitch(session)
+                self.link_flipswitches(region_fs, session_fs)
+                self.link_flipswitches(user_fs, session_fs)
 
-                    all_sessions.append(session)
+                all_sessions.append(session)
 
         return all_sessions
@@ -0,0 +1,109 @@
+"""
+botocore components that can be shared by every boto3 session cush provisions.
+
+Each boto3.session.Session normally gets its own botocore session with its own data
+loader, so the service model JSON (ec2 alone is several MB) is searched for, parsed
+and kept in memory again for every session. The components shared here are either
+caches over the bundled botocore / boto3 data or stateless once built; credentials,
+region, config and event handlers stay per-session.
+"""
+from logging import getLogger, LoggerAdapter
+logger = getLogger(__name__)
+
+import threading
+
+import boto3
+import botocore.session
+
+
+
+class UniqueSearchPaths(list):
+    """
+    Description:
+        loader search path list that ignores paths it already has.
+
+        boto3.session.Session appends its own data directory to the loader's search
+        paths every time a session is created, which would grow the list of a shared
+        loader by one entry per session.
+    """
+    def append(self, path):
+        if path not in self:
+            super().append(path)
+
+
+
+class SharedBotocoreComponents(object):
+    """
+    Description:
+        One data loader, endpoint resolver, exceptions factory and default config
+        resolver, used for every session made with make_session()
+    """
+    #- internal botocore session components that only depend on the bundled data
+    shared_internal_components = [
+        'endpoint_resolver',
+        'exceptions_factory',
+        'default_config_resolver',
+    ]
+
+    def __init__(self):
+        log = LoggerAdapter(logger, {'name_ext' : 'SharedBotocoreComponents.__init__'})
+        log.debug("Entering")
+        template = botocore.session.get_session()
+        self.loader = template.get_component('data_loader')
+        self.loader._search_paths = UniqueSearchPaths(self.loader.search_paths)
+
+        self.internal_components = dict()
+        for name in self.shared_internal_components:
+            self.internal_components[name] = template._get_internal_component(name)
+        log.debug("Exiting")
+
+
+    def make_botocore_session(self):
+        """
+        Description:
+            new botocore session that uses the shared components
+        """
+        session = botocore.session.Session()
+        session.register_component('data_loader', self.loader)
+        for name, component in self.internal_components.items():
+            session._register_internal_component(name, component)
+        return session
+
+
+    def make_session(self, credentials=None, **kwargs):
+        """
+        Description:
+            new boto3 session that uses the shared components
+
+        Input:
+            credentials: botocore credentials object for the session to use, eg.
+                RefreshableCredentials shared with other sessions; instead of keys in
+                kwargs
+            kwargs: passed to boto3.session.Session (credentials, region_name, ...)
+
+        Output:
+            boto3.session.Session
+        """
+        botocore_session = self.make_botocore_session()
+        if credentials is not None:
+            #- the clients made from the session sign with this object, so its
+            #- refreshes reach all of them
+            botocore_session._credentials = credentials
+        return boto3.session.Session(botocore_session=botocore_session, **kwargs)
+
+
+
+_shared_components = None
+_shared_components_lock = threading.Lock()
+
+def get_shared_components():
+    """
+    Description:
+        get the process-wide SharedBotocoreComponents, creating it on first use
+    """
+    global _shared_components
+    if _shared_components is None:
+        with _shared_components_lock:
+            if _shared_components is None:
+                _shared_components = SharedBotocoreComponents()
+    return _shared_components
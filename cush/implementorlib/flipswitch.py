@@ -2,8 +2,843 @@ from logging import getLogger, LoggerAdapter
 logger = getLogger(__name__)
 
 import collections
+import fnmatch
+import itertools
+import re
+import threading
 from typing import Union
 from thewired import Namespace, NamespaceNodeBase, Nsid
+from thewired.exceptions import NamespaceLookupError
+
+
+
+class FlipswitchCycleError(ValueError):
+    """
+    Description:
+        raised when linking two flipswitches would make a flipswitch control itself
+    """
+    def __init__(self, cycle):
+        self.cycle = list(cycle)
+        super().__init__("flipswitch cycle: {}".format(' -> '.join(map(str, self.cycle))))
+
+
+
+class FlipswitchGraph(object):
+    """
+    Description:
+        The links between the flipswitches of a namespace.
+
+        Children are declared by NSID, as they may not exist yet when they are linked.
+        Each flipswitch's children are resolved to the flipswitch objects once and
+        kept until the graph changes (a flipswitch is added or removed, or a link is
+        made). A state change is propagated with one breadth-first walk that visits
+        every flipswitch below the one changed once, however many paths lead to it.
+    """
+    #- id(namespace) -> (namespace, graph) for flipswitches made without a graph
+    _graphs = dict()
+    _graphs_lock = threading.Lock()
+
+    def __init__(self, namespace=None):
+        """
+        Input:
+            namespace: namespace to look up children in that were not made as part of
+                this graph (by '.flipswitch' + child nsid)
+        """
+        self._ns = namespace
+        self._nodes = dict()        #- nsid -> Flipswitch
+        self._resolved = dict()     #- nsid -> tuple of child Flipswitches
+        self._active_states = dict()    #- nsid -> True if on
+        self._lock = threading.RLock()
+        #- incremented on every change to the graph
+        self.version = 0
+
+
+    @classmethod
+    def for_namespace(cls, namespace):
+        """
+        Description:
+            get the graph shared by the flipswitches of namespace, creating it if needed
+        """
+        with cls._graphs_lock:
+            try:
+                return cls._graphs[id(namespace)][1]
+            except KeyError:
+                graph = cls(namespace)
+                #- keep a reference to the namespace so its id is not reused
+                cls._graphs[id(namespace)] = (namespace, graph)
+                return graph
+
+
+    def _changed(self):
+        self.version += 1
+        self._resolved.clear()
+
+
+    def register(self, flipswitch):
+        with self._lock:
+            self._nodes[str(flipswitch.nsid)] = flipswitch
+            self._changed()
+
+
+    def unregister(self, flipswitch):
+        with self._lock:
+            if self._nodes.get(str(flipswitch.nsid)) is flipswitch:
+                del self._nodes[str(flipswitch.nsid)]
+            self._changed()
+
+
+    def get_active(self, flipswitch):
+        return self._active_states.get(str(flipswitch.nsid))
+
+
+    def set_active(self, flipswitch, active):
+        self._active_states[str(flipswitch.nsid)] = active
+
+
+    def get_state(self, nsid):
+        """
+        Description:
+            state of the flipswitch at nsid
+
+        Output:
+            "on", "off" or None if the graph does not know nsid
+        """
+        active = self._active_states.get(str(nsid))
+        if active is None:
+            return None
+        return "on" if active else "off"
+
+
+    def get(self, nsid):
+        """
+        Description:
+            get the flipswitch with this nsid
+
+        Output:
+            Flipswitch, or None if there is none
+        """
+        flipswitch = self._nodes.get(str(nsid))
+        if flipswitch is None and self._ns is not None:
+            try:
+                flipswitch = self._ns.lookup('.flipswitch' + str(nsid))
+            except NamespaceLookupError:
+                return None
+        return flipswitch
+
+
+    def children(self, flipswitch):
+        """
+        Description:
+            the resolved child flipswitches of a flipswitch. Children that do not exist
+            (yet) are left out.
+        """
+        key = str(flipswitch.nsid)
+        try:
+            return self._resolved[key]
+        except KeyError:
+            pass
+
+        log = LoggerAdapter(logger, {'name_ext' : 'FlipswitchGraph.children'})
+        with self._lock:
+            children = list()
+            for child in flipswitch.children:
+                if not isinstance(child, str):
+                    children.append(child)
+                    continue
+                child_fs = self.get(child)
+                if child_fs is None:
+                    log.debug(f"{key}: no flipswitch for child {child}")
+                else:
+                    children.append(child_fs)
+            resolved = tuple(children)
+            self._resolved[key] = resolved
+        return resolved
+
+
+    def descendants(self, flipswitch):
+        """
+        Description:
+            every flipswitch below flipswitch, each once, in breadth-first order
+        """
+        seen = {id(flipswitch)}
+        queue = collections.deque([flipswitch])
+        descendants = list()
+        while queue:
+            for child in self.children(queue.popleft()):
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    descendants.append(child)
+                    queue.append(child)
+        return descendants
+
+
+    def find_path(self, start, end):
+        """
+        Description:
+            path of flipswitches from start to end following child links
+
+        Output:
+            list of flipswitches from start to end, or None if end is not below start
+        """
+        parents = {id(start) : None}
+        queue = collections.deque([start])
+        while queue:
+            node = queue.popleft()
+            if node is end:
+                path = list()
+                while node is not None:
+                    path.append(node)
+                    node = parents[id(node)]
+                return list(reversed(path))
+            for child in self.children(node):
+                if id(child) not in parents:
+                    parents[id(child)] = node
+                    queue.append(child)
+        return None
+
+
+    def link(self, parent, children):
+        """
+        Description:
+            make children controlled by parent
+
+        Input:
+            parent: Flipswitch
+            children: list of Flipswitches or flipswitch nsids
+
+        Output:
+            None; raises FlipswitchCycleError if parent is below one of the children
+        """
+        with self._lock:
+            child_nsids = list()
+            for child in children:
+                child_fs = child if not isinstance(child, str) else self.get(child)
+                if child_fs is not None:
+                    path = self.find_path(child_fs, parent)
+                    if path is not None:
+                        raise FlipswitchCycleError([x.nsid for x in [parent] + path])
+                child_nsids.append(child if isinstance(child, str) else child.nsid)
+
+            for child_nsid in child_nsids:
+                if child_nsid not in parent.children:
+                    parent.children.append(child_nsid)
+            self._changed()
+
+
+    def propagate(self, flipswitch):
+        """
+        Description:
+            set the state of every flipswitch below flipswitch to its state
+        """
+        state = flipswitch._state
+        for child in self.descendants(flipswitch):
+            child._state = state
+
+
+
+class FlipswitchTable(FlipswitchGraph):
+    """
+    Description:
+        FlipswitchGraph that keeps the states of its flipswitches in one bytearray.
+
+        Every flipswitch nsid is interned to an int id, its index in the state array
+        and in the list of child links. Flipswitch nodes made with the table read and
+        write their state there, and flipswitches that are only needed for their state
+        can live in the table without a namespace node at all (see view()).
+
+        Ids are never reused; the slot of a flipswitch that is removed is left in place.
+
+        is_active() answers whether a flipswitch and everything controlling it is on.
+        Answers are cached until the epoch changes, which it does on every state
+        change and every change to the graph.
+    """
+    def __init__(self, namespace=None):
+        super().__init__(namespace)
+        self._ids = dict()          #- nsid -> id
+        self._nsids = list()        #- id -> nsid
+        self._states = bytearray()  #- id -> 1 if on, 0 if off
+        self._child_refs = list()   #- id -> list of child nsids; None until it has any
+        self._child_ids = dict()    #- id -> tuple of resolved child ids
+        self._parent_ids = None     #- id -> list of parent ids; built on first use
+        #- incremented after every change to a state or to the graph
+        self.epoch = 0
+        self._active_cache = dict()     #- nsid -> is_active() answer for _active_epoch
+        self._active_epoch = 0
+        #- called with the list of nsids turned on by each state change
+        self._on_listeners = list()
+        #- called with the list of (nsid, state) changed by each state change
+        self._change_listeners = list()
+
+
+    def __len__(self):
+        return len(self._nsids)
+
+
+    def __contains__(self, nsid):
+        return str(nsid) in self._ids
+
+
+    def _changed(self):
+        super()._changed()
+        self._child_ids.clear()
+        self._parent_ids = None
+        self.epoch += 1
+
+
+    def intern(self, nsid, state='on'):
+        """
+        Description:
+            get the id of nsid, adding it to the table with state if it is new
+        """
+        nsid = str(nsid)
+        try:
+            return self._ids[nsid]
+        except KeyError:
+            pass
+
+        with self._lock:
+            if nsid not in self._ids:
+                self._ids[nsid] = len(self._nsids)
+                self._nsids.append(nsid)
+                self._states.append(1 if to_active(state) else 0)
+                self._child_refs.append(None)
+                #- links to this nsid made before it existed resolve now
+                self._changed()
+            return self._ids[nsid]
+
+
+    def register(self, flipswitch):
+        with self._lock:
+            table_id = self.intern(flipswitch.nsid)
+            refs = self._get_child_refs(table_id)
+            for child in flipswitch.children:
+                if child not in refs:
+                    refs.append(child)
+            #- the node's children list is the table's, so links made through
+            #- either one are seen by both
+            flipswitch.children = refs
+            flipswitch._table_id = table_id
+            super().register(flipswitch)
+
+
+    def _get_child_refs(self, table_id):
+        refs = self._child_refs[table_id]
+        if refs is None:
+            with self._lock:
+                refs = self._child_refs[table_id]
+                if refs is None:
+                    refs = self._child_refs[table_id] = list()
+        return refs
+
+
+    def unregister(self, flipswitch):
+        with self._lock:
+            table_id = self._ids.get(str(flipswitch.nsid))
+            if table_id is not None and self._nodes.get(str(flipswitch.nsid)) is flipswitch:
+                self._child_refs[table_id] = None
+            super().unregister(flipswitch)
+
+
+    def get_active(self, flipswitch):
+        return self._states[flipswitch._table_id] == 1
+
+
+    def set_active(self, flipswitch, active):
+        table_id = flipswitch._table_id
+        with self._lock:
+            was_active = self._states[table_id] == 1
+            self._states[table_id] = 1 if active else 0
+            self.epoch += 1
+        if active != was_active:
+            self._notify([table_id], active)
+
+
+    def add_on_listener(self, listener):
+        """
+        Description:
+            call listener(nsids) with the nsids of the flipswitches that were off and
+            have just been turned on, after every change that turns any on
+        """
+        self._on_listeners.append(listener)
+
+
+    def add_change_listener(self, listener):
+        """
+        Description:
+            call listener(changes) with the list of (nsid, "on"/"off") of the
+            flipswitches whose state just changed, including the ones changed by
+            propagation, after every change. Not called by restore().
+        """
+        self._change_listeners.append(listener)
+
+
+    def _notify(self, table_ids, active):
+        """
+        Description:
+            tell the listeners that the flipswitches with table_ids changed to active.
+            Called after the table lock is released: listeners may take other locks,
+            like the namespace lock, that are taken before the table lock elsewhere.
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'FlipswitchTable._notify'})
+        if not table_ids:
+            return
+        listeners = list(self._change_listeners)
+        if listeners:
+            state = "on" if active else "off"
+            changes = [(self._nsids[x], state) for x in table_ids]
+            for listener in listeners:
+                try:
+                    listener(changes)
+                except Exception as err:
+                    log.error(f"flipswitch listener {listener} failed: {err!r}")
+
+        if active and self._on_listeners:
+            nsids = [self._nsids[x] for x in table_ids]
+            for listener in list(self._on_listeners):
+                try:
+                    listener(nsids)
+                except Exception as err:
+                    log.error(f"flipswitch listener {listener} failed: {err!r}")
+
+
+    def restore(self, batches, prefix=''):
+        """
+        Description:
+            set the states of many flipswitches at once, whether or not they have been
+            made yet. Nothing is propagated and no listeners are called; a flipswitch
+            made later at one of these nsids starts out in the restored state.
+
+        Input:
+            batches: iterable of (state, list of nsids), applied in order
+            prefix: prepended to every nsid
+
+        Output:
+            number of states restored
+        """
+        count = 0
+        with self._lock:
+            ids = self._ids
+            for state, nsids in batches:
+                value = 1 if to_active(state) else 0
+                if prefix:
+                    nsids = [prefix + x for x in nsids]
+                #- the ones new to the table are added with a few list operations
+                new_nsids = [x for x in nsids if x not in ids]
+                first_id = len(self._nsids)
+                ids.update(zip(new_nsids, range(first_id, first_id + len(new_nsids))))
+                self._nsids.extend(new_nsids)
+                self._states.extend(bytes([value]) * len(new_nsids))
+                self._child_refs.extend(itertools.repeat(None, len(new_nsids)))
+                if len(new_nsids) != len(nsids):
+                    new_nsids = set(new_nsids)
+                    for nsid in nsids:
+                        if nsid not in new_nsids:
+                            self._states[ids[nsid]] = value
+                count += len(nsids)
+            self._changed()
+        return count
+
+
+    def view(self, nsid, state='on'):
+        """
+        Description:
+            get the flipswitch at nsid, adding it to the table if needed
+
+        Input:
+            nsid: flipswitch nsid
+            state: state of the flipswitch if it is new
+
+        Output:
+            the Flipswitch node if one was made for nsid, otherwise a FlipswitchView
+        """
+        return self._get_node(self.intern(nsid, state))
+
+
+    def get(self, nsid):
+        table_id = self._ids.get(str(nsid))
+        if table_id is None:
+            return super().get(nsid)
+        return self._get_node(table_id)
+
+
+    def _get_node(self, table_id):
+        flipswitch = self._nodes.get(self._nsids[table_id])
+        if flipswitch is None:
+            return FlipswitchView(self, table_id)
+        return flipswitch
+
+
+    def _get_id(self, flipswitch):
+        try:
+            return flipswitch._table_id
+        except AttributeError:
+            return self._ids[str(flipswitch.nsid)]
+
+
+    def get_state(self, nsid):
+        """
+        Description:
+            state of the flipswitch at nsid
+
+        Output:
+            "on", "off" or None if nsid is not in the table
+        """
+        table_id = self._ids.get(str(nsid))
+        if table_id is None:
+            return None
+        return "on" if self._states[table_id] else "off"
+
+
+    def set_state(self, nsid, state):
+        """
+        Description:
+            set the state of the flipswitch at nsid and of every flipswitch below it
+        """
+        active = to_active(state)
+        with self._lock:
+            table_id = self.intern(nsid, active)
+            changed = self._assign([table_id] + self._descendant_ids([table_id]), active)
+        self._notify(changed, active)
+
+
+    def _resolve_ids(self, table_id):
+        """
+        Description:
+            ids of the children of the flipswitch with this id; children that do not
+            exist (yet) are left out
+        """
+        try:
+            return self._child_ids[table_id]
+        except KeyError:
+            pass
+
+        log = LoggerAdapter(logger, {'name_ext' : 'FlipswitchTable._resolve_ids'})
+        with self._lock:
+            child_ids = list()
+            for child in self._child_refs[table_id] or ():
+                child_nsid = str(child if isinstance(child, str) else child.nsid)
+                child_id = self._ids.get(child_nsid)
+                if child_id is None:
+                    child_fs = self.get(child_nsid)
+                    if child_fs is None or getattr(child_fs, '_graph', None) is not self:
+                        log.debug(f"{self._nsids[table_id]}: no flipswitch for child {child}")
+                        continue
+                    child_id = self._get_id(child_fs)
+                child_ids.append(child_id)
+            resolved = tuple(child_ids)
+            self._child_ids[table_id] = resolved
+        return resolved
+
+
+    def _descendant_ids(self, table_ids):
+        """
+        Description:
+            ids of every flipswitch below the ones with table_ids, each once, in
+            breadth-first order
+        """
+        seen = set(table_ids)
+        queue = collections.deque(table_ids)
+        descendants = list()
+        while queue:
+            for child_id in self._resolve_ids(queue.popleft()):
+                if child_id not in seen:
+                    seen.add(child_id)
+                    descendants.append(child_id)
+                    queue.append(child_id)
+        return descendants
+
+
+    def _assign(self, table_ids, active):
+        """
+        Description:
+            set the state of every id in table_ids. Runs of consecutive ids (the
+            flipswitches of one subtree are usually made together) are set with one
+            slice assignment each. Call with the table lock held.
+
+        Output:
+            the ids whose state changed, to pass to _notify() once the lock is released
+        """
+        value = 1 if active else 0
+        table_ids = sorted(set(table_ids))
+        changed = [x for x in table_ids if self._states[x] != value]
+        start = 0
+        for n in range(1, len(table_ids) + 1):
+            if n == len(table_ids) or table_ids[n] != table_ids[n-1] + 1:
+                first, last = table_ids[start], table_ids[n-1]
+                self._states[first:last+1] = bytes([value]) * (last - first + 1)
+                start = n
+        self.epoch += 1
+        return changed
+
+
+    def _get_parent_ids(self):
+        parent_ids = self._parent_ids
+        if parent_ids is None:
+            with self._lock:
+                parent_ids = collections.defaultdict(list)
+                for table_id in range(len(self._nsids)):
+                    for child_id in self._resolve_ids(table_id):
+                        parent_ids[child_id].append(table_id)
+                self._parent_ids = parent_ids
+        return parent_ids
+
+
+    def _is_active(self, table_id):
+        """
+        Description:
+            True if the flipswitch with this id and every flipswitch above it are on
+        """
+        if not self._states[table_id]:
+            return False
+        parent_ids = self._get_parent_ids()
+        seen = {table_id}
+        queue = collections.deque([table_id])
+        while queue:
+            for parent_id in parent_ids.get(queue.popleft(), ()):
+                if parent_id not in seen:
+                    if not self._states[parent_id]:
+                        return False
+                    seen.add(parent_id)
+                    queue.append(parent_id)
+        return True
+
+
+    def is_active(self, nsid):
+        """
+        Description:
+            effective state of the flipswitch at nsid: on only if it and every
+            flipswitch controlling it, directly or through others, are on. A state
+            set on a parent is pushed down to its children, but a later change to
+            one parent can turn a child back on while another parent is still off;
+            this is what tells the two apart.
+
+        Input:
+            nsid: flipswitch nsid
+
+        Output:
+            True if active; also True for an nsid without a flipswitch, as nothing
+            turns it off
+        """
+        epoch = self.epoch
+        cache = self._active_cache
+        if self._active_epoch != epoch:
+            cache = self._active_cache = dict()
+            self._active_epoch = epoch
+        try:
+            return cache[nsid]
+        except KeyError:
+            pass
+
+        table_id = self._ids.get(str(nsid))
+        active = True if table_id is None else self._is_active(table_id)
+        #- a change made while this was worked out started a new cache; the answer
+        #- only goes into the one it was worked out for
+        cache[nsid] = active
+        return active
+
+
+    def children(self, flipswitch):
+        return tuple(self._get_node(x) for x in self._resolve_ids(self._get_id(flipswitch)))
+
+
+    def descendants(self, flipswitch):
+        return [self._get_node(x) for x in self._descendant_ids([self._get_id(flipswitch)])]
+
+
+    def find_path(self, start, end):
+        start_id = self._get_id(start)
+        try:
+            end_id = self._get_id(end)
+        except KeyError:
+            return None
+        parents = {start_id : None}
+        queue = collections.deque([start_id])
+        while queue:
+            table_id = queue.popleft()
+            if table_id == end_id:
+                path = list()
+                while table_id is not None:
+                    path.append(self._get_node(table_id))
+                    table_id = parents[table_id]
+                return list(reversed(path))
+            for child_id in self._resolve_ids(table_id):
+                if child_id not in parents:
+                    parents[child_id] = table_id
+                    queue.append(child_id)
+        return None
+
+
+    def propagate(self, flipswitch):
+        with self._lock:
+            table_id = self._get_id(flipswitch)
+            active = self._states[table_id] == 1
+            changed = self._assign(self._descendant_ids([table_id]), active)
+        self._notify(changed, active)
+
+
+    def match(self, pattern):
+        """
+        Description:
+            nsids in the table at or below the ones matching a shell-style pattern.
+            A pattern starting with '.' can match from any level of the nsid, so it
+            works the same relative to the flipswitch namespace and to the root.
+            Characters that are not valid in an nsid are matched as '_', so
+            '.flipswitch.implementor.boto3.aws.ec2.client.eu-*' matches the
+            eu_west_1, eu_central_1, ... subtrees.
+
+        Output:
+            list of ids
+        """
+        regex = re.compile(_translate_pattern(pattern))
+        return [n for n, nsid in enumerate(self._nsids) if regex.match(nsid)]
+
+
+    def set_states(self, pattern, state):
+        """
+        Description:
+            turn every flipswitch matching pattern (see match()) on or off, along with
+            every flipswitch below them, in one update of the state array
+
+        Output:
+            number of flipswitches set
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'FlipswitchTable.set_states'})
+        active = to_active(state)
+        with self._lock:
+            table_ids = self.match(pattern)
+            table_ids.extend(self._descendant_ids(table_ids))
+            changed = self._assign(table_ids, active)
+        self._notify(changed, active)
+        log.debug(f"{pattern}: set {len(table_ids)} flipswitches {state}")
+        return len(table_ids)
+
+
+    def without_nodes(self, pattern=None):
+        """
+        Description:
+            nsids of the flipswitches in the table that have no namespace node, or the
+            ones matching pattern
+        """
+        table_ids = range(len(self._nsids)) if pattern is None else self.match(pattern)
+        return [self._nsids[x] for x in table_ids if self._nsids[x] not in self._nodes]
+
+
+    def items(self, pattern=None):
+        """
+        Description:
+            (nsid, "on"/"off") for every flipswitch in the table, or the ones matching
+            pattern
+        """
+        table_ids = range(len(self._nsids)) if pattern is None else self.match(pattern)
+        return [(self._nsids[x], "on" if self._states[x] else "off") for x in table_ids]
+
+
+
+class FlipswitchView(object):
+    """
+    Description:
+        Flipswitch interface to one entry of a FlipswitchTable that has no namespace node
+    """
+    __slots__ = ('_table', '_table_id')
+
+    def __init__(self, table, table_id):
+        self._table = table
+        self._table_id = table_id
+
+
+    @property
+    def nsid(self):
+        return self._table._nsids[self._table_id]
+
+
+    @property
+    def children(self):
+        return self._table._get_child_refs(self._table_id)
+
+
+    @property
+    def state(self):
+        return "on" if self._table._states[self._table_id] else "off"
+
+
+    @state.setter
+    def state(self, value):
+        self._table.set_state(self.nsid, value)
+
+
+    def add_child(self, child):
+        self.add_children([child])
+
+
+    def add_children(self, children):
+        self._table.link(self, [x if isinstance(x, str) else x.nsid for x in children])
+
+
+    def flip(self):
+        self.state = 'off' if self.state == 'on' else 'on'
+
+
+    def __bool__(self):
+        return self._table._states[self._table_id] == 1
+
+
+    def __eq__(self, other):
+        if isinstance(other, FlipswitchView):
+            return self._table is other._table and self._table_id == other._table_id
+        return NotImplemented
+
+
+    def __hash__(self):
+        return hash((id(self._table), self._table_id))
+
+
+    def __str__(self):
+        return "{}: <{}>".format(self.nsid, self.state)
+
+
+    def __repr__(self):
+        return "{}:{} : <{}>".format(self.__class__.__name__, self.nsid, self.state)
+
+
+
+def to_active(state):
+    """
+    Description:
+        True for the flipswitch states that mean "on", False for the ones that mean "off"
+    """
+    if isinstance(state, str):
+        state = state.lower()
+    if state in Flipswitch._active_names:
+        return True
+    if state in Flipswitch._inactive_names:
+        return False
+    return bool(state)
+
+
+
+def _translate_pattern(pattern):
+    """
+    Description:
+        regex source for a flipswitch nsid pattern that matches the nsids the pattern
+        matches and everything below them
+    """
+    chars = list()
+    in_brackets = False
+    for char in pattern:
+        if char == '[':
+            in_brackets = True
+        elif char == ']':
+            in_brackets = False
+        elif not in_brackets and not (char.isalnum() or char in '._*?'):
+            char = '_'
+        chars.append(char)
+    pattern = ''.join(chars)
+    if pattern.startswith('.'):
+        pattern = '*' + pattern
+    return '(?:{})|(?:{})'.format(fnmatch.translate(pattern), fnmatch.translate(pattern + '.*'))
+
+
+
 
 #TODO: move Flipswitch to thewired; its wiring
 class Flipswitch(NamespaceNodeBase):
@@ -28,18 +863,30 @@ class Flipswitch(NamespaceNodeBase):
          is pretty useful even w/out the rest of the configs that are possible to create the higher layer namespaces)
         
     """
-    def __init__(self, state:str='on', *, nsid:Union[str, Nsid], namespace:Namespace):
+    _active_names = ('on', 'active', True)
+    _inactive_names = ('off', 'inactive', False)
+
+    def __init__(self, state:str='on', graph:FlipswitchGraph=None, *, nsid:Union[str, Nsid],
+            namespace:Namespace):
         """
         Input:
-            state: "on" or "off"
+            state: "on" or "off"; unless graph already has a state for nsid
+            graph: FlipswitchGraph this flipswitch is part of; defaults to the one
+                shared by all the flipswitches of namespace
         """
         log = LoggerAdapter(logger, {'name_ext' : 'Flipswitch.__init__'})
         log.debug(f"entering: {nsid=} {namespace=}")
         super().__init__(nsid=nsid, namespace=namespace)
         self.children = list()    #- outputs from all implementor provisioners using this
-        self._active_names = ['on', 'active', True]
-        self._inactive_names = ['off', 'inactive', False]
-        self.state = state
+        self._graph = FlipswitchGraph.for_namespace(namespace) if graph is None else graph
+        known_state = self._graph.get_state(nsid)
+        self._graph.register(self)
+        if known_state is None:
+            self.state = state
+        else:
+            #- made again (or restored before it was made): keep the state the graph
+            #- has for it, without pushing it down to the children again
+            self._state = known_state
         log.debug("exiting")
 
     @property
@@ -72,14 +919,8 @@ class Flipswitch(NamespaceNodeBase):
             self._state = "off"
 
         #- propagate to children
-        for child in self.children:
-            if isinstance(child, str):
-                child_nsid = child
-                #- treat as NSID
-                #child = self.ns.flipswitch._lookup(child_nsid)
-                child = self._ns.lookup('.flipswitch' + child_nsid)
-            log.debug("Propagating state for child {}".format(child))
-            child.state = self.state
+        if self.children:
+            self._graph.propagate(self)
         log.debug("Exiting")
 
 
@@ -111,7 +952,21 @@ class Flipswitch(NamespaceNodeBase):
             #- TODO: use warnings.warn
             log.warning("Converting [{}] to boolean to set internal state".format(value))
             self._active = bool(value)
-        
+
+
+    @property
+    def _active(self):
+        """
+        Description:
+            True if on; kept by the flipswitch's graph
+        """
+        return self._graph.get_active(self)
+
+
+    @_active.setter
+    def _active(self, value):
+        self._graph.set_active(self, value)
+
 
     def add_child(self, child):
         """
@@ -120,19 +975,8 @@ class Flipswitch(NamespaceNodeBase):
         """
         log = LoggerAdapter(logger, {'name_ext' : 'Flipswitch.add_child'})
         log.debug("Entering")
-        if isinstance(child, str):
-            #- treat str as NSID
-            self.children.append(child)
-            log.debug("Exiting")
-            return
-        else:
-            try:
-                self.children.append(child.nsid)
-                log.debug("Exiting")
-                return
-            except AttributeError as err:
-                msg = "Can't get NSID from flipswitch child: {}".format(child)
-                raise ValueError(msg) from err
+        self.add_children([child])
+        log.debug("Exiting")
 
 
 
@@ -146,12 +990,13 @@ class Flipswitch(NamespaceNodeBase):
                 child_nsids.append(child)
             else:
                 try:
-                    child_nsids.append(child.nsid)
+                    #- Nsid objects are not strs; link() would take them for flipswitches
+                    child_nsids.append(str(child.nsid))
                 except AttributeError as err:
                     msg = "Can't get NSID for flipswitch child: {}".format(child)
                     raise ValueError(msg) from err
 
-        self.children.extend(child_nsids)
+        self._graph.link(self, child_nsids)
         log.debug("Exiting")
 
 
@@ -0,0 +1,212 @@
+"""
+persistent flipswitch states: a compacted snapshot plus an append-only journal
+
+Every change of flipswitch states is appended to the journal as one line per
+flipswitch: "<on|off><TAB><nsid>". When the journal grows past a number of lines, it
+is compacted: the snapshot and the journal are merged into a new snapshot and the
+journal is emptied. The snapshot keeps the nsids grouped by state, so that loading
+hands a FlipswitchTable a few large batches of nsids (the snapshot's, then the
+journal's) to restore, without going through the states one by one.
+
+Several cush shells can share the files. Appends are single writes to a file opened
+for appending, and compaction merges what is on disk (not what one process has in
+memory). Both hold an exclusive lock on the journal, where locking is available.
+"""
+from logging import getLogger, LoggerAdapter
+logger = getLogger(__name__)
+
+import contextlib
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    #- no advisory locks on this platform; compaction is not safe against other
+    #- processes appending at the same time
+    fcntl = None
+
+import cush.defaults as defaults
+from cush.util import filename_to_fullpath
+
+
+
+class FlipswitchJournal(object):
+    """
+    Description:
+        the saved flipswitch states of one cush application
+    """
+    #- bump when the snapshot layout changes
+    version = 1
+
+    def __init__(self, snapshot_path, journal_path,\
+            compact_after=defaults.flipswitch_compact_after):
+        """
+        Input:
+            snapshot_path: JSON file with the compacted states
+            journal_path: journal of the changes since the snapshot was written
+            compact_after: compact once the journal has this many lines; None never
+                compacts automatically
+        """
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compact_after = compact_after
+        #- lines in the journal, as far as this process knows
+        self._journal_lines = 0
+        self._lock = threading.Lock()
+
+
+    @classmethod
+    def for_app(cls, app_name='default', config_dir=defaults.config_dir, **kwargs):
+        snapshot_path = filename_to_fullpath(config_dir, f"{app_name}.{defaults.flipswitch_file}")
+        journal_path = filename_to_fullpath(config_dir,\
+            f"{app_name}.{defaults.flipswitch_journal_file}")
+        return cls(snapshot_path, journal_path, **kwargs)
+
+
+    def load(self):
+        """
+        Description:
+            the saved states, as batches to be applied in order: the snapshot, one
+            batch per state, then the runs of journal lines with the same state
+
+        Output:
+            list of (state, list of nsids)
+        """
+        with self._lock:
+            batches, lines = self._read()
+            self._journal_lines = lines
+        return batches
+
+
+    def read_states(self):
+        """
+        Description:
+            the saved states, merged
+
+        Output:
+            dict of nsid -> "on" / "off"
+        """
+        with self._lock:
+            batches, _ = self._read()
+        return self._merge(batches)
+
+
+    @staticmethod
+    def _merge(batches):
+        states = dict()
+        for state, nsids in batches:
+            states.update(dict.fromkeys(nsids, state))
+        return states
+
+
+    def _read(self):
+        log = LoggerAdapter(logger, {'name_ext' : 'FlipswitchJournal._read'})
+        batches = list()
+        try:
+            with open(self.snapshot_path, 'rt') as fp:
+                snapshot = json.load(fp)
+            if snapshot.get('version') == self.version:
+                batches.extend((state, nsids) for state, nsids in snapshot['states'].items()\
+                    if state in ('on', 'off'))
+            else:
+                log.warning(f"ignoring flipswitch snapshot with a different format: {self.snapshot_path}")
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, AttributeError) as err:
+            log.warning(f"ignoring unreadable flipswitch snapshot {self.snapshot_path}: {err}")
+
+        lines = 0
+        try:
+            with open(self.journal_path, 'rt') as fp:
+                for line in fp:
+                    lines += 1
+                    state, sep, nsid = line.rstrip('\n').partition('\t')
+                    #- a line cut short by a crash is missing its end
+                    if not (sep and nsid and state in ('on', 'off') and line.endswith('\n'))\
+                            or '\t' in nsid:
+                        continue
+                    if batches and batches[-1][0] == state:
+                        batches[-1][1].append(nsid)
+                    else:
+                        batches.append((state, [nsid]))
+        except FileNotFoundError:
+            pass
+        return batches, lines
+
+
+    def append(self, changes):
+        """
+        Description:
+            record state changes; compacts the journal when it has grown too long
+
+        Input:
+            changes: list of (nsid, "on"/"off")
+        """
+        if not changes:
+            return
+        data = ''.join(f"{state}\t{nsid}\n" for nsid, state in changes).encode()
+        with self._lock:
+            os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+            fd = os.open(self.journal_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                if fcntl is not None:
+                    #- not in the middle of another process's compaction
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                size = os.fstat(fd).st_size
+                if size and os.pread(fd, 1, size - 1) != b'\n':
+                    #- end a line cut short by a crash, or these would be appended to it;
+                    #- the tab keeps it from being read as a (truncated) nsid
+                    data = b'\t\n' + data
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+            self._journal_lines += len(changes)
+            compact = self.compact_after is not None and self._journal_lines >= self.compact_after
+        if compact:
+            self.compact()
+
+
+    def compact(self):
+        """
+        Description:
+            merge the journal into the snapshot and empty the journal
+
+        Output:
+            number of states in the new snapshot
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'FlipswitchJournal.compact'})
+        with self._lock, self._locked_journal():
+            batches, lines = self._read()
+            states = self._merge(batches)
+            by_state = {'on' : list(), 'off' : list()}
+            for nsid, state in states.items():
+                by_state[state].append(nsid)
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wt') as fp:
+                json.dump(dict(version=self.version, states=by_state), fp)
+            os.replace(tmp_path, self.snapshot_path)
+            #- only emptied once the snapshot has everything in it; a crash in between
+            #- leaves a journal that repeats what the snapshot already says
+            with open(self.journal_path, 'wb'):
+                pass
+            self._journal_lines = 0
+        log.debug(f"compacted {lines} journal lines into {len(states)} states")
+        return len(states)
+
+
+    @contextlib.contextmanager
+    def _locked_journal(self):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
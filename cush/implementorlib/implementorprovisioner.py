@@ -7,6 +7,7 @@ import collections
 import inspect
 import itertools
 import re
+import threading
 from abc import abstractmethod
 from collections.abc import Iterable
 from .load import get_implementor_app_name
@@ -18,7 +19,13 @@ from thewired.namespace.nsid import make_child_nsid, sanitize_nsid
 
 from cush import get_cush
 from cush.user import CushUser
+from cush.taskgraph import TaskGraph
+from cush.util import bulk_add_nodes
+import cush.defaults as defaults
+import cush.profiling as profiling
 from .flipswitch import Flipswitch
+from .lazy import LazyImplementor, LazyImplementorNode
+from .manifest import nsids_overlap
 
 
 class SimpleWrap(object):
@@ -52,10 +59,12 @@ class ImplementorProvisioner(object):
               implementor provisioning method
             * gives access to the implementors namespace so that users can refer to
               existing implementors
-            * sorts the provisioner subclasses by priority and creates the implementors in
-              the user-specified priority. This makes sure that provisioner methods that
+            * orders the provisioners by the implementor nsids each one declares as the
+              keyword defaults of its make_implementors method, so provisioners that
               require access to other implementors have the implementors they need already
-              created before they run.
+              created before they run. Provisioners that do not depend on each other are
+              run concurrently; the user-set priority only orders the ones that are ready
+              at the same time.
     """
 
     #- Class Level list keeps track of all subclasses' make_implementors methods
@@ -64,6 +73,13 @@ class ImplementorProvisioner(object):
     #- [pkg_name] -> list of instances of this class or subclasses
     all_provisioners = collections.defaultdict(list)
 
+    #- provisioners run concurrently; every read and write of the cush namespaces they
+    #- share goes through this lock
+    _ns_lock = threading.RLock()
+
+    #- [provisioner] -> TaskTiming from the last make_all_implementors() call
+    last_timings = dict()
+
     @abstractmethod
     def make_implementors(self, *args, **kwargs):
         """
@@ -99,7 +115,8 @@ class ImplementorProvisioner(object):
 
 
     @classmethod
-    def make_all_implementors(cls, pkgs=None, overwrite=False, continue_after_failure=False):
+    def make_all_implementors(cls, pkgs=None, overwrite=False, continue_after_failure=False,
+            max_workers=defaults.provisioner_max_workers):
         """
         Description:
             Instantiates the implementor objects. As all Implementors are provisioned /
@@ -110,14 +127,18 @@ class ImplementorProvisioner(object):
             subclasses.
 
             As some implementors depend on others existing before they are created, this
-            will order the implementor provisioners by user set priority and call them in
-            order
+            builds a dependency graph from the implementor nsids each provisioner takes
+            as input and runs every provisioner as soon as the ones it depends on are
+            done. Independent provisioners run concurrently on a bounded thread pool.
 
         Input:
             pkgs: optional list of packages to make the implementors for. Defaults to all.
+            max_workers: maximum number of provisioners to run at once
+                (1 runs them one at a time in dependency / priority order)
 
         Output:
-            None directly; adds implementors to the implementor Namespace
+            dict of provisioner -> TaskTiming for each provisioner that was run. Also
+            adds implementors to the implementor Namespace
         """
 
         log = LoggerAdapter(logger, {'name_ext': 'ImplementorProvisioner.make_implementors'})
@@ -136,27 +157,243 @@ class ImplementorProvisioner(object):
             pkgs = cls.all_provisioners.keys()
             log.debug("pkgs: {}".format(pkgs))
 
-        #- make a single iterable, sorted by priority
-        all_pkg_provisioners = cls.all_provisioners.values()
-        provisioners_iter = itertools.chain.from_iterable(all_pkg_provisioners)
-        provisioners = sorted(provisioners_iter, key=operator.attrgetter('priority'))
-        log.debug("sorted provisioners: {}".format(provisioners))
+        all_pkg_provisioners = [cls.all_provisioners[pkg] for pkg in pkgs]
+        provisioners = list(itertools.chain.from_iterable(all_pkg_provisioners))
+
+        graph = cls.make_provisioner_graph(provisioners, overwrite=overwrite,\
+            continue_after_failure=continue_after_failure)
+        log.debug("provisioner order: {}".format(graph.topological_order()))
+
+        timings = graph.run(max_workers=max_workers)
+        cls.last_timings = timings
+        for provisioner, timing in sorted(timings.items(), key=lambda x: x[1].start):
+            log.debug("provisioner timing: {}".format(timing))
+
+        log.debug("Exiting")
+        return timings
 
+
+
+    @classmethod
+    def make_provisioner_graph(cls, provisioners, overwrite=False,
+            continue_after_failure=False):
+        """
+        Description:
+            build the TaskGraph used to run a set of provisioners.
+
+            A provisioner depends on another when one of the nsids it takes as input
+            names the other's root nsid, something above it or something below it. Inputs
+            that no provisioner makes (eg. the user namespace) add no dependency.
+
+        Input:
+            provisioners: iterable of ImplementorProvisioner instances
+
+        Output:
+            TaskGraph of provisioner -> call_make_implementors task
+        """
+        log = LoggerAdapter(logger, {'name_ext': 'ImplementorProvisioner.make_provisioner_graph'})
+        provisioners = list(provisioners)
+        roots = [(p, sanitize_nsid(f".{p.root_nsid}")) for p in provisioners]
+
+        graph = TaskGraph()
         for provisioner in provisioners:
-            log.debug("provisioner: {}".format(provisioner))
-            try:
-                #- call it from the module where it was originally defined
-                #- this call modifies the implementor namespaces
-                provisioner.call_make_implementors(overwrite=overwrite)
+            deps = set()
+            for input_nsid in provisioner.get_input_nsids().values():
+                input_nsid = sanitize_nsid(f".{input_nsid}")
+                for other, root in roots:
+                    if other is provisioner:
+                        continue
+                    if nsids_overlap(input_nsid, root):
+                        deps.add(other)
+            log.debug("{} depends on: {}".format(provisioner, deps))
+
+            task = partial(provisioner._run_provisioner, overwrite=overwrite,\
+                continue_after_failure=continue_after_failure)
+            graph.add_task(provisioner, task, deps=deps, priority=provisioner.priority)
+
+        return graph
 
-            except (AttributeError, TypeError) as err:
-                log.error("Failed to provision implementors: {}".format(\
-                    provisioner))
-                log.exception(err)
-                if not continue_after_failure:
-                    raise err
 
+
+    def _run_provisioner(self, overwrite=False, continue_after_failure=False):
+        """
+        Description:
+            call_make_implementors() with the error handling make_all_implementors()
+            applies to every provisioner
+        """
+        log = LoggerAdapter(logger, {'name_ext': 'ImplementorProvisioner._run_provisioner'})
+        log.debug("provisioner: {}".format(self))
+        try:
+            #- call it from the module where it was originally defined
+            #- this call modifies the implementor namespaces
+            self.call_make_implementors(overwrite=overwrite)
+
+        except (AttributeError, TypeError) as err:
+            log.error("Failed to provision implementors: {}".format(self))
+            log.exception(err)
+            if not continue_after_failure:
+                raise err
+
+
+
+    @classmethod
+    def reprovision(cls, changed=None, removed=None, pkgs=None, enabled=None):
+        """
+        Description:
+            Incrementally update the implementors after entries of the user namespace
+            were added, changed or removed, instead of rerunning every provisioner.
+
+            Provisioners are visited in dependency order. For each one:
+                * the implementors made from a removed or changed input are removed
+                * make_implementors() is called again with each input narrowed down to
+                  the changed user nsids (for inputs no provisioner makes) or to the
+                  implementors just re-made upstream (for the others)
+            Provisioners none of whose inputs changed are not called, and implementors
+            made from unchanged inputs are left as they are.
+
+            Which implementors were made from which input is not recorded per
+            implementor, so it is worked out from the NSIDs: an implementor was made
+            from an input if the input's NSID (below its provisioner root) appears in
+            the implementor's NSID extension. This holds for the NSID extensions cush
+            provisioners use (eg. sessions are namespaced by credential NSID and
+            clients by their session's region and credential).
+
+        Input:
+            changed: list of user nsids (as passed to lookup_user) added or changed
+            removed: list of user nsids removed
+            pkgs: optional list of packages to reprovision. Defaults to all.
+            enabled: list of user or implementor nsids that were left out of
+                provisioning while they were switched off and are now on. They are
+                provisioned from like changed inputs, but nothing is removed for them.
+
+        Output:
+            dict with lists of the implementor nsids 'added' and 'removed'
+        """
+        log = LoggerAdapter(logger, {'name_ext': 'ImplementorProvisioner.reprovision'})
+        log.debug(f"Entering: {changed=} {removed=}")
+        changed = [cls._relative_nsid(x) for x in (changed or list())]
+        removed = [cls._relative_nsid(x) for x in (removed or list())]
+        enabled = [f".{cls._relative_nsid(x)}" for x in (enabled or list())]
+
+        if pkgs is None:
+            pkgs = cls.all_provisioners.keys()
+        all_pkg_provisioners = [cls.all_provisioners[pkg] for pkg in pkgs]
+        provisioners = list(itertools.chain.from_iterable(all_pkg_provisioners))
+        graph = cls.make_provisioner_graph(provisioners)
+
+        #- [provisioner] -> implementor nsids removed / re-made by this call
+        removed_nsids = collections.defaultdict(list)
+        added_nsids = collections.defaultdict(list)
+
+        for provisioner in graph.topological_order():
+            root = sanitize_nsid(f".{provisioner.root_nsid}")
+            deps = graph.dependencies(provisioner)
+
+            #- everything this provisioner's implementors may have been made from that
+            #- no longer exists in its old form
+            stale_exts = changed + removed
+            for dep in deps:
+                dep_root = sanitize_nsid(f".{dep.root_nsid}")
+                stale_exts.extend(cls._nsid_ext(x, dep_root) for x in removed_nsids[dep])
+
+            for nsid in list(provisioner.implementor_nsids):
+                nsid_ext = cls._nsid_ext(nsid, root)
+                if any(cls._nsid_contains(nsid_ext, x) for x in stale_exts):
+                    provisioner.remove_implementor(nsid)
+                    removed_nsids[provisioner].append(nsid)
+
+            #- narrow each input down to what is new
+            narrowed_inputs = dict()
+            for arg, input_nsid in provisioner.get_input_nsids().items():
+                input_nsid = sanitize_nsid(f".{input_nsid}")
+                upstream = [x for x in deps\
+                    if nsids_overlap(input_nsid, sanitize_nsid(f".{x.root_nsid}"))]
+                if upstream:
+                    candidates = itertools.chain.from_iterable(added_nsids[x] for x in upstream)
+                else:
+                    candidates = [f".{x}" for x in changed]
+                candidates = itertools.chain(candidates, enabled)
+                new_inputs = [x.lstrip('.') for x in candidates\
+                    if x == input_nsid or x.startswith(input_nsid + '.')]
+                if new_inputs:
+                    narrowed_inputs[arg] = new_inputs
+
+            #- one call per narrowed input, with the other inputs left at their defaults,
+            #- covers every new combination of inputs
+            for arg, new_inputs in narrowed_inputs.items():
+                log.debug(f"reprovisioning {provisioner} for {arg}={new_inputs}")
+                new_nsids = provisioner.call_make_implementors(overwrite=True,\
+                    inputs={arg: new_inputs})
+                for nsid in new_nsids:
+                    if nsid not in added_nsids[provisioner]:
+                        added_nsids[provisioner].append(nsid)
+
+        result = dict(
+            added=list(itertools.chain.from_iterable(added_nsids.values())),
+            removed=list(itertools.chain.from_iterable(removed_nsids.values())))
+        log.info("reprovisioned: {} implementors added, {} removed".format(\
+            len(result['added']), len(result['removed'])))
         log.debug("Exiting")
+        return result
+
+
+
+    @staticmethod
+    def _relative_nsid(nsid):
+        return sanitize_nsid(f".{nsid}").strip('.')
+
+
+    @staticmethod
+    def _nsid_ext(nsid, root_nsid):
+        """
+        Description:
+            the part of an implementor nsid below its provisioner's root nsid
+        """
+        if nsid.startswith(root_nsid + '.'):
+            return nsid[len(root_nsid) + 1:]
+        return nsid.strip('.')
+
+
+    @staticmethod
+    def _nsid_contains(nsid, sub_nsid):
+        """
+        Description:
+            True if the components of sub_nsid appear, in order and next to each other,
+            among the components of nsid
+        """
+        parts = [x for x in nsid.split('.') if x]
+        sub_parts = [x for x in sub_nsid.split('.') if x]
+        if not sub_parts:
+            return False
+        n = len(sub_parts)
+        return any(parts[i:i+n] == sub_parts for i in range(len(parts) - n + 1))
+
+
+    def remove_implementor(self, nsid):
+        """
+        Description:
+            remove one of this provisioner's implementors from the implementor namespace
+
+        Input:
+            nsid: the implementor's nsid (below .implementor)
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'ImplementorProvisioner.remove_implementor'})
+        log.debug(f"removing implementor: {nsid}")
+        with self._ns_lock:
+            try:
+                self.nsroots['implementor'].remove(nsid)
+            except NamespaceLookupError:
+                log.debug(f"implementor already gone: {nsid}")
+            self.cush.get_leaf_index('implementor').remove(nsid)
+            if nsid in self.implementor_nsids:
+                self.implementor_nsids.remove(nsid)
+
+            fs_nsid = sanitize_nsid(f".implementor{nsid}")
+            fs = self._get_flipswitch(fs_nsid)
+            #- a FlipswitchView has no node; its slot in the table stays
+            if isinstance(fs, Flipswitch):
+                self.nsroots['flipswitch'].remove(fs_nsid)
+                fs._graph.unregister(fs)
 
 
 
@@ -195,6 +432,10 @@ class ImplementorProvisioner(object):
 
         self.root_nsid = root_nsid
         self.priority = priority
+        #- make_implementors argument name -> nsid it was last provisioned from
+        self.inputs = dict()
+        #- nsids of the implementors added by the last call_make_implementors()
+        self.implementor_nsids = list()
 
         module = inspect.getmodule(self)
         module_pkg = self.get_root_implementor_pkg_name(module)
@@ -281,6 +522,10 @@ class ImplementorProvisioner(object):
         log.debug("Enter")
         log.debug("self.nsid_exts: {}".format(self.nsid_exts))
 
+        if isinstance(imp, LazyImplementor):
+            #- compute the nsid from the metadata instead of building the implementor
+            imp = imp.metadata
+
         nsid_exts = list()
         for nsid_extender in self.nsid_exts:
             if callable(nsid_extender):
@@ -351,18 +596,21 @@ class ImplementorProvisioner(object):
 
 
 
-    def call_make_implementors(self, overwrite=False):
+    def call_make_implementors(self, overwrite=False, inputs=None):
         """
         Description:
             Wrapper around the user/subclass defined make_implementors method to perform
             the namespace modifications needed after the implementors are created.
 
         Input:
-            None; uses self to call user-defined make_implementors() on the user-defined 
-            ImplementorProvisioner subclass
+            inputs: optional dict of make_implementors argument name -> nsid or list of
+                nsids to use instead of the defaults. Used to provision for only some
+                of the inputs; the implementors already made for the other inputs are
+                kept.
 
         Output:
-            None; the following cush namespaces are directly modified:
+            list of the nsids of the implementors added.
+            The following cush namespaces are directly modified:
                 * implementor_input
                 * implementor
                 * implementor_provisioner
@@ -371,33 +619,70 @@ class ImplementorProvisioner(object):
             'ImplementorProvisioner.call_make_implementors'})
         log.debug("Entering")
 
-        log.debug("Calling user-defined make_implementors() method")
-        fresh_implementors = self.make_implementors()
+        with profiling.phase(f"provision {self.root_nsid}"):
+            log.debug("Calling user-defined make_implementors() method")
+            if inputs:
+                log.debug(f"using inputs: {inputs}")
+                fresh_implementors = self.make_implementors(**inputs)
+            else:
+                fresh_implementors = self.make_implementors()
 
-        log.debug("user-defined make_implementors() output: {}".format(fresh_implementors))
-        log.debug("instance root_nsid: {}".format(self.root_nsid))
+            log.debug("user-defined make_implementors() output: {}".format(fresh_implementors))
+            log.debug("instance root_nsid: {}".format(self.root_nsid))
 
-        if fresh_implementors is None:
-            msg1 = "Implementor Provisioner {} returned None".format(self.func.__name__)
-            msg2 = "implementors.{} as None probably isn't what you want..".format(\
-                self.root_nsid)
-            log.warning(msg1)
-            log.warning(msg2)
+            if fresh_implementors is None:
+                msg1 = "Implementor Provisioner {} returned None".format(self.func.__name__)
+                msg2 = "implementors.{} as None probably isn't what you want..".format(\
+                    self.root_nsid)
+                log.warning(msg1)
+                log.warning(msg2)
 
 
-        log.debug("Modifying implementor_input namespace")
-        #- we get the inputs from the method signature of the user-defined method
-        argspec = inspect.getfullargspec(self.make_implementors)
-        inputs_with_nsids = self.modify_implementor_input_ns(argspec, overwrite=overwrite)
+            with self._ns_lock:
+                log.debug("Modifying implementor_input namespace")
+                #- we get the inputs from the method signature of the user-defined method
+                argspec = inspect.getfullargspec(self.make_implementors)
+                inputs_with_nsids = self.modify_implementor_input_ns(argspec, overwrite=overwrite)
 
 
-        log.debug("Modifying implementor namespace")
-        self.modify_implementor_ns(fresh_implementors, overwrite=overwrite)
+                log.debug("Modifying implementor namespace")
+                new_nsids = self.modify_implementor_ns(fresh_implementors, overwrite=overwrite,\
+                    replace=not inputs)
 
-        log.debug("Modifying implementor_provisioner namespace")
-        self.modify_implementor_provisioner_ns(overwrite=overwrite)
+                log.debug("Modifying implementor_provisioner namespace")
+                self.modify_implementor_provisioner_ns(overwrite=overwrite)
         log.debug("Exiting")
-        return
+        return new_nsids
+
+
+    def get_input_nsids(self, argspec=None):
+        """
+        Description:
+            get the inputs of the user-defined make_implementors method. Every argument
+            with a default is an input and its default is the nsid the provisioner reads
+            it from.
+
+        Input:
+            argspec: optional FullArgSpec of make_implementors; computed if not given
+
+        Output:
+            dict of argument name -> nsid string
+        """
+        if argspec is None:
+            argspec = inspect.getfullargspec(self.make_implementors)
+
+        if argspec.defaults:
+            #- defaults line up with the last positional args
+            iter1 = zip(argspec.args[-len(argspec.defaults):], argspec.defaults)
+        else:
+            iter1 = list()
+
+        if argspec.kwonlydefaults:
+            iter2 = argspec.kwonlydefaults.items()
+        else:
+            iter2 = list()
+
+        return dict(itertools.chain(iter1, iter2))
 
 
     def modify_implementor_provisioner_ns(self, overwrite=False):
@@ -416,8 +701,8 @@ class ImplementorProvisioner(object):
             self))
 
         #- TODO: calculate and use NSID postfix
-        node_factory = partial(DelegateNode, self)
-        self.nsroots['implementor_provisioner'].add(self.root_nsid, node_factory)
+        bulk_add_nodes(self.nsroots['implementor_provisioner'],
+            [(self.root_nsid, DelegateNode, self)])
         log.debug("Exiting")
         return
 
@@ -448,34 +733,38 @@ class ImplementorProvisioner(object):
         log.debug("Inputs to be added to Implementor Input Namespace: {}".format(argspec))
 
         inputs_with_nsids = list()
-        if len(argspec.args) > 1:
-            iter1 = zip(argspec.args[1:], argspec.defaults)
-        else:
-            iter1 = list()
-
-        if argspec.kwonlydefaults:
-            iter2 = argspec.kwonlydefaults.items()
-        else:
-            iter2 = list()
-        arg_and_kwarg_specs = itertools.chain(iter1, iter2)
+        self.inputs = self.get_input_nsids(argspec)
+        arg_and_kwarg_specs = self.inputs.items()
 
         #- TODO: calculate and use NSID postfix
         for k,v in arg_and_kwarg_specs:
             subkey = k
             nsid = '.'.join([self.root_nsid, subkey])
             log.debug(f"adding implementor_input node: {nsid=}")
-            self.nsroots['implementor_input'].add(nsid, DelegateNode, v)
             inputs_with_nsids.append((nsid, v))
+        bulk_add_nodes(self.nsroots['implementor_input'],
+            [(nsid, DelegateNode, v) for nsid,v in inputs_with_nsids])
         log.debug("Exiting")
         return inputs_with_nsids
 
 
 
-    def modify_implementor_ns(self, implementor_objs, overwrite=False):
+    def modify_implementor_ns(self, implementor_objs, overwrite=False, replace=True):
         """
         Description:
             get an NSID for each implementor object and add it to the implementor
             namespace under this new id
+
+            LazyImplementor specs are added as LazyImplementorNodes, which build the
+            implementor the first time it is used
+
+        Input:
+            implementor_objs: iterable of implementors
+            replace: if True these are all of this provisioner's implementors; if False
+                they are added to the ones from earlier calls
+
+        Output:
+            list of the nsids added
         """
         log = LoggerAdapter(logger, {'name_ext':\
             'ImplementorProvisioner.modify_implementor_ns'})
@@ -483,33 +772,115 @@ class ImplementorProvisioner(object):
         log.debug("Modifying implementor namespace with: implementors: {}".format(\
             implementor_objs))
 
+        if replace:
+            self.implementor_nsids = list()
+        known_nsids = set(self.implementor_nsids)
+        new_nsids = list()
+        nodes = list()
         for imp in implementor_objs:
             full_nsid = sanitize_nsid(f".{self.get_full_nsid(imp)}")
             log.debug(f"adding item to implementor ns:  {full_nsid}--->{imp}")
-
-            node_factory = partial(DelegateNode, imp)
-            self.nsroots['implementor'].add(full_nsid, node_factory)
+            new_nsids.append(full_nsid)
+            if full_nsid not in known_nsids:
+                known_nsids.add(full_nsid)
+                self.implementor_nsids.append(full_nsid)
+
+            if isinstance(imp, LazyImplementor):
+                nodes.append((full_nsid, LazyImplementorNode, imp))
+            else:
+                nodes.append((full_nsid, DelegateNode, imp))
+        bulk_add_nodes(self.nsroots['implementor'], nodes)
+        index = self.cush.get_leaf_index('implementor')
+        for nsid, *_ in nodes:
+            index.add(nsid, self.nsroots['implementor'].get(nsid))
 
         log.debug("Exiting")
+        return new_nsids
 
 
-    def lookup_implementor(self, implementor_nsid):
+    def lookup_implementor(self, implementor_nsid, include_inactive=False):
         """
         Description:
             Method for users to be able to lookup existing implementors by nsid
+
+        Input:
+            implementor_nsid: nsid below .implementor, or a list of them
+            include_inactive: also return the implementors that are switched off
+
+        Output:
+            list of the implementor leaf nodes at or below the nsid(s)
         """
         log = LoggerAdapter(logger, dict(name_ext=f"{self.__class__.__name__}.lookup_implementor"))
         log.debug(f"called with: {implementor_nsid=}")
-        return self.cush._ns.get_leaf_nodes(f".implementor.{implementor_nsid}")
+        #- provisioners that have not been loaded yet are run first
+        for nsid in [implementor_nsid] if isinstance(implementor_nsid, str) else implementor_nsid:
+            self.cush.ensure_implementors(nsid)
+        return self._lookup_leaf_nodes('implementor', implementor_nsid, include_inactive)
 
 
-    def lookup_user(self, user_nsid):
+    def lookup_user(self, user_nsid, include_inactive=False, credential_type=None,
+            account_id=None, tags=None):
+        """
+        Description:
+            Method for users to be able to lookup users / credentials by nsid
+
+        Input:
+            user_nsid: nsid below .user, or a list of them
+            include_inactive: also return the users that are switched off
+            credential_type: only the users with this type of credential: 'access_key',
+                'session' or 'role'
+            account_id: only the users in this AWS account
+            tags: tag or list of tags; only the users with all of them
+
+        Output:
+            list of the user leaf nodes at or below the nsid(s)
+        """
         log = LoggerAdapter(logger, dict(name_ext=f"{self.__class__.__name__}.lookup_user"))
         log.debug(f"called with: {user_nsid=}")
-        return self.cush._ns.get_leaf_nodes(f".user.{user_nsid}")
+        return self._lookup_leaf_nodes('user', user_nsid, include_inactive,\
+            credential_type=credential_type, account_id=account_id, tags=tags)
+
 
+    def _lookup_leaf_nodes(self, ns_name, nsids, include_inactive=False, **filters):
+        """
+        Description:
+            the leaf nodes at or below nsids in a cush namespace, from the namespace's
+            LeafIndex. Unless include_inactive is set, the ones that are switched off are
+            left out and noted, so that they are provisioned from when they are switched
+            on again.
 
-    def make_flipswitch(self, implementor, app_name='default', prefix=None):
+        Input:
+            filters: passed to LeafIndex.query()
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'ImplementorProvisioner._lookup_leaf_nodes'})
+        if isinstance(nsids, str):
+            nsids = [nsids]
+
+        index = self.cush.get_leaf_index(ns_name)
+        leaf_nodes = list()
+        seen = set()
+        with self._ns_lock:
+            for nsid in nsids:
+                for node in index.query(nsid, **filters):
+                    if id(node) not in seen:
+                        seen.add(id(node))
+                        leaf_nodes.append(node)
+
+        if include_inactive:
+            return leaf_nodes
+
+        active_nodes = list()
+        for node in leaf_nodes:
+            node_nsid = self._get_node_nsid(node, ns_name)
+            if node_nsid is not None and not self.cush.is_active(node_nsid, ns_name):
+                log.info(f"{self.root_nsid}: skipping switched off input {ns_name}{node_nsid}")
+                self.cush.skip_input(node_nsid, ns_name)
+                continue
+            active_nodes.append(node)
+        return active_nodes
+
+
+    def make_flipswitch(self, implementor, app_name='default', prefix='.implementor'):
         """
         Description:
             Module-level utility method to be used by client code that wishes to create a
@@ -517,28 +888,76 @@ class ImplementorProvisioner(object):
 
         Input:
             obj: the object to make into a flipswitch
+            prefix: namespace the object's nsid is in
 
         Output:
-            a Flipswitch for object
+            a Flipswitch-like object for object; see get_or_make_flipswitch()
         """
-        pass
-        #log = LoggerAdapter(logger, {'name_ext' :\
-        #    'ImplementorProvisioner.make_flipswitch'})
-        #log.debug("Entering")
+        log = LoggerAdapter(logger, {'name_ext' :\
+            'ImplementorProvisioner.make_flipswitch'})
+        log.debug("Entering")
 
-        #imp = implementor
-        ##- make nsid
-        #full_nsid = self.get_full_nsid(imp)
-        #log.debug("flipswitch starting full_nsid: {}".format(full_nsid))
+        #- make nsid
+        full_nsid = sanitize_nsid(f"{prefix}.{self.get_full_nsid(implementor)}")
+        log.debug("flipswitch full_nsid: {}".format(full_nsid))
 
-        #full_nsid = sanitize_nsid(make_child_nsid(str(self.nsroots['implementor'].nsid), full_nsid))
-        #log.debug("final flipswitch full_nsid: {}".format(full_nsid))
+        fs = self.get_or_make_flipswitch(full_nsid)
+        log.debug("Exiting")
+        return fs
 
-        ####fs = Flipswitch(full_nsid, self.nsroot)
 
-        #fs = self.cush._ns.add('.flipswitch' + full_nsid, node_factory=Flipswitch)
-        #log.debug("Exiting")
-        #return fs
+    def get_or_make_flipswitch(self, fs_nsid):
+        """
+        Description:
+            get the flipswitch at fs_nsid in the flipswitch namespace, making it if it
+            does not exist yet
+
+        Input:
+            fs_nsid: nsid below .flipswitch, eg. .implementor.<implementor nsid>
+
+        Output:
+            the Flipswitch node if one has been made, otherwise a FlipswitchView of the
+            application's flipswitch_graph; the namespace node is only made when it is
+            asked for (see CushApplication.make_flipswitch_nodes())
+        """
+        return self.cush.flipswitch_graph.view(self._get_table_nsid(fs_nsid))
+
+
+    def _get_flipswitch(self, fs_nsid):
+        table_nsid = self._get_table_nsid(fs_nsid)
+        if table_nsid not in self.cush.flipswitch_graph:
+            return None
+        return self.cush.flipswitch_graph.view(table_nsid)
+
+
+    def _get_table_nsid(self, fs_nsid):
+        #- nsid in the application's flipswitch_graph of the flipswitch at fs_nsid
+        ns_name, _, nsid = str(fs_nsid).lstrip('.').partition('.')
+        return self.cush.flipswitch_nsid(f".{nsid}", ns_name)
+
+
+    @staticmethod
+    def _get_node_nsid(node, ns_name):
+        """
+        Description:
+            nsid of a namespace node below the root of the cush namespace it is in
+
+        Input:
+            node: namespace node, eg. from lookup_implementor()
+            ns_name: name of the cush namespace; eg. 'implementor'
+
+        Output:
+            nsid string, or None if node is not a namespace node in that namespace
+        """
+        nsid = node.__dict__.get('nsid') if hasattr(node, '__dict__') else None
+        if nsid is None:
+            return None
+        nsid = str(nsid)
+        marker = f".{ns_name}."
+        index = nsid.find(marker)
+        if index == -1:
+            return None
+        return nsid[index + len(marker) - 1:]
 
 
     def link_flipswitches(self, parent, children, app_name='default'):
@@ -553,33 +972,38 @@ class ImplementorProvisioner(object):
         Output:
             None; adds the children to the parent
         """
-        pass
-        #log = LoggerAdapter(logger, {'name_ext': 'link_flipswitches'})
-        #log.debug("Entering")
-        #log.debug("Linking flipswitches: {} ---> {}".format(parent, children))
-
-        #if not parent:
-        #    log.warning("Can't link parent: {}".format(parent))
-        #    log.debug("Exiting")
-        #    return
-
-        #if isinstance(children, str) or\
-        #    not isinstance(children, Iterable):
-        #    children = [children]
-
-        #if isinstance(parent, str):
-        #    #- treat as an existing NSID
-        #    parent = self.cush._ns.root.flipswitch.get(parent)
-
-        #if not isinstance(parent, Iterable):
-        #    parents = [parent]
-        #else:
-        #    parents = parent
+        log = LoggerAdapter(logger, {'name_ext': 'link_flipswitches'})
+        log.debug("Entering")
+        log.debug("Linking flipswitches: {} ---> {}".format(parent, children))
+
+        #- not 'if not parent': a flipswitch that is off is falsy
+        if parent is None:
+            log.warning("Can't link parent: {}".format(parent))
+            log.debug("Exiting")
+            return
+
+        if isinstance(children, str) or\
+            not isinstance(children, Iterable):
+            children = [children]
+        children = [x for x in children if x is not None]
+
+        if isinstance(parent, str):
+            #- treat as an existing NSID
+            parent_nsid = parent
+            parent = self._get_flipswitch(parent_nsid)
+            if parent is None:
+                log.warning("No flipswitch to link from: {}".format(parent_nsid))
+                return
+
+        if not isinstance(parent, Iterable):
+            parents = [parent]
+        else:
+            parents = parent
 
-        #for _parent in parents:
-        #    _parent.add_children(children)
-        #log.debug("Exiting")
-        #return
+        for _parent in parents:
+            _parent.add_children(children)
+        log.debug("Exiting")
+        return
 
 
     @staticmethod
@@ -624,28 +1048,30 @@ class ImplementorProvisioner(object):
         """
         Description:
             lookup an implementors flipswitch, if it exists
-        """
-
-        pass
-        #log = LoggerAdapter(logger, {'name_ext' :\
-        #    'ImplementorProvisioner.get_flipswitch_from_implementor'})
-        #log.debug("Entering: base_nsid: {}".format(base_nsid))
-
-        #Provisioner = self.cush._ns.get(f".implementor_provisioner.{base_nsid}")
-        #implementor_nsid = Provisioner.get_full_nsid(implementor)
 
-        #log.debug("Searching for implementor fs nsid: {}".format(implementor_nsid))
-        #try:
-        #    full_implementor_nsid = make_child_nsid(str(self.nsroots['implementor'].nsid), implementor_nsid)
-        #    implementor_fs = self.nsroots['flipswitch'].get(f'{full_implementor_nsid}')
-
-        #    log.debug("Exiting")
-        #    return implementor_fs
+        Input:
+            base_nsid: root nsid of the implementor's provisioner
+            implementor: implementor node (as returned by lookup_implementor) or object
 
-        #except NamespaceLookupError as err:
-        #    log.warning("Failed to get flipswitch for implementor: {}".format(implementor))
-        #    log.debug("Exiting")
-        #    return None
+        Output:
+            Flipswitch, or None if the implementor has none
+        """
+        log = LoggerAdapter(logger, {'name_ext' :\
+            'ImplementorProvisioner.get_flipswitch_from_implementor'})
+        log.debug("Entering: base_nsid: {}".format(base_nsid))
+
+        implementor_nsid = self._get_node_nsid(implementor, 'implementor')
+        if implementor_nsid is None:
+            #- a bare implementor object; its provisioner knows its nsid
+            Provisioner = self.cush._ns.get(f".implementor_provisioner.{base_nsid}")
+            implementor_nsid = sanitize_nsid(f".{Provisioner.get_full_nsid(implementor)}")
+
+        log.debug("Searching for implementor fs nsid: {}".format(implementor_nsid))
+        implementor_fs = self._get_flipswitch(sanitize_nsid(f".implementor{implementor_nsid}"))
+        if implementor_fs is None:
+            log.warning("Failed to get flipswitch for implementor: {}".format(implementor))
+        log.debug("Exiting")
+        return implementor_fs
 
 
     def get_flipswitch_from_user(self, user_root_nsid, user):
@@ -655,16 +1081,20 @@ class ImplementorProvisioner(object):
         Input:
             user_root_nsid: where the user object is rooted in the users namespace
             user: the specific user
+        Output:
+            Flipswitch; made the first time a user's flipswitch is asked for
         """
-        pass
-        #log = LoggerAdapter(logger, {'name_ext':
-        #        'ImplementorProvisioner.get_flipswitch_from_user'})
-
-        #for leaf in self.cush._ns.get_subnodes('.user'):
-        #    if leaf == user:
-        #        user_fs_nsid = leaf.nsid
-        #        log.debug("using flipswitch nsid: {}".format(user_fs_nsid))
-        #        return self.cush._ns.get(f".flipswitch{user_fs_nsid}")
+        log = LoggerAdapter(logger, {'name_ext':
+                'ImplementorProvisioner.get_flipswitch_from_user'})
+
+        user_nsid = self._get_node_nsid(user, 'user')
+        if user_nsid is None:
+            log.warning("Can't get user nsid for: {}".format(user))
+            return None
+
+        user_fs_nsid = sanitize_nsid(f".user{user_nsid}")
+        log.debug("using flipswitch nsid: {}".format(user_fs_nsid))
+        return self.get_or_make_flipswitch(user_fs_nsid)
 
 
 
@@ -0,0 +1,142 @@
+from logging import getLogger, LoggerAdapter
+logger = getLogger(__name__)
+
+import threading
+from types import SimpleNamespace
+from typing import Union
+
+from thewired import Namespace, NamespaceNodeBase, Nsid
+
+
+
+class LazyImplementor(object):
+    """
+    Description:
+        Spec for an implementor that is only built the first time it is used.
+
+        Provisioners can return these instead of the implementor objects themselves.
+        The implementor namespace then holds a LazyImplementorNode that calls
+        factory(*args, **kwargs) on first attribute access and keeps the result.
+
+        As the NSID of an implementor is computed from the implementor object, the
+        provisioner has to pass in the (cheap) values its NSID extensions read as
+        metadata. Dotted keys are turned into nested attributes, so that the same
+        NSID extension strings work on the metadata as on the real object, eg:
+
+            LazyImplementor(session.client, 'ec2',
+                metadata={'meta.region_name': session.region_name})
+    """
+    def __init__(self, factory, *args, metadata=None, attrs=None, **kwargs):
+        """
+        Input:
+            factory: callable that builds the implementor
+            args, kwargs: passed to factory
+            metadata: dict of (dotted) attribute name -> value for NSID computation
+            attrs: dict of attributes to set on the implementor once it is built.
+                These are also available as metadata.
+        """
+        self.factory = factory
+        self.args = args
+        self.kwargs = kwargs
+        self.attrs = dict() if attrs is None else dict(attrs)
+
+        all_metadata = dict() if metadata is None else dict(metadata)
+        all_metadata.update(self.attrs)
+        self.metadata = self.make_metadata(all_metadata)
+
+
+    @staticmethod
+    def make_metadata(metadata):
+        """
+        Description:
+            turn a dict with dotted keys into a tree of SimpleNamespace objects
+        """
+        root = SimpleNamespace()
+        for key, value in metadata.items():
+            node = root
+            *parents, name = key.split('.')
+            for parent in parents:
+                if not hasattr(node, parent):
+                    setattr(node, parent, SimpleNamespace())
+                node = getattr(node, parent)
+            setattr(node, name, value)
+        return root
+
+
+    def materialize(self):
+        """
+        Description:
+            build the implementor object
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'LazyImplementor.materialize'})
+        log.debug("building implementor: {}".format(self))
+        implementor = self.factory(*self.args, **self.kwargs)
+        for attr, value in self.attrs.items():
+            setattr(implementor, attr, value)
+        return implementor
+
+
+    def __repr__(self):
+        return "LazyImplementor(factory={}, args={}, kwargs={}, metadata={})".format(
+            getattr(self.factory, '__qualname__', self.factory), self.args, self.kwargs,
+            self.metadata)
+
+
+
+class LazyImplementorNode(NamespaceNodeBase):
+    """
+    Description:
+        Implementor namespace node that builds its implementor from a LazyImplementor
+        spec on first use and then delegates all attribute access to it, the same way
+        DelegateNode does for implementors that were built up-front.
+    """
+    def __init__(self, spec:LazyImplementor, *, nsid:Union[str, Nsid], namespace:Namespace):
+        """
+        Input:
+            spec: LazyImplementor that builds the implementor object
+        """
+        super().__init__(nsid=nsid, namespace=namespace)
+        self._lazy_spec = spec
+        self._lazy_lock = threading.Lock()
+        self._lazy_delegate = None
+        self._lazy_materialized = False
+
+
+    @property
+    def materialized(self):
+        return self._lazy_materialized
+
+
+    @property
+    def _delegate(self):
+        """
+        Description:
+            the implementor object; built on first access
+        """
+        if not self._lazy_materialized:
+            with self._lazy_lock:
+                if not self._lazy_materialized:
+                    self._lazy_delegate = self._lazy_spec.materialize()
+                    self._lazy_materialized = True
+        return self._lazy_delegate
+
+
+    def __getattr__(self, attr):
+        #- only called for attributes not found on the node itself
+        if attr.startswith('_lazy_'):
+            raise AttributeError(attr)
+        return getattr(self._delegate, attr)
+
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(dir(self._delegate)))
+
+
+    def __str__(self):
+        return str(self._delegate)
+
+
+    def __repr__(self):
+        if self._lazy_materialized:
+            return "{}({}: {!r})".format(self.__class__.__name__, self.nsid, self._lazy_delegate)
+        return "{}({}: <not built>)".format(self.__class__.__name__, self.nsid)
@@ -0,0 +1,236 @@
+"""
+index of the leaf nodes of a cush namespace
+
+Provisioners look up their inputs (users, and the implementors of other provisioners)
+as the leaf nodes below an nsid. Walking the subtree for every lookup costs as much as
+the subtree is big, however little is asked for. A LeafIndex keeps, for every nsid
+prefix, the leaf nodes below it, and for users also their credential type, account id
+and tags, so a lookup costs as much as its result.
+
+The index is kept up to date by the code that adds and removes nodes (see
+ImplementorProvisioner.modify_implementor_ns and remove_implementor). Code that builds
+whole parts of a namespace at once, like the config parser or a snapshot restore,
+invalidates it instead; it is then rebuilt, with one walk, by the next lookup.
+"""
+from logging import getLogger, LoggerAdapter
+logger = getLogger(__name__)
+
+import threading
+from collections.abc import Mapping
+
+from thewired import NamespaceLookupError
+
+
+
+def _nsid_parts(nsid):
+    return tuple(x for x in str(nsid).split('.') if x)
+
+
+def _prefix(parts):
+    return '.' + '.'.join(parts)
+
+
+
+def _get_attrs(node):
+    """
+    Description:
+        the attributes a leaf node is indexed by: the credential type, account id and
+        tags of a user. Only read from the instance dicts, so no lazy implementor is
+        built and no delegate is asked.
+
+    Output:
+        list of (attribute name, value)
+    """
+    node_vars = getattr(node, '__dict__', dict())
+    credential = node_vars.get('credential')
+    credential_vars = getattr(credential, '__dict__', dict()) if credential is not None else dict()
+    get = lambda key: node_vars.get(key, credential_vars.get(key))
+
+    attrs = list()
+    arn = get('arn')
+    if arn is not None:
+        attrs.append(('credential_type', 'role'))
+    elif get('session_token') is not None:
+        attrs.append(('credential_type', 'session'))
+    elif get('access_key_id') is not None:
+        attrs.append(('credential_type', 'access_key'))
+
+    account_id = get('account_id')
+    if account_id is None and isinstance(arn, str) and arn.count(':') >= 5:
+        account_id = arn.split(':')[4] or None
+    if account_id is not None:
+        attrs.append(('account_id', str(account_id)))
+
+    tags = get('tags')
+    if isinstance(tags, str):
+        tags = [tags]
+    elif isinstance(tags, Mapping):
+        #- key: value tags can be asked for as "key=value" or just "key"
+        tags = list(tags.keys()) + [f"{k}={v}" for k,v in tags.items()]
+    for tag in tags or list():
+        attrs.append(('tag', str(tag)))
+    return attrs
+
+
+
+class LeafIndex(object):
+    """
+    Description:
+        leaf nodes of one cush namespace by nsid prefix and by attribute
+    """
+    def __init__(self, namespace, ns_name, get_node_nsid):
+        """
+        Input:
+            namespace: the namespace the cush namespace is in
+            ns_name: name of the cush namespace; eg. 'user'
+            get_node_nsid: function(node, ns_name) returning the nsid of a node below
+                the root of the cush namespace, or None
+        """
+        self.namespace = namespace
+        self.ns_name = ns_name
+        self.get_node_nsid = get_node_nsid
+        #- leaf nsid -> node
+        self._leaves = None
+        #- nsid prefix -> {leaf nsid : node}, in the order the leaves were added
+        self._by_prefix = dict()
+        #- (attribute name, value) -> {leaf nsid : node}
+        self._by_attr = dict()
+        #- leaf nsid -> its attributes
+        self._attrs = dict()
+        self._lock = threading.RLock()
+        self.rebuilds = 0
+
+
+    def invalidate(self):
+        """
+        Description:
+            forget everything; the next lookup walks the namespace again
+        """
+        with self._lock:
+            self._leaves = None
+            self._by_prefix = dict()
+            self._by_attr = dict()
+            self._attrs = dict()
+
+
+    def _ensure(self):
+        log = LoggerAdapter(logger, {'name_ext' : 'LeafIndex._ensure'})
+        if self._leaves is not None:
+            return
+        self._leaves = dict()
+        try:
+            nodes = self.namespace.get_leaf_nodes(f".{self.ns_name}")
+        except NamespaceLookupError:
+            nodes = list()
+        for node in nodes:
+            nsid = self.get_node_nsid(node, self.ns_name)
+            if nsid is None:
+                log.debug(f"not indexing node without a {self.ns_name} nsid: {node}")
+                continue
+            self._add(_nsid_parts(nsid), node)
+        self.rebuilds += 1
+        log.debug(f"indexed {len(self._leaves)} {self.ns_name} leaf nodes")
+
+
+    def _add(self, parts, node):
+        nsid = _prefix(parts)
+        #- the node it was added below is not a leaf anymore
+        for i in range(len(parts)):
+            parent = _prefix(parts[:i])
+            if parent in self._leaves:
+                self._remove_leaf(parent)
+        if nsid in self._leaves:
+            self._remove_leaf(nsid)
+
+        self._leaves[nsid] = node
+        for i in range(len(parts) + 1):
+            self._by_prefix.setdefault(_prefix(parts[:i]), dict())[nsid] = node
+        attrs = _get_attrs(node)
+        self._attrs[nsid] = attrs
+        for attr in attrs:
+            self._by_attr.setdefault(attr, dict())[nsid] = node
+
+
+    def _remove_leaf(self, nsid):
+        parts = _nsid_parts(nsid)
+        del self._leaves[nsid]
+        for i in range(len(parts) + 1):
+            prefix = _prefix(parts[:i])
+            leaves = self._by_prefix.get(prefix)
+            if leaves is not None:
+                leaves.pop(nsid, None)
+                if not leaves:
+                    del self._by_prefix[prefix]
+        for attr in self._attrs.pop(nsid, list()):
+            leaves = self._by_attr.get(attr)
+            if leaves is not None:
+                leaves.pop(nsid, None)
+                if not leaves:
+                    del self._by_attr[attr]
+
+
+    def add(self, nsid, node):
+        """
+        Description:
+            index a leaf node that was just added (or replaced) at nsid
+        """
+        with self._lock:
+            #- an index that is not built yet picks it up when it is
+            if self._leaves is not None:
+                self._add(_nsid_parts(nsid), node)
+
+
+    def remove(self, nsid):
+        """
+        Description:
+            drop the leaf nodes at and below nsid from the index
+        """
+        with self._lock:
+            if self._leaves is None:
+                return
+            for leaf_nsid in list(self._by_prefix.get(_prefix(_nsid_parts(nsid)), dict())):
+                self._remove_leaf(leaf_nsid)
+
+
+    def lookup(self, nsid='.'):
+        """
+        Output:
+            list of the leaf nodes at or below nsid
+        """
+        return self.query(nsid)
+
+
+    def query(self, nsid='.', credential_type=None, account_id=None, tags=None):
+        """
+        Description:
+            the leaf nodes at or below nsid that have all the given attributes
+
+        Input:
+            nsid: nsid below the root of the cush namespace
+            credential_type: 'access_key', 'session' or 'role'
+            account_id: AWS account id
+            tags: tag or list of tags the nodes must all have
+
+        Output:
+            list of nodes; raises NamespaceLookupError if there is no node at nsid
+        """
+        if isinstance(tags, str):
+            tags = [tags]
+        prefix = _prefix(_nsid_parts(nsid))
+        with self._lock:
+            self._ensure()
+            #- every node is a leaf or has leaves below it; only the root can be empty
+            if prefix not in self._by_prefix and prefix != '.':
+                raise NamespaceLookupError(f"no such node: .{self.ns_name}{prefix}")
+            #- start from the smallest set, then keep what is in all the others
+            candidates = [self._by_prefix.get(prefix, dict())]
+            if credential_type is not None:
+                candidates.append(self._by_attr.get(('credential_type', credential_type), dict()))
+            if account_id is not None:
+                candidates.append(self._by_attr.get(('account_id', str(account_id)), dict()))
+            for tag in tags or list():
+                candidates.append(self._by_attr.get(('tag', str(tag)), dict()))
+            smallest = min(candidates, key=len)
+            others = [x for x in candidates if x is not smallest]
+            return [node for leaf_nsid, node in smallest.items()\
+                if all(leaf_nsid in x for x in others)]
@@ -6,6 +6,8 @@ import pkgutil
 import cush.implementor
 import itertools
 
+import cush.profiling as profiling
+
 def get_implementor_path(app_name='default'):
     """
     Description:
@@ -50,7 +52,9 @@ def load_implementors(path=None, app_name='default', prefix='cush.implementor'):
     if prefix[-1] != '.':
         prefix += '.'
 
-    all_module_infos = list(pkgutil.walk_packages(path=path, prefix=prefix))
+    #- walk_packages() imports the packages as it finds them
+    with profiling.phase("import packages"):
+        all_module_infos = list(pkgutil.walk_packages(path=path, prefix=prefix))
     all_pkgs = filter(lambda x: x.ispkg, all_module_infos)
     all_modules = itertools.filterfalse(lambda x: x.ispkg, all_module_infos)
 
@@ -59,7 +63,8 @@ def load_implementors(path=None, app_name='default', prefix='cush.implementor'):
 
     for modinfo in all_modules:
         try:
-            new_mod = importlib.import_module(modinfo.name)
+            with profiling.phase(f"import {modinfo.name}"):
+                new_mod = importlib.import_module(modinfo.name)
             successful_imports.append(new_mod)
         except ImportError as err:
             log.warning("Failed to import implementor module: {}: {}".format(\
@@ -102,3 +107,27 @@ def get_implementor_app_name(module):
                 module))
             
     return app_name
+
+
+def load_provisioner(module_name, cls_name):
+    """
+    Description:
+        import an implementor module and get the instance of one of its
+        ImplementorProvisioner classes, creating it if it does not exist yet
+
+    Input:
+        module_name: name of the implementor module
+        cls_name: name of the provisioner class in the module
+
+    Output:
+        the provisioner instance
+    """
+    #- circular dependency at import time; OK at run-time.
+    from .implementorprovisioner import ImplementorProvisioner
+
+    module = importlib.import_module(module_name)
+    cls = getattr(module, cls_name)
+    for provisioner in itertools.chain.from_iterable(ImplementorProvisioner.all_provisioners.values()):
+        if type(provisioner) is cls:
+            return provisioner
+    return cls()
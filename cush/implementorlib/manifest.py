@@ -0,0 +1,414 @@
+"""
+manifest of the implementor provisioners, built without importing them
+
+The implementor modules are parsed (not imported) to find the ImplementorProvisioner
+subclasses, the root nsid each one provisions and the nsids it takes as input. The
+result is cached as JSON in the cache directory and a module is only parsed again when
+its file changes.
+
+With the manifest, the implementor namespace starts out with a placeholder node at
+the root nsid of every provisioner. A provisioner's module is imported and run only
+when its subtree is first used or when another provisioner looks up its implementors.
+"""
+from logging import getLogger, LoggerAdapter
+logger = getLogger(__name__)
+
+import ast
+import collections
+import json
+import os
+import threading
+
+from thewired import NamespaceNodeBase
+from thewired.namespace.nsid import sanitize_nsid
+
+import cush.defaults as defaults
+import cush.profiling as profiling
+from cush.util import bulk_add_nodes, filename_to_fullpath
+from .load import get_implementor_path, load_provisioner
+
+
+
+def nsids_overlap(nsid1, nsid2):
+    """
+    Description:
+        True if the two nsids are the same or one is below the other
+    """
+    return nsid1 == nsid2 or nsid1.startswith(nsid2 + '.') or nsid2.startswith(nsid1 + '.')
+
+
+
+class ManifestEntry(collections.namedtuple('ManifestEntry',\
+    ['root_nsid', 'module', 'cls', 'inputs', 'priority'])):
+    """
+    Description:
+        one ImplementorProvisioner subclass found in an implementor module.
+        root_nsid is sanitized and starts with '.'; inputs is a dict of
+        make_implementors argument name -> nsid
+    """
+    __slots__ = ()
+
+    def as_data(self):
+        return self._asdict()
+
+
+
+class ProvisionerScanner(ast.NodeVisitor):
+    """
+    Description:
+        find the ImplementorProvisioner subclasses in the source of one module.
+
+        The root nsid and priority are read from the defaults of __init__ and the inputs
+        from the defaults of make_implementors. Classes that do not have a literal
+        root_nsid default can not be provisioned lazily; their module is recorded in
+        eager instead.
+    """
+    base_name = 'ImplementorProvisioner'
+
+    def __init__(self, module):
+        self.module = module
+        self.entries = list()
+        self.eager = False
+
+
+    def visit_ClassDef(self, node):
+        base_names = [self._get_name(x) for x in node.bases]
+        if self.base_name not in base_names:
+            return self.generic_visit(node)
+
+        methods = {x.name : x for x in node.body if isinstance(x, ast.FunctionDef)}
+        init_defaults = self._get_defaults(methods.get('__init__'))
+        root_nsid = init_defaults.get('root_nsid')
+        if not isinstance(root_nsid, str):
+            self.eager = True
+            return
+
+        priority = init_defaults.get('priority')
+        if not isinstance(priority, (int, float)):
+            priority = None
+        inputs = {k : v for k,v in self._get_defaults(methods.get('make_implementors')).items()\
+            if isinstance(v, str)}
+        self.entries.append(ManifestEntry(sanitize_nsid(f".{root_nsid}"), self.module,\
+            node.name, inputs, priority))
+
+
+    @staticmethod
+    def _get_name(node):
+        if isinstance(node, ast.Name):
+            return node.id
+        if isinstance(node, ast.Attribute):
+            return node.attr
+        return None
+
+
+    @staticmethod
+    def _get_defaults(func):
+        """
+        Description:
+            dict of argument name -> literal default value for a function definition
+        """
+        if func is None:
+            return dict()
+        args = func.args
+        defaults = dict()
+        positional = args.posonlyargs + args.args
+        for arg, default in zip(positional[len(positional) - len(args.defaults):], args.defaults):
+            defaults[arg.arg] = default
+        for arg, default in zip(args.kwonlyargs, args.kw_defaults):
+            if default is not None:
+                defaults[arg.arg] = default
+
+        values = dict()
+        for name, default in defaults.items():
+            try:
+                values[name] = ast.literal_eval(default)
+            except ValueError:
+                pass
+        return values
+
+
+
+class ImplementorManifest(object):
+    """
+    Description:
+        the provisioners of an implementor package tree, by root nsid
+    """
+    #- bump when the cached layout changes
+    version = 1
+
+    def __init__(self, files=None):
+        """
+        Input:
+            files: dict of module file path -> dict with keys:
+                mtime_ns, size: stat of the file when it was scanned
+                module: module name
+                entries: list of ManifestEntry data
+                eager: True if the module has provisioners that must be imported
+        """
+        self.files = dict() if files is None else files
+
+
+    @property
+    def entries(self):
+        entries = list()
+        for path in sorted(self.files):
+            entries.extend(ManifestEntry(**x) for x in self.files[path]['entries'])
+        return entries
+
+
+    @property
+    def eager_modules(self):
+        return [x['module'] for _,x in sorted(self.files.items()) if x['eager']]
+
+
+    def dependencies(self, entry):
+        """
+        Description:
+            the entries whose implementors entry takes as input
+        """
+        deps = list()
+        for other in self.entries:
+            if other.root_nsid == entry.root_nsid:
+                continue
+            for input_nsid in entry.inputs.values():
+                if nsids_overlap(sanitize_nsid(f".{input_nsid}"), other.root_nsid):
+                    deps.append(other)
+                    break
+        return deps
+
+
+    @staticmethod
+    def get_path(app_name='default'):
+        return filename_to_fullpath(defaults.cache_dir, f"{app_name}.{defaults.manifest_file}")
+
+
+    @classmethod
+    def load(cls, app_name='default', path=None, prefix='cush.implementor', cache_path=None):
+        """
+        Description:
+            get the manifest of an implementor package tree, rescanning only the module
+            files that changed since the cached manifest was written
+
+        Input:
+            path: list of implementor package directories; defaults to the ones of
+                the application named app_name
+            prefix: module name prefix of the package tree
+            cache_path: where the manifest is cached; defaults to the cache directory
+
+        Output:
+            ImplementorManifest
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'ImplementorManifest.load'})
+        if path is None:
+            path = get_implementor_path(app_name)
+        if cache_path is None:
+            cache_path = cls.get_path(app_name)
+        prefix = prefix.rstrip('.')
+
+        cached_files = dict()
+        try:
+            with open(cache_path, 'rt') as fp:
+                cached = json.load(fp)
+            if cached.get('version') == cls.version:
+                cached_files = cached['files']
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError) as err:
+            log.warning(f"ignoring unreadable manifest {cache_path}: {err}")
+
+        files = dict()
+        changed = False
+        for module, file_path in cls.find_modules(path, prefix):
+            st = os.stat(file_path)
+            cached_file = cached_files.get(file_path)
+            if cached_file and cached_file['mtime_ns'] == st.st_mtime_ns\
+                and cached_file['size'] == st.st_size and cached_file['module'] == module:
+                files[file_path] = cached_file
+                continue
+
+            log.debug(f"scanning {file_path}")
+            changed = True
+            files[file_path] = cls.scan_file(file_path, module, st)
+
+        manifest = cls(files)
+        if changed or set(files) != set(cached_files):
+            manifest.save(cache_path)
+        return manifest
+
+
+    @staticmethod
+    def find_modules(path, prefix):
+        """
+        Description:
+            the (module name, file path) of every module in the package tree
+        """
+        for top in path:
+            for dirpath, dirnames, filenames in os.walk(top):
+                dirnames[:] = sorted(x for x in dirnames\
+                    if os.path.exists(os.path.join(dirpath, x, '__init__.py')))
+                rel_parts = os.path.relpath(dirpath, top).split(os.sep)
+                rel_parts = [x for x in rel_parts if x != '.']
+                for filename in sorted(filenames):
+                    if not filename.endswith('.py') or filename == '__init__.py':
+                        continue
+                    module = '.'.join([prefix] + rel_parts + [filename[:-3]])
+                    yield module, os.path.join(dirpath, filename)
+
+
+    @staticmethod
+    def scan_file(file_path, module, st):
+        log = LoggerAdapter(logger, {'name_ext' : 'ImplementorManifest.scan_file'})
+        scanner = ProvisionerScanner(module)
+        try:
+            with open(file_path, 'rb') as fp:
+                tree = ast.parse(fp.read(), filename=file_path)
+            scanner.visit(tree)
+        except (SyntaxError, ValueError) as err:
+            #- let the import report the problem
+            log.warning(f"could not scan {file_path}: {err}")
+            scanner.eager = True
+        return dict(mtime_ns=st.st_mtime_ns, size=st.st_size, module=module,
+            entries=[x.as_data() for x in scanner.entries], eager=scanner.eager)
+
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wt') as fp:
+            json.dump(dict(version=self.version, files=self.files), fp, indent=1)
+        os.replace(tmp_path, path)
+
+
+
+class LazySubtreeNode(NamespaceNodeBase):
+    """
+    Description:
+        placeholder at the root nsid of a provisioner that has not run yet. The first
+        lookup of anything below it runs the provisioner, which adds the implementors
+        below this node.
+    """
+    def __init__(self, loader, root_nsid, *, nsid, namespace):
+        super().__init__(nsid=nsid, namespace=namespace)
+        self._lazy_loader = loader
+        self._lazy_root_nsid = root_nsid
+
+
+    def __getattr__(self, attr):
+        #- only called for attributes not found on the node itself
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        if not self._lazy_loader.is_provisioned(self._lazy_root_nsid):
+            #- raises what the provisioner raised, if it fails
+            self._lazy_loader.ensure_provisioned(self._lazy_root_nsid)
+            #- still not provisioned while it is being provisioned further up the stack
+            if self._lazy_loader.is_provisioned(self._lazy_root_nsid):
+                return getattr(self, attr)
+        raise AttributeError(attr)
+
+
+    def __repr__(self):
+        return "{}({}: <not provisioned>)".format(self.__class__.__name__, self.nsid)
+
+
+
+class LazyProvisionerLoader(object):
+    """
+    Description:
+        imports and runs the provisioners of an ImplementorManifest on demand
+    """
+    def __init__(self, app, manifest):
+        self.app = app
+        self.manifest = manifest
+        self.entries = {x.root_nsid : x for x in manifest.entries}
+        self._provisioned = set()
+        #- roots being provisioned, by the thread holding _lock
+        self._in_progress = set()
+        self._lock = threading.RLock()
+
+
+    def install(self):
+        """
+        Description:
+            put a LazySubtreeNode at the root nsid of every provisioner
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'LazyProvisionerLoader.install'})
+        roots = list(self.entries)
+        nodes = list()
+        for root_nsid in roots:
+            if any(x.startswith(root_nsid + '.') for x in roots):
+                #- another provisioner's subtree is below this one; nothing to hang a
+                #- placeholder on that would not hide it
+                continue
+            nodes.append((root_nsid, LazySubtreeNode, self, root_nsid))
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+        with ImplementorProvisioner._ns_lock:
+            bulk_add_nodes(self.app._ns.get_handle('.implementor'), nodes)
+            self.app.invalidate_leaf_index('.implementor')
+        log.info(f"{len(roots)} provisioners waiting to be loaded on first use")
+
+
+    def is_provisioned(self, root_nsid):
+        return root_nsid in self._provisioned
+
+
+    def pending_specs(self):
+        """
+        Description:
+            the provisioners that have not run yet, as ProvisioningSnapshot records them
+
+        Output:
+            dict of root nsid -> dict(module, cls, deps, implementors=None)
+        """
+        with self._lock:
+            return {root_nsid : dict(module=entry.module, cls=entry.cls,
+                    deps=[x.root_nsid for x in self.manifest.dependencies(entry)],
+                    implementors=None)
+                for root_nsid, entry in self.entries.items()\
+                if root_nsid not in self._provisioned}
+
+
+    def ensure_provisioned(self, nsid):
+        """
+        Description:
+            run every provisioner whose implementors are at, above or below nsid and
+            has not run yet
+
+        Input:
+            nsid: implementor nsid (below .implementor)
+        """
+        nsid = sanitize_nsid(f".{nsid}").rstrip('.')
+        if nsid in ('', '.'):
+            roots = list(self.entries)
+        else:
+            roots = [x for x in self.entries if nsids_overlap(nsid, x)]
+        for root_nsid in roots:
+            self.provision(root_nsid)
+
+
+    def provision(self, root_nsid):
+        """
+        Description:
+            import and run the provisioner with this root nsid, after the ones it depends on
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'LazyProvisionerLoader.provision'})
+        if root_nsid in self._provisioned:
+            return
+
+        with self._lock:
+            #- a dependency cycle falls back on whatever exists so far
+            if root_nsid in self._provisioned or root_nsid in self._in_progress:
+                return
+            entry = self.entries[root_nsid]
+            self._in_progress.add(root_nsid)
+            try:
+                for dep in self.manifest.dependencies(entry):
+                    self.provision(dep.root_nsid)
+
+                log.info(f"provisioning {root_nsid} from {entry.module}.{entry.cls}")
+                with profiling.phase(f"import {entry.module}"):
+                    provisioner = load_provisioner(entry.module, entry.cls)
+                provisioner.call_make_implementors(overwrite=True)
+                #- only once it worked; a failed provisioner is tried again on next use
+                self._provisioned.add(root_nsid)
+            finally:
+                self._in_progress.discard(root_nsid)
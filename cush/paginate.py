@@ -0,0 +1,190 @@
+"""
+streaming of paginated AWS calls over the implementors below an nsid
+
+A botocore paginator is driven on each active client implementor below an nsid, on
+the threads of a FanoutExecutor (so with its per region and per credential limits).
+Every page is handed to the reader through a bounded queue as soon as it arrives, so
+the pages of all the regions are interleaved, the first items are there after one
+round-trip, and no more than a few pages are held in memory at a time: a paginator
+waits for the reader when the queue is full.
+
+The reader can stop at any time, eg. after the first 100 matches; the paginators stop
+at their next page.
+"""
+from logging import getLogger, LoggerAdapter
+logger = getLogger(__name__)
+
+import copy
+import queue
+import threading
+
+import cush.defaults as defaults
+from cush.fanout import FanoutExecutor
+
+
+
+#- put on the queue by the fan-out thread once every paginator has finished
+_done = object()
+
+
+
+class PaginatedStream(object):
+    """
+    Description:
+        the items of the pages of one paginated operation on many client implementors,
+        as an iterator of (implementor nsid, item) in the order they arrive
+    """
+    def __init__(self, implementors, operation, search=None, where=None, limit=None,
+            queue_pages=defaults.stream_queue_pages, executor=None, **kwargs):
+        """
+        Input:
+            implementors: iterable of (nsid, client implementor)
+            operation: name of the paginated client method; eg. 'describe_instances'
+            search: JMESPath expression picking the items out of each page, eg.
+                'Reservations[].Instances[]'; defaults to the paginator's result keys
+            where: function of an item; only the items it returns True for are yielded
+            limit: stop after this many items
+            queue_pages: pages waiting to be read before the paginators wait
+            executor: FanoutExecutor the paginators run on; its timeout is not used
+            kwargs: passed to paginate(); eg. Filters, PaginationConfig
+        """
+        self.implementors = list(implementors)
+        self.operation = operation
+        self.search = search
+        self.where = where
+        self.limit = limit
+        self.kwargs = kwargs
+        self.executor = executor if executor is not None else FanoutExecutor()
+        #- FanoutResults of the paginators that failed
+        self.errors = list()
+        #- number of pages read from AWS, and of items yielded
+        self.pages = 0
+        self.count = 0
+        self._pages_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max(1, queue_pages))
+        self._stop = threading.Event()
+        self._thread = None
+
+
+    def __iter__(self):
+        log = LoggerAdapter(logger, {'name_ext' : 'PaginatedStream.__iter__'})
+        if self._thread is not None:
+            raise RuntimeError("a PaginatedStream can only be read once")
+        if self.limit is not None and self.limit <= 0:
+            return
+        self._thread = threading.Thread(target=self._fanout, name='cush-paginate',\
+            daemon=True)
+        self._thread.start()
+        try:
+            while True:
+                entry = self._queue.get()
+                if entry is _done:
+                    break
+                nsid, items = entry
+                for item in items:
+                    if self.where is not None and not self.where(item):
+                        continue
+                    self.count += 1
+                    yield (nsid, item)
+                    if self.limit is not None and self.count >= self.limit:
+                        log.debug(f"{self.operation}: stopping after {self.count} items")
+                        return
+        finally:
+            #- also reached when the reader stops reading early
+            self.close()
+
+
+    def close(self):
+        """
+        Description:
+            stop the paginators at their next page
+        """
+        self._stop.set()
+
+
+    def _fanout(self):
+        log = LoggerAdapter(logger, {'name_ext' : 'PaginatedStream._fanout'})
+        #- a paginator runs for as long as it is read from
+        executor = copy.copy(self.executor)
+        executor.timeout = None
+        jobs = [(nsid, (nsid, implementor)) for nsid, implementor in self.implementors]
+        try:
+            for result in executor.map(jobs, lambda job: self._paginate(*job)):
+                if not result.ok:
+                    self.errors.append(result)
+        finally:
+            log.debug(f"{self.operation}: {self.pages} pages from {len(jobs)} implementors,"\
+                f" {len(self.errors)} failed")
+            self._put(_done, wait_for_stop=False)
+
+
+    def _paginate(self, nsid, implementor):
+        """
+        Description:
+            read the pages of the operation from one implementor into the queue
+
+        Output:
+            number of pages read
+        """
+        from jmespath import compile as compile_jmespath
+        paginator = implementor.get_paginator(self.operation)
+        page_iterator = paginator.paginate(**self.kwargs)
+        if self.search is not None:
+            expressions = [compile_jmespath(self.search)]
+        else:
+            expressions = getattr(page_iterator, 'result_keys', None) or list()
+
+        pages = 0
+        for page in page_iterator:
+            if self._stop.is_set():
+                break
+            pages += 1
+            with self._pages_lock:
+                self.pages += 1
+            if expressions:
+                items = list()
+                for expression in expressions:
+                    found = expression.search(page)
+                    if isinstance(found, list):
+                        items.extend(found)
+                    elif found is not None:
+                        items.append(found)
+            else:
+                items = [page]
+            if not self._put((nsid, items)):
+                break
+        return pages
+
+
+    def _put(self, entry, wait_for_stop=True):
+        """
+        Description:
+            put entry on the queue, waiting while it is full, unless the reader stopped
+
+        Output:
+            False if the reader stopped reading
+        """
+        while True:
+            if wait_for_stop and self._stop.is_set():
+                return False
+            try:
+                self._queue.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                if not wait_for_stop and self._stop.is_set():
+                    #- nobody is reading anymore
+                    return False
+
+
+
+def paginate(nsid, operation, app_name='default', **kwargs):
+    """
+    Description:
+        stream the items of a paginated operation on every active client implementor
+        below nsid; see CushApplication.paginate()
+
+    Output:
+        PaginatedStream of (implementor nsid, item)
+    """
+    from cush import get_cush
+    return get_cush(app_name).paginate(nsid, operation, **kwargs)
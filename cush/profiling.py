@@ -0,0 +1,301 @@
+"""
+startup profiler for init_cush
+
+While a StartupProfiler is active, the phases of cush initialization (config file
+loads, namespace parses, implementor module imports and implementor provisioners)
+record their wall time, CPU time, memory allocations and the change in the number of
+live objects. Outside of a profiled init_cush, phase() is a no-op.
+
+Memory and object counts are process-wide, so phases that run at the same time (eg.
+provisioners on the provisioner thread pool) also see each other's allocations. Use
+provisioner_max_workers=1 for exact per-provisioner numbers. CPU time is per-thread and
+is always exact.
+"""
+from logging import getLogger
+logger = getLogger(__name__)
+
+import contextlib
+import gc
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import cush.defaults as defaults
+
+
+
+class PhaseProfile(object):
+    """
+    Description:
+        measurements of one profiled phase
+    """
+    def __init__(self, name, parent=None, depth=0, thread_name=None):
+        self.name = name
+        self.parent = parent
+        self.depth = depth
+        self.thread_name = thread_name
+        self.start = None           #- seconds since the profiler was started
+        self.wall_time = None
+        self.cpu_time = None
+        self.alloc_bytes = None     #- net bytes allocated (None without tracemalloc)
+        self.alloc_blocks = None    #- net memory blocks allocated
+        self.object_count = None    #- net change in objects tracked by the gc
+        self.error = None
+
+
+    def as_data(self):
+        return dict(name=self.name, parent=self.parent, depth=self.depth,
+            thread=self.thread_name, start=self.start, wall_time=self.wall_time,
+            cpu_time=self.cpu_time, alloc_bytes=self.alloc_bytes,
+            alloc_blocks=self.alloc_blocks, object_count=self.object_count,
+            error=self.error)
+
+
+    def __repr__(self):
+        return "PhaseProfile(name={}, wall_time={:.6f}, cpu_time={:.6f}, alloc_bytes={})".format(
+            self.name, self.wall_time or 0, self.cpu_time or 0, self.alloc_bytes)
+
+
+
+class ProfileReport(object):
+    """
+    Description:
+        the phases recorded by a StartupProfiler, in the order they started
+    """
+    def __init__(self, phases, wall_time=None, peak_alloc_bytes=None):
+        self.phases = list(phases)
+        self.wall_time = wall_time
+        self.peak_alloc_bytes = peak_alloc_bytes
+
+
+    def find(self, prefix):
+        """
+        Description:
+            the phases whose name starts with prefix
+        """
+        return [x for x in self.phases if x.name.startswith(prefix)]
+
+
+    def top(self, n=10, key='wall_time'):
+        """
+        Description:
+            the n phases with the largest value of key
+        """
+        return sorted(self.phases, key=lambda x: getattr(x, key) or 0, reverse=True)[:n]
+
+
+    def as_data(self):
+        return dict(wall_time=self.wall_time, peak_alloc_bytes=self.peak_alloc_bytes,
+            phases=[x.as_data() for x in self.phases])
+
+
+    def save(self, path):
+        """
+        Description:
+            write the report as JSON
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wt') as fp:
+            json.dump(self.as_data(), fp, indent=2)
+
+
+    def format(self):
+        """
+        Description:
+            the report as an indented text table
+        """
+        lines = ["{:>10} {:>10} {:>12} {:>9}  {}".format(
+            'wall ms', 'cpu ms', 'alloc KiB', 'objects', 'phase')]
+        for phase in self.phases:
+            alloc = '-' if phase.alloc_bytes is None else "{:.1f}".format(phase.alloc_bytes / 1024)
+            objects = '-' if phase.object_count is None else str(phase.object_count)
+            lines.append("{:>10.2f} {:>10.2f} {:>12} {:>9}  {}{}".format(
+                (phase.wall_time or 0) * 1000, (phase.cpu_time or 0) * 1000, alloc, objects,
+                '  ' * phase.depth, phase.name))
+        if self.wall_time is not None:
+            lines.append("total: {:.2f} ms".format(self.wall_time * 1000))
+        return '\n'.join(lines)
+
+
+    def __repr__(self):
+        return "ProfileReport({} phases, wall_time={})".format(len(self.phases), self.wall_time)
+
+
+
+class StartupProfiler(object):
+    """
+    Description:
+        records a PhaseProfile for every phase() entered while it is active
+    """
+    def __init__(self, trace_allocations=True, count_objects=True):
+        """
+        Input:
+            trace_allocations: measure allocated bytes with tracemalloc (slows down
+                everything being profiled)
+            count_objects: count the objects tracked by the gc before and after each
+                phase. Counting is left out of the phase's own timings, but not out of
+                the timings of the phases around it.
+        """
+        self.trace_allocations = trace_allocations
+        self.count_objects = count_objects
+        self.phases = list()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started_tracemalloc = False
+        self._start = None
+        self._end = None
+        self._peak_alloc_bytes = None
+
+
+    def start(self):
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._start = time.perf_counter()
+        self._end = None
+
+
+    def stop(self):
+        self._end = time.perf_counter()
+        self._peak_alloc_bytes = None
+        if tracemalloc.is_tracing():
+            self._peak_alloc_bytes = tracemalloc.get_traced_memory()[1]
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+
+    def _get_stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = list()
+            return self._local.stack
+
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Description:
+            profile the code run inside the with block as one phase
+        """
+        stack = self._get_stack()
+        record = PhaseProfile(name, parent=stack[-1].name if stack else None,
+            depth=len(stack), thread_name=threading.current_thread().name)
+        with self._lock:
+            self.phases.append(record)
+        stack.append(record)
+
+        objects_before = len(gc.get_objects()) if self.count_objects else None
+        tracing = tracemalloc.is_tracing()
+        alloc_before = tracemalloc.get_traced_memory()[0] if tracing else None
+        blocks_before = sys.getallocatedblocks()
+        cpu_start = time.thread_time()
+        wall_start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as err:
+            record.error = repr(err)
+            raise
+        finally:
+            record.wall_time = time.perf_counter() - wall_start
+            record.cpu_time = time.thread_time() - cpu_start
+            record.start = wall_start - self._start if self._start is not None else 0.0
+            record.alloc_blocks = sys.getallocatedblocks() - blocks_before
+            if tracing and tracemalloc.is_tracing():
+                record.alloc_bytes = tracemalloc.get_traced_memory()[0] - alloc_before
+            if self.count_objects:
+                record.object_count = len(gc.get_objects()) - objects_before
+            stack.pop()
+
+
+    def report(self):
+        """
+        Description:
+            ProfileReport of the phases recorded so far
+        """
+        end = self._end if self._end is not None else time.perf_counter()
+        wall_time = end - self._start if self._start is not None else None
+        with self._lock:
+            phases = sorted(self.phases, key=lambda x: x.start if x.start is not None else 0)
+        return ProfileReport(phases, wall_time=wall_time,
+            peak_alloc_bytes=self._peak_alloc_bytes)
+
+
+
+#- the profiler phase() records into; None when not profiling
+_active_profiler = None
+_last_report = None
+
+
+def phase(name):
+    """
+    Description:
+        context manager that profiles its block as a phase of the active profiler, or
+        does nothing when no profiler is active
+    """
+    profiler = _active_profiler
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.phase(name)
+
+
+def start_profiling(**kwargs):
+    """
+    Description:
+        start a StartupProfiler and make it the active profiler
+
+    Input:
+        kwargs: passed to StartupProfiler
+
+    Output:
+        the StartupProfiler
+    """
+    global _active_profiler
+    profiler = StartupProfiler(**kwargs)
+    profiler.start()
+    _active_profiler = profiler
+    return profiler
+
+
+def stop_profiling():
+    """
+    Description:
+        stop the active profiler
+
+    Output:
+        ProfileReport, or None if nothing was being profiled
+    """
+    global _active_profiler, _last_report
+    profiler = _active_profiler
+    if profiler is None:
+        return None
+    _active_profiler = None
+    profiler.stop()
+    _last_report = profiler.report()
+    return _last_report
+
+
+def get_last_report():
+    """
+    Description:
+        the ProfileReport of the last profiled run
+    """
+    return _last_report
+
+
+def profiling_requested(env=os.environ):
+    """
+    Description:
+        True if profiling was turned on with the environment variable
+    """
+    return env.get(defaults.profile_env_var, '').lower() not in ('', '0', 'no', 'false')
+
+
+def get_report_path(app_name='default'):
+    #- cush.util profiles its YAML loads; import here to avoid an import cycle
+    from cush.util import filename_to_fullpath
+    return filename_to_fullpath(defaults.cache_dir, f"{app_name}.{defaults.profile_file}")
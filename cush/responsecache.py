@@ -0,0 +1,253 @@
+"""
+cache of the responses of sdk namespace calls
+
+An sdk namespace call goes to a provider, which calls every active implementor below
+it, which calls AWS. Exploring interactively, the same describe / list query is often
+made again seconds later; with a TTL configured for it in sdk_ns.yaml, its response is
+kept and handed out again until the TTL runs out:
+
+    aws:
+        ec2:
+            instances:
+                __call__:
+                    provider: nsid-ref://.provider.boto3.aws.ec2.instances.get
+                    cache_ttl: 60
+
+Only configure a TTL for calls that do not change anything. Responses are keyed by the
+provider called, the arguments, and the epoch of the application's flipswitch graph,
+which changes whenever implementors (so credentials and regions) are added, removed or
+switched on or off. The cache is bounded in number of responses and in (estimated)
+bytes; the least recently used responses are evicted first.
+
+A call can skip the cache with cache_bypass=True, or replace the cached response with
+a new one with cache_refresh=True. Cached responses are shared; do not modify them.
+"""
+from logging import getLogger, LoggerAdapter
+logger = getLogger(__name__)
+
+import collections
+import sys
+import threading
+import time
+
+import cush.defaults as defaults
+
+
+
+def estimate_size(obj, max_objects=100000):
+    """
+    Description:
+        rough number of bytes obj and the objects it holds take, following containers
+        and instance dicts. Stops counting after max_objects objects.
+    """
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack and len(seen) < max_objects:
+        x = stack.pop()
+        if id(x) in seen:
+            continue
+        seen.add(id(x))
+        size += sys.getsizeof(x, 64)
+        if isinstance(x, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        if isinstance(x, dict):
+            stack.extend(x.keys())
+            stack.extend(x.values())
+        elif isinstance(x, (list, tuple, set, frozenset, collections.deque)):
+            stack.extend(x)
+        elif hasattr(x, '__dict__') and not isinstance(x, type):
+            stack.append(vars(x))
+    return size
+
+
+
+def make_key(*args, **kwargs):
+    """
+    Description:
+        hashable key of call arguments; arguments that are not hashable (eg. lists of
+        filters) are keyed by their repr
+    """
+    def freeze(x):
+        if isinstance(x, dict):
+            return ('__dict__',) + tuple(sorted(((k, freeze(v)) for k,v in x.items()),\
+                key=lambda kv: repr(kv[0])))
+        if isinstance(x, (list, tuple)):
+            return (type(x).__name__,) + tuple(freeze(v) for v in x)
+        try:
+            hash(x)
+        except TypeError:
+            return repr(x)
+        return x
+    return (freeze(args), freeze(kwargs))
+
+
+
+class ResponseCache(object):
+    """
+    Description:
+        responses by key, each until its TTL runs out, in least recently used order
+    """
+    def __init__(self, max_entries=defaults.sdk_cache_max_entries,
+            max_bytes=defaults.sdk_cache_max_bytes, clock=time.monotonic):
+        """
+        Input:
+            max_entries: maximum number of responses kept
+            max_bytes: maximum estimated size of the responses kept
+            clock: function returning the current time in seconds
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        #- key -> (expires at, size, response), least recently used first
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        #- number of 'hits', 'misses', 'bypasses', 'refreshes', 'evictions' and
+        #- 'uncacheable' (larger than max_bytes) responses
+        self.stats = collections.Counter()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    @property
+    def size(self):
+        """
+        Description:
+            estimated bytes of the responses kept
+        """
+        return self._bytes
+
+
+    def get(self, key):
+        """
+        Output:
+            (True, response) if a response for key is kept and has not expired, else
+            (False, None)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return (False, None)
+            expires, size, response = entry
+            if expires <= self.clock():
+                self._drop(key)
+                return (False, None)
+            self._entries.move_to_end(key)
+            return (True, response)
+
+
+    def put(self, key, response, ttl):
+        """
+        Description:
+            keep response for ttl seconds, evicting the least recently used responses
+            to make room for it
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'ResponseCache.put'})
+        size = estimate_size(response)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                log.debug(f"not caching a response of about {size} bytes: {key}")
+                self.stats['uncacheable'] += 1
+                return
+            self._entries[key] = (self.clock() + ttl, size, response)
+            self._bytes += size
+            now = self.clock()
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest, (expires, *_) = next(iter(self._entries.items()))
+                self._drop(oldest)
+                if expires > now:
+                    self.stats['evictions'] += 1
+
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+    def invalidate(self, match=None):
+        """
+        Description:
+            drop the responses whose keys match; all of them by default
+
+        Input:
+            match: function of a key returning True for the responses to drop
+        """
+        with self._lock:
+            for key in [x for x in self._entries if match is None or match(x)]:
+                self._drop(key)
+
+
+    def call(self, name, fn, ttl, args, kwargs, key_extra=None, bypass=False, refresh=False):
+        """
+        Description:
+            fn(*args, **kwargs), from the cache if a response is kept for the call
+
+        Input:
+            name: name of what fn calls; the first part of the key
+            fn: function making the call
+            ttl: seconds to keep the response for
+            args, kwargs: arguments of the call
+            key_extra: more of the key, eg. the flipswitch epoch
+            bypass: call fn and do not cache its response
+            refresh: call fn and replace the kept response with its response
+        """
+        if bypass:
+            self.stats['bypasses'] += 1
+            return fn(*args, **kwargs)
+        key = (name, key_extra, make_key(*args, **kwargs))
+        if refresh:
+            self.stats['refreshes'] += 1
+        else:
+            hit, response = self.get(key)
+            if hit:
+                self.stats['hits'] += 1
+                return response
+            self.stats['misses'] += 1
+        response = fn(*args, **kwargs)
+        self.put(key, response, ttl)
+        return response
+
+
+
+class CachedCall(object):
+    """
+    Description:
+        the __call__ of an sdk namespace node, going through a ResponseCache
+    """
+    def __init__(self, fn, name, ttl, cache, get_key_extra=None):
+        """
+        Input:
+            fn: the provider to call
+            name: name the responses are kept under; eg. the provider's nsid
+            ttl: seconds to keep the responses for
+            cache: ResponseCache
+            get_key_extra: function returning more of the key at the time of a call
+        """
+        self.fn = fn
+        self.name = name
+        self.ttl = ttl
+        self.cache = cache
+        self.get_key_extra = get_key_extra
+
+
+    def __call__(self, *args, cache_bypass=False, cache_refresh=False, **kwargs):
+        key_extra = self.get_key_extra() if self.get_key_extra is not None else None
+        return self.cache.call(self.name, self.fn, self.ttl, args, kwargs,\
+            key_extra=key_extra, bypass=cache_bypass, refresh=cache_refresh)
+
+
+    def invalidate(self):
+        """
+        Description:
+            drop the cached responses of this call
+        """
+        self.cache.invalidate(lambda key: key[0] == self.name)
+
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name}, ttl={self.ttl})"
@@ -0,0 +1,323 @@
+"""
+warm-start snapshot of a provisioned cush application
+
+Holds what a cold init_cush spends its time on: the parsed namespace configs, the
+provisioner graph and the nsids of every implementor. It is keyed by a fingerprint of
+the config files and the implementor sources, so any change to either causes a cold
+start.
+
+Restoring puts a lazy node at every recorded implementor nsid. The first time one of
+them is used, its provisioner module is imported and the provisioner (and the ones it
+depends on) is run for real, replacing the lazy nodes with the real implementors.
+
+With lazy_implementors, most provisioners have not run when the snapshot is taken.
+They are recorded without implementors, and restored as a placeholder at their root
+nsid that runs them on first use, like LazyProvisionerLoader does.
+"""
+from logging import getLogger, LoggerAdapter
+logger = getLogger(__name__)
+
+import hashlib
+import os
+import pickle
+import threading
+from collections.abc import Mapping
+
+from thewired import NamespaceLookupError
+
+import cush.defaults as defaults
+from cush.util import filename_to_fullpath, bulk_add_nodes
+from cush.implementorlib.lazy import LazyImplementor, LazyImplementorNode
+from cush.implementorlib.load import load_provisioner
+from cush.implementorlib.manifest import LazySubtreeNode, nsids_overlap
+
+
+
+def to_plain_data(obj):
+    """
+    Description:
+        copy parsed YAML into plain dicts and lists so it pickles small and does not
+        depend on the YAML library's types
+    """
+    if isinstance(obj, Mapping):
+        return {k : to_plain_data(v) for k,v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_plain_data(x) for x in obj]
+    return obj
+
+
+
+def get_fingerprint(config_files=None, config_dir=defaults.config_dir, source_paths=None):
+    """
+    Description:
+        fingerprint of everything a snapshot depends on
+
+    Input:
+        config_files: config file names in config_dir; defaults to all the namespace
+            config files
+        source_paths: directories whose .py files are part of the fingerprint;
+            defaults to the implementor package
+
+    Output:
+        hex digest string
+    """
+    if config_files is None:
+        config_files = [defaults.user_file, defaults.defaults_ns_file,
+            defaults.params_ns_file, defaults.providers_ns_file, defaults.sdk_ns_file]
+    if source_paths is None:
+        import cush.implementor
+        source_paths = list(cush.implementor.__path__)
+
+    paths = [filename_to_fullpath(config_dir, x) for x in config_files]
+    for source_path in source_paths:
+        for dirpath, dirnames, filenames in os.walk(source_path):
+            dirnames.sort()
+            paths.extend(os.path.join(dirpath, x) for x in sorted(filenames) if x.endswith('.py'))
+
+    digest = hashlib.sha256(str(SnapshotFormat.version).encode())
+    for path in paths:
+        try:
+            st = os.stat(path)
+            digest.update(f"{path}:{st.st_mtime_ns}:{st.st_size}\n".encode())
+        except FileNotFoundError:
+            digest.update(f"{path}:missing\n".encode())
+    return digest.hexdigest()
+
+
+
+class SnapshotFormat(object):
+    #- bump when the pickled layout changes
+    version = 1
+
+
+
+class SnapshotImplementor(LazyImplementor):
+    """
+    Description:
+        LazyImplementor for an implementor restored from a snapshot
+    """
+    pass
+
+
+
+class ProvisioningSnapshot(object):
+    """
+    Description:
+        Parsed configs, provisioner graph and implementor nsids of a cush application
+    """
+    def __init__(self, fingerprint, configs=None, provisioners=None):
+        """
+        Input:
+            fingerprint: get_fingerprint() of the inputs this snapshot was taken from
+            configs: dict of config file name -> parsed config
+            provisioners: dict of provisioner root nsid -> dict with keys:
+                module, cls: where the provisioner class is defined
+                deps: root nsids of the provisioners it depends on
+                implementors: nsids (below .implementor) of the implementors it made;
+                    None if it had not run yet (see LazyProvisionerLoader)
+        """
+        self.fingerprint = fingerprint
+        self.configs = dict() if configs is None else configs
+        self.provisioners = dict() if provisioners is None else provisioners
+
+        #- restore state; not pickled
+        self._app = None
+        self._provisioned = set()
+        self._in_progress = set()
+        self._provision_lock = threading.RLock()
+
+
+    def as_data(self):
+        """
+        Description:
+            the snapshot as plain python data; this is what is written to disk
+        """
+        return dict(version=SnapshotFormat.version, fingerprint=self.fingerprint,\
+            configs=self.configs, provisioners=self.provisioners)
+
+
+    @staticmethod
+    def get_path(app_name='default'):
+        return filename_to_fullpath(defaults.cache_dir,\
+            f"{app_name}.{defaults.snapshot_file}")
+
+
+    @classmethod
+    def load(cls, fingerprint, path):
+        """
+        Description:
+            load a snapshot if there is one for this fingerprint
+
+        Output:
+            ProvisioningSnapshot, or None if there is no usable snapshot
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'ProvisioningSnapshot.load'})
+        try:
+            with open(path, 'rb') as fp:
+                state = pickle.load(fp)
+        except FileNotFoundError:
+            log.debug(f"no snapshot at {path}")
+            return None
+        except Exception as err:
+            log.warning(f"ignoring unreadable snapshot {path}: {err}")
+            return None
+
+        if not isinstance(state, dict) or state.get('version') != SnapshotFormat.version:
+            log.info(f"ignoring snapshot with a different format: {path}")
+            return None
+        if state.get('fingerprint') != fingerprint:
+            log.info("config or implementor sources changed; ignoring snapshot")
+            return None
+
+        return cls(state['fingerprint'], state['configs'], state['provisioners'])
+
+
+    def save(self, path):
+        """
+        Description:
+            atomically write the snapshot, readable only by the current user (the user
+            config, including credentials, is part of it)
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'ProvisioningSnapshot.save'})
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as fp:
+            pickle.dump(self.as_data(), fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        log.debug(f"saved snapshot: {path}")
+
+
+    @classmethod
+    def capture(cls, fingerprint, configs, provisioners, pending=None):
+        """
+        Description:
+            take a snapshot of a provisioned application
+
+        Input:
+            configs: dict of config file name -> parsed config
+            provisioners: ImplementorProvisioner instances that have been run
+            pending: provisioners that have not run yet, as returned by
+                LazyProvisionerLoader.pending_specs()
+        """
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+
+        provisioners = list(provisioners)
+        graph = ImplementorProvisioner.make_provisioner_graph(provisioners)
+        provisioner_specs = dict()
+        for provisioner in provisioners:
+            provisioner_specs[provisioner.root_nsid] = dict(
+                module=type(provisioner).__module__,
+                cls=type(provisioner).__qualname__,
+                deps=[x.root_nsid for x in graph.dependencies(provisioner)],
+                implementors=list(provisioner.implementor_nsids))
+
+        for root_nsid, spec in (pending or dict()).items():
+            provisioner_specs.setdefault(root_nsid, spec)
+
+        configs = {k : to_plain_data(v) for k,v in configs.items()}
+        return cls(fingerprint, configs, provisioner_specs)
+
+
+    def pending_roots(self):
+        """
+        Description:
+            root nsids of the provisioners recorded without implementors
+        """
+        return [k for k,v in self.provisioners.items() if v['implementors'] is None]
+
+
+    def restore_implementors(self, app):
+        """
+        Description:
+            add a lazy node for every implementor in the snapshot to the implementor
+            namespace of app
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'ProvisioningSnapshot.restore_implementors'})
+        log.debug("Entering")
+        self._app = app
+        roots = list(self.provisioners)
+        nodes = list()
+        for root_nsid, spec in self.provisioners.items():
+            if spec['implementors'] is None:
+                if not any(x.startswith(root_nsid + '.') for x in roots):
+                    nodes.append((root_nsid, LazySubtreeNode, self, root_nsid))
+                continue
+            for nsid in spec['implementors']:
+                imp = SnapshotImplementor(self.materialize, root_nsid, nsid)
+                nodes.append((nsid, LazyImplementorNode, imp))
+        from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+        with ImplementorProvisioner._ns_lock:
+            bulk_add_nodes(app._ns.get_handle('.implementor'), nodes)
+            app.invalidate_leaf_index('.implementor')
+        log.info(f"restored {len(nodes)} implementors from {len(self.provisioners)} provisioners")
+        log.debug("Exiting")
+
+
+    def provision(self, root_nsid):
+        """
+        Description:
+            run the provisioner with this root nsid, and the ones it depends on, for real
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'ProvisioningSnapshot.provision'})
+        with self._provision_lock:
+            #- a dependency cycle falls back on whatever exists so far
+            if root_nsid in self._provisioned or root_nsid in self._in_progress:
+                return
+            spec = self.provisioners[root_nsid]
+            self._in_progress.add(root_nsid)
+            try:
+                for dep in spec['deps']:
+                    if dep in self.provisioners:
+                        self.provision(dep)
+
+                log.info(f"provisioning {root_nsid} from {spec['module']}.{spec['cls']}")
+                provisioner = load_provisioner(spec['module'], spec['cls'])
+                provisioner.call_make_implementors(overwrite=True)
+                self._provisioned.add(root_nsid)
+            finally:
+                self._in_progress.discard(root_nsid)
+
+
+    def is_provisioned(self, root_nsid):
+        return root_nsid in self._provisioned
+
+
+    def pending_specs(self):
+        """
+        Description:
+            the recorded provisioners that have not run since the restore, so that a
+            snapshot of a warm start can record them again
+        """
+        with self._provision_lock:
+            return {k : v for k,v in self.provisioners.items() if k not in self._provisioned}
+
+
+    def ensure_provisioned(self, nsid):
+        """
+        Description:
+            run the provisioners recorded without implementors whose implementors are
+            at, above or below nsid; the ones recorded with implementors run when one
+            of their implementors is first used
+
+        Input:
+            nsid: implementor nsid (below .implementor)
+        """
+        nsid = str(nsid).rstrip('.')
+        for root_nsid in self.pending_roots():
+            if nsid in ('', '.') or nsids_overlap(nsid, root_nsid):
+                self.provision(root_nsid)
+
+
+    def materialize(self, root_nsid, nsid):
+        """
+        Description:
+            LazyImplementor factory for restored implementors: provision for real, then
+            return the real implementor at nsid
+        """
+        self.provision(root_nsid)
+        node = self._app._ns.get(f".implementor{nsid}")
+        if isinstance(getattr(node, '_lazy_spec', None), SnapshotImplementor):
+            msg = f"provisioner {root_nsid} no longer makes implementor {nsid}"
+            raise NamespaceLookupError(msg)
+        return node._delegate
@@ -0,0 +1,435 @@
+"""
+cache of the temporary credentials of assumed IAM roles
+
+Assuming a role is an STS round-trip. The credentials it returns are kept, keyed by
+role ARN, source credential and role session name, until shortly before they expire,
+and are written to a file (readable only by the current user) so every cush process
+can use them. Credentials that are about to expire are refreshed in the background
+while the current ones are still handed out, so a role in use never waits for STS
+again after the first time.
+
+Credentials assumed with an MFA token code are cached but not refreshed ahead: a new
+code is needed for that.
+"""
+from logging import getLogger, LoggerAdapter
+logger = getLogger(__name__)
+
+import collections
+import contextlib
+import datetime
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    #- no advisory locks on this platform; concurrent saves may lose each other's entries
+    fcntl = None
+
+import cush.defaults as defaults
+from cush.util import filename_to_fullpath
+from cush.user import AwsCredential
+
+
+
+class StsError(RuntimeError):
+    pass
+
+
+
+#- error codes of STS (and AWS APIs in general) turning requests down for their rate
+_throttling_codes = frozenset(['Throttling', 'ThrottlingException', 'RequestLimitExceeded',
+    'TooManyRequestsException', 'RequestThrottled', 'SlowDown'])
+
+def is_throttled(err):
+    """
+    Description:
+        whether an exception raised by a botocore client is a throttling error
+    """
+    response = getattr(err, 'response', None)
+    if not isinstance(response, dict):
+        return False
+    return response.get('Error', dict()).get('Code') in _throttling_codes
+
+
+
+def _to_timestamp(expiration):
+    """
+    Description:
+        seconds since the epoch of an STS credential expiration, which boto returns
+        as a datetime and a stand-in may return as an ISO 8601 string
+    """
+    if isinstance(expiration, datetime.datetime):
+        return expiration.timestamp()
+    if isinstance(expiration, str):
+        return datetime.datetime.fromisoformat(expiration.replace('Z', '+00:00')).timestamp()
+    return float(expiration)
+
+
+
+def make_sts_client(source_creds, endpoint_url=None):
+    """
+    Description:
+        STS client using the source credentials
+
+    Input:
+        source_creds: object with access_key_id, secret_access_key and optionally
+            session_token attributes
+        endpoint_url: STS endpoint; defaults to defaults.sts_endpoint_url, then AWS's
+    """
+    from botocore.config import Config
+    from cush.implementor.default.boto3.aws.sharedcomponents import get_shared_components
+    session = get_shared_components().make_session(
+        aws_access_key_id=source_creds.access_key_id,
+        aws_secret_access_key=source_creds.secret_access_key,
+        aws_session_token=getattr(source_creds, 'session_token', None))
+    #- throttled calls are retried by StsCredentialCache, with its own backoff
+    config = Config(retries=dict(mode='standard', total_max_attempts=1))
+    return session.client('sts', endpoint_url=endpoint_url or defaults.sts_endpoint_url,\
+        config=config)
+
+
+
+class StsCredentialCache(object):
+    """
+    Description:
+        assumed role credentials, in memory and in a file shared by cush processes
+    """
+    #- bump when the file layout changes
+    version = 1
+
+    def __init__(self, path=None, duration=defaults.sts_duration,
+            expiry_margin=defaults.sts_expiry_margin,
+            refresh_ahead=defaults.sts_refresh_ahead, client_factory=make_sts_client,
+            refresh_workers=defaults.sts_refresh_workers,
+            max_attempts=defaults.sts_max_attempts, backoff_base=defaults.sts_backoff_base,
+            backoff_cap=defaults.sts_backoff_cap, clock=time.time, sleep=time.sleep):
+        """
+        Input:
+            path: file the credentials are saved to; None keeps them in memory only
+            duration: seconds to ask STS for credentials for
+            expiry_margin: credentials with fewer seconds than this left are not used
+            refresh_ahead: credentials with fewer seconds than this left are refreshed
+                in the background
+            client_factory: function of the source credentials returning an STS client
+            refresh_workers: maximum number of background refreshes at the same time
+            max_attempts: attempts at each STS call while it is throttled
+            backoff_base, backoff_cap: seconds of the first and the longest backoff
+                after a throttled call
+            clock: function returning the current time in seconds since the epoch
+            sleep: function sleeping for a number of seconds
+        """
+        self.path = path
+        self.duration = duration
+        self.expiry_margin = expiry_margin
+        self.refresh_ahead = refresh_ahead
+        self.client_factory = client_factory
+        self.refresh_workers = refresh_workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.clock = clock
+        self.sleep = sleep
+        #- number of 'hits', 'misses' (STS called while waiting), 'refreshes' and
+        #- 'throttled' STS calls
+        self.stats = collections.Counter()
+
+        self._entries = dict()      #- key -> credentials dict
+        self._file_stat = None      #- (mtime, size, inode) of the file when last read
+        self._lock = threading.Lock()
+        #- key -> lock held while assuming the role, so it is only assumed once
+        self._key_locks = collections.defaultdict(threading.Lock)
+        self._refreshing = set()
+        self._executor = None
+        #- (access key id, session token) of source credentials -> STS client
+        self._clients = dict()
+
+
+    @staticmethod
+    def make_key(role_arn, source_creds, session_name):
+        return f"{role_arn}|{source_creds.access_key_id}|{session_name}"
+
+
+    def get(self, role_arn, source_creds, session_name, mfa_serial=None, token_code=None,
+            min_remaining=None):
+        """
+        Description:
+            credentials for the role, from the cache if there are unexpired ones;
+            otherwise from STS
+
+        Input:
+            role_arn: ARN of the role to assume
+            source_creds: credentials to assume the role with
+            session_name: role session name
+            mfa_serial: ARN of the MFA device the role needs, if any
+            token_code: current code of the MFA device
+            min_remaining: only use cached credentials with at least this many seconds
+                left (and at least expiry_margin); eg. a refresh by botocore has to
+                get credentials that are not due for a refresh themselves
+
+        Output:
+            AwsCredential
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'StsCredentialCache.get'})
+        key = self.make_key(role_arn, source_creds, session_name)
+        request = (role_arn, source_creds, session_name, mfa_serial, token_code)
+        margin = self.expiry_margin if min_remaining is None\
+            else max(self.expiry_margin, min_remaining)
+
+        entry = self._lookup(key, margin)
+        if entry is not None:
+            if mfa_serial is None and entry['expiration'] - self.clock() < self.refresh_ahead:
+                self._refresh_in_background(key, request)
+            self.stats['hits'] += 1
+            return self._to_credential(entry)
+
+        with self._key_locks[key]:
+            #- another thread may have assumed it while this one waited
+            entry = self._lookup(key, margin)
+            if entry is None:
+                log.debug(f"assuming {role_arn} as {session_name}")
+                entry = self._assume(*request)
+                self._store(key, entry)
+                self.stats['misses'] += 1
+            else:
+                self.stats['hits'] += 1
+        return self._to_credential(entry)
+
+
+    def _usable(self, entry, margin):
+        return entry is not None and entry['expiration'] - self.clock() > margin
+
+
+    def _lookup(self, key, margin):
+        with self._lock:
+            entry = self._entries.get(key)
+            if not self._usable(entry, margin):
+                #- another process may have assumed it
+                self._load()
+                entry = self._entries.get(key)
+        return entry if self._usable(entry, margin) else None
+
+
+    def _assume(self, role_arn, source_creds, session_name, mfa_serial=None, token_code=None):
+        kwargs = dict(RoleArn=role_arn, RoleSessionName=session_name,\
+            DurationSeconds=self.duration)
+        if mfa_serial is not None:
+            kwargs.update(SerialNumber=mfa_serial, TokenCode=token_code)
+        client = self._get_client(source_creds)
+        for attempt in range(self.max_attempts):
+            try:
+                response = client.assume_role(**kwargs)
+                break
+            except Exception as err:
+                if not is_throttled(err) or attempt + 1 == self.max_attempts:
+                    raise
+                self.stats['throttled'] += 1
+                self.sleep(random.uniform(0, min(self.backoff_cap,\
+                    self.backoff_base * 2 ** attempt)))
+        try:
+            creds = response['Credentials']
+            return dict(access_key_id=creds['AccessKeyId'],\
+                secret_access_key=creds['SecretAccessKey'],\
+                session_token=creds['SessionToken'],\
+                expiration=_to_timestamp(creds['Expiration']))
+        except (KeyError, TypeError, ValueError) as err:
+            raise StsError(f"STS did not return valid credentials for {role_arn}: {err!r}")
+
+
+    def _get_client(self, source_creds):
+        #- clients are thread safe; one per source credential is enough
+        key = (source_creds.access_key_id, getattr(source_creds, 'session_token', None))
+        with self._lock:
+            client = self._clients.get(key)
+        if client is None:
+            client = self.client_factory(source_creds)
+            with self._lock:
+                #- chained role sources get a new session token with every refresh
+                if len(self._clients) >= 256:
+                    self._clients.clear()
+                client = self._clients.setdefault(key, client)
+        return client
+
+
+    def get_many(self, requests, max_workers=defaults.sts_bulk_max_workers):
+        """
+        Description:
+            credentials for many roles, with up to max_workers STS calls at the same
+            time
+
+        Input:
+            requests: iterable of dicts of get() arguments
+            max_workers: maximum number of roles assumed at the same time
+
+        Output:
+            list of the AwsCredential, or the exception raised, for each request in
+            order
+        """
+        def get(request):
+            try:
+                return self.get(**request)
+            except Exception as err:
+                return err
+
+        requests = list(requests)
+        if not requests:
+            return list()
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(requests)),\
+                thread_name_prefix='cush-sts-bulk') as executor:
+            return list(executor.map(get, requests))
+
+
+    @staticmethod
+    def _to_credential(entry):
+        return AwsCredential(entry['access_key_id'], entry['secret_access_key'],\
+            session_token=entry['session_token'], expiration=entry['expiration'])
+
+
+    def _refresh_in_background(self, key, request):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.refresh_workers,\
+                    thread_name_prefix='cush-sts-refresh')
+        self._executor.submit(self._refresh, key, request)
+
+
+    def _refresh(self, key, request):
+        log = LoggerAdapter(logger, {'name_ext' : 'StsCredentialCache._refresh'})
+        try:
+            with self._key_locks[key]:
+                entry = self._assume(*request)
+                self._store(key, entry)
+            self.stats['refreshes'] += 1
+            log.debug(f"refreshed {request[0]} as {request[2]}")
+        except Exception as err:
+            #- the current credentials are used until they expire; then get() retries
+            log.warning(f"could not refresh {request[0]}: {err}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+    def wait_for_refreshes(self):
+        """
+        Description:
+            wait until the background refreshes started so far are done
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+    def _load(self):
+        """
+        Description:
+            merge the entries in the file into memory, if it changed since it was last
+            read; call with self._lock held
+        """
+        if self.path is None:
+            return
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        file_stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if file_stat == self._file_stat:
+            return
+        self._merge(self._read())
+        self._file_stat = file_stat
+
+
+    def _read(self):
+        log = LoggerAdapter(logger, {'name_ext' : 'StsCredentialCache._read'})
+        try:
+            with open(self.path, 'rt') as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return dict()
+        except ValueError as err:
+            log.warning(f"ignoring unreadable credential cache {self.path}: {err}")
+            return dict()
+        if not isinstance(data, dict) or data.get('version') != self.version:
+            log.info(f"ignoring credential cache with a different format: {self.path}")
+            return dict()
+        return data.get('credentials', dict())
+
+
+    def _merge(self, entries):
+        #- of two entries for the same key, the one that expires last wins
+        for key, entry in entries.items():
+            current = self._entries.get(key)
+            if current is None or entry['expiration'] > current['expiration']:
+                self._entries[key] = entry
+
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._save()
+
+
+    def _save(self):
+        """
+        Description:
+            write the unexpired entries, merged with the ones other processes wrote,
+            to the file; call with self._lock held
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'StsCredentialCache._save'})
+        if self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+            with self._locked_file():
+                self._merge(self._read())
+                now = self.clock()
+                for key in [k for k,v in self._entries.items() if v['expiration'] <= now]:
+                    del self._entries[key]
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, 'wt') as fp:
+                    json.dump(dict(version=self.version, credentials=self._entries), fp)
+                os.replace(tmp_path, self.path)
+                st = os.stat(self.path)
+                self._file_stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError as err:
+            log.warning(f"could not save credential cache {self.path}: {err}")
+
+
+    @contextlib.contextmanager
+    def _locked_file(self):
+        #- the file itself is replaced on every save, so the lock is on a file beside it
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(f"{self.path}.lock", os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+
+
+_sts_cache = None
+_sts_cache_lock = threading.Lock()
+
+def get_sts_cache():
+    """
+    Description:
+        get the process-wide StsCredentialCache, creating it on first use
+    """
+    global _sts_cache
+    if _sts_cache is None:
+        with _sts_cache_lock:
+            if _sts_cache is None:
+                _sts_cache = StsCredentialCache(filename_to_fullpath(defaults.cache_dir,\
+                    defaults.sts_credentials_file))
+    return _sts_cache
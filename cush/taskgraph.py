@@ -0,0 +1,240 @@
+"""
+small dependency-graph task runner used to run independent pieces of cush
+initialization (implementor provisioners, namespace init methods) concurrently
+"""
+from logging import getLogger, LoggerAdapter
+logger = getLogger(__name__)
+
+import math
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+
+class TaskGraphCycleError(ValueError):
+    """
+    Description:
+        raised when the declared dependencies between tasks form a cycle
+    """
+    def __init__(self, cycle):
+        self.cycle = list(cycle)
+        super().__init__("dependency cycle: {}".format(' -> '.join(map(str, self.cycle))))
+
+
+
+class TaskTiming(object):
+    """
+    Description:
+        wall and cpu time of a single task run by a TaskGraph
+    """
+    def __init__(self, name, start, end, cpu_time, thread_name, error=None):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.cpu_time = cpu_time
+        self.thread_name = thread_name
+        self.error = error
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return "TaskTiming(name={}, duration={:.6f}, cpu_time={:.6f}, thread={})".format(
+            self.name, self.duration, self.cpu_time, self.thread_name)
+
+
+
+class TaskGraph(object):
+    """
+    Description:
+        Collection of named tasks and the names of the tasks each one depends on.
+
+        Tasks whose dependencies have all completed are run on a bounded thread pool.
+        When more tasks are ready than there are free workers, the ones with the
+        lowest priority value are started first, so a single worker runs the tasks in
+        dependency order with priority as the tie-breaker.
+    """
+    def __init__(self):
+        self._tasks = dict()        #- name -> callable
+        self._deps = dict()         #- name -> set of names this task waits on
+        self._priority = dict()     #- name -> (priority, insertion index)
+
+
+    def add_task(self, name, func, deps=None, priority=math.inf):
+        """
+        Description:
+            add a task to the graph
+
+        Input:
+            name: hashable, unique name of the task
+            func: callable taking no arguments
+            deps: iterable of names of tasks that must complete before this one starts
+            priority: ordering hint used when several tasks are ready at once
+        """
+        if name in self._tasks:
+            raise ValueError("duplicate task name: {}".format(name))
+        self._tasks[name] = func
+        self._deps[name] = set(deps) if deps else set()
+        self._priority[name] = (priority, len(self._priority))
+
+
+    def __contains__(self, name):
+        return name in self._tasks
+
+
+    def __len__(self):
+        return len(self._tasks)
+
+
+    def dependencies(self, name):
+        return set(self._deps[name])
+
+
+    def dependents(self, name):
+        return set(x for x, deps in self._deps.items() if name in deps)
+
+
+    def check(self):
+        """
+        Description:
+            make sure every dependency is a known task and that there are no cycles
+
+        Output:
+            None; raises ValueError for unknown dependencies and TaskGraphCycleError
+            for cycles
+        """
+        for name, deps in self._deps.items():
+            unknown = deps - self._tasks.keys()
+            if unknown:
+                raise ValueError("task {} depends on unknown tasks: {}".format(name, unknown))
+
+        #- iterative DFS; WHITE=unvisited, GREY=on the current path, BLACK=done
+        WHITE, GREY, BLACK = 0, 1, 2
+        color = dict.fromkeys(self._tasks, WHITE)
+        for start in sorted(self._tasks, key=self._priority.get):
+            if color[start] != WHITE:
+                continue
+            path = [start]
+            stack = [iter(sorted(self._deps[start], key=self._priority.get))]
+            color[start] = GREY
+            while stack:
+                for dep in stack[-1]:
+                    if color[dep] == GREY:
+                        raise TaskGraphCycleError(path[path.index(dep):] + [dep])
+                    if color[dep] == WHITE:
+                        color[dep] = GREY
+                        path.append(dep)
+                        stack.append(iter(sorted(self._deps[dep], key=self._priority.get)))
+                        break
+                else:
+                    color[path.pop()] = BLACK
+                    stack.pop()
+
+
+    def topological_order(self):
+        """
+        Description:
+            the order a single worker would run the tasks in
+        """
+        self.check()
+        remaining = {name: set(deps) for name, deps in self._deps.items()}
+        order = list()
+        while remaining:
+            ready = sorted((x for x, deps in remaining.items() if not deps),\
+                key=self._priority.get)
+            name = ready[0]
+            order.append(name)
+            del remaining[name]
+            for deps in remaining.values():
+                deps.discard(name)
+        return order
+
+
+    def _timed_call(self, name):
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        error = None
+        try:
+            self._tasks[name]()
+        except BaseException as err:
+            error = err
+        timing = TaskTiming(name, start, time.perf_counter(),
+            time.thread_time() - cpu_start, threading.current_thread().name, error)
+        return timing
+
+
+    def run(self, max_workers=None, continue_after_failure=False):
+        """
+        Description:
+            run all the tasks, starting each one as soon as its dependencies are done
+
+        Input:
+            max_workers: size of the thread pool; None uses the ThreadPoolExecutor
+                default
+            continue_after_failure: if True, a failed task only causes the tasks that
+                depend on it to be skipped; otherwise the first failure is re-raised once
+                the tasks already running have finished
+
+        Output:
+            dict of task name -> TaskTiming for every task that was run
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'TaskGraph.run'})
+        log.debug("Entering: {} tasks | {}".format(len(self._tasks), max_workers))
+        self.check()
+
+        waiting_on = {name: set(deps) for name, deps in self._deps.items()}
+        timings = dict()
+        skipped = set()
+        first_error = None
+
+        with ThreadPoolExecutor(max_workers=max_workers,\
+            thread_name_prefix='cush-taskgraph') as executor:
+
+            running = dict()    #- future -> name
+            ready = [x for x, deps in waiting_on.items() if not deps]
+            for name in ready:
+                del waiting_on[name]
+
+            while ready or running:
+                if first_error is None:
+                    for name in sorted(ready, key=self._priority.get):
+                        running[executor.submit(self._timed_call, name)] = name
+                ready = list()
+
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    timing = future.result()
+                    timings[name] = timing
+                    log.debug("finished: {}".format(timing))
+
+                    if timing.error is not None:
+                        log.error("task failed: {}: {}".format(name, timing.error))
+                        if not continue_after_failure:
+                            first_error = first_error or timing.error
+                        #- nothing downstream of a failed task can run
+                        dependents = [name]
+                        while dependents:
+                            for x in self.dependents(dependents.pop()):
+                                if x in waiting_on:
+                                    del waiting_on[x]
+                                    skipped.add(x)
+                                    dependents.append(x)
+                        continue
+
+                    for x, deps in list(waiting_on.items()):
+                        deps.discard(name)
+                        if not deps:
+                            del waiting_on[x]
+                            ready.append(x)
+
+        if skipped:
+            log.warning("skipped tasks after failure: {}".format(skipped))
+        if first_error is not None:
+            raise first_error
+        log.debug("Exiting")
+        return timings
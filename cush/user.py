@@ -1,3 +1,5 @@
+import threading
+
 import cush.defaults as defaults
 from thewired import NamespaceConfigParser2, NamespaceNodeBase
 
@@ -11,16 +13,20 @@ class AwsCredential(object):
         AWS API Credentials object; just the access key id and secret access key
         strings
     """
-    def __init__(self, access_key_id, secret_access_key, session_token=None):
+    def __init__(self, access_key_id, secret_access_key, session_token=None,
+            expiration=None):
         """
         Input:
             access_key_id: AWS API Access Key ID
             secret_access_key: AWS API Secret Access Key for this Access Key ID
+            session_token: token of temporary credentials
+            expiration: when temporary credentials expire, in seconds since the epoch
         """
         super().__init__()
         self.access_key_id =  access_key_id
         self.secret_access_key = secret_access_key
         self.session_token = session_token
+        self.expiration = expiration
 
     def __str__(self):
         return 'AwsCredential: ' + self.access_key_id
@@ -34,7 +40,7 @@ class AwsRole(object):
         Container object for all the things needed to assume an AWS IAM Role
     """
     def __init__(self, nsroot, name, arn, source_creds_name, mfa=None,
-            role_session_name=None):
+            role_session_name=None, regions=None, services=None, sts_cache=None):
         """
         Input:
             user_nsroot: nsroot of the user namespace (used to refer to source creds by
@@ -43,6 +49,10 @@ class AwsRole(object):
             mfa: the arn of the MFA device to use for MFA (optional)
             source_creds: nsid of another Cush User that can be used to retrieve the
                 source credentials needed to assume the specified role
+            regions: optional list of region patterns to provision sessions in
+            services: optional list of services to provision clients for
+            sts_cache: StsCredentialCache to assume the role through; defaults to the
+                process-wide one
         """
         self.nsroot = nsroot
         self.name = name
@@ -51,12 +61,18 @@ class AwsRole(object):
         self.mfa = mfa
         self._source_creds = None
         self.role_session_name = role_session_name if  role_session_name else  f'cush_{self.name}'
+        self.regions = regions
+        self.services = services
+        self.sts_cache = sts_cache
         
 
         #- only filled in after assuming role
         self.access_key_id = None
         self.secret_access_key = None
         self.session_token = None
+        #- botocore credentials shared by the sessions made for this role
+        self._refreshable_credentials = None
+        self._refreshable_lock = threading.Lock()
 
         #- assume role
         #self.assume_role()
@@ -75,43 +91,108 @@ class AwsRole(object):
     def source_creds(self):
         """
         Description:
-            dynamically return the source credentials
+            dynamically return the source credentials. The source is looked up once;
+            when it is a role itself (a role chain), its current credentials are
+            returned (from the STS credential cache, so it is only assumed again when
+            they run out)
         Output:
             AwsCredential object with credentials created from self.source_creds_name
         """
-        return self.nsroot.user.lookup(self.source_creds_name)
-        
+        if self._source_creds is None:
+            self._source_creds = self.nsroot.user.lookup(self.source_creds_name)
+        source = self._source_creds
+        if callable(getattr(source, 'assume_role', None)):
+            return source.assume_role()
+        return source
+
 
-    def assume_role(self, session_name=None):
+    def set_source(self, source):
         """
         Description:
-            Hit the AWS STS API and save the returned credentials
+            use source (credentials, a CushUser or another AwsRole) to assume this role
+            instead of looking up source_creds_name
+        """
+        self._source_creds = source
+        
+
+    def assume_role(self, session_name=None, token_code=None, cache=None,
+            min_remaining=None):
         """
-        #TODO: use the botocore objects for role assumption that refresh themselves
+        Description:
+            Get temporary credentials for the role from AWS STS and save them. They
+            are cached (see cush.stscache): STS is only called when there are no
+            unexpired credentials for this role, source credential and session name.
+
+        Input:
+            session_name: role session name; defaults to self.role_session_name
+            token_code: current code of the MFA device, if the role needs MFA
+            cache: StsCredentialCache to use; defaults to self.sts_cache, then the
+                process-wide one
+            min_remaining: only use cached credentials with at least this many seconds
+                left
 
+        Output:
+            AwsCredential with the temporary credentials
+        """
         #from https://docs.aws.amazon.com/IAM/latest/UserGuide/id_roles_use_switch-role-api.html
-        import boto3
-        session = boto3.Session(
-            access_key_id = self.source_creds.access_key_id,
-            secret_access_key = self.source_creds.secret_access_key)
-
-        sts = session.client('sts')
-        response = sts.assume_role(
-            RoleArn = self.arn,
-            RoleSessionName = self.role_session_name)
-
-        try:
-            creds = response['Credentials']
-            self.aws_credentials = AwsCredential(
-                    access_key_id = response['Credentials']['access_key_id'],
-                    secret_access_key = response['Credentials']['secret_access_key'],
-                    session_token = response['Credentials']['session_token'])
-        except KeyError as e:
-            raise AwsError(f"AWS STS did not return a valid Credentials object in"\
-                    "response: {e}")
-        else:
-            return self.aws_credentials
-        
+        from cush.stscache import get_sts_cache
+        if cache is None:
+            cache = self.sts_cache or get_sts_cache()
+
+        self.aws_credentials = cache.get(self.arn, self.source_creds,
+            session_name or self.role_session_name, mfa_serial=self.mfa,
+            token_code=token_code, min_remaining=min_remaining)
+        self.access_key_id = self.aws_credentials.access_key_id
+        self.secret_access_key = self.aws_credentials.secret_access_key
+        self.session_token = self.aws_credentials.session_token
+        return self.aws_credentials
+
+
+    def get_refreshable_credentials(self, token_code=None, cache=None):
+        """
+        Description:
+            botocore RefreshableCredentials for the role, one object shared by every
+            session made with it. botocore refreshes it in place shortly before it
+            expires, so the sessions and the clients and resources made from them (and
+            their connection pools) keep working without being made again.
+
+            Refreshes assume the role through the STS credential cache; a role that
+            needs MFA can not be refreshed without a new token code, so its sessions
+            stop working when the first credentials expire.
+
+        Input:
+            token_code: current code of the MFA device, if the role needs MFA
+            cache: StsCredentialCache to use; defaults to self.sts_cache, then the
+                process-wide one
+
+        Output:
+            botocore.credentials.RefreshableCredentials
+        """
+        import datetime
+        from botocore.credentials import RefreshableCredentials, DeferredRefreshableCredentials
+        #- botocore starts refreshing this many seconds before the credentials expire
+        advisory_timeout = getattr(RefreshableCredentials, '_advisory_refresh_timeout', 15 * 60)
+
+        def refresh(token_code=None):
+            creds = self.assume_role(token_code=token_code, cache=cache,
+                min_remaining=advisory_timeout)
+            expiry_time = datetime.datetime.fromtimestamp(creds.expiration,
+                datetime.timezone.utc)
+            return dict(access_key=creds.access_key_id, secret_key=creds.secret_access_key,
+                token=creds.session_token, expiry_time=expiry_time.isoformat())
+
+        with self._refreshable_lock:
+            if self._refreshable_credentials is not None:
+                pass
+            elif token_code is None:
+                #- STS is not called until a request is signed with them
+                self._refreshable_credentials = DeferredRefreshableCredentials(
+                    refresh_using=refresh, method='cush-assume-role')
+            else:
+                self._refreshable_credentials = RefreshableCredentials.create_from_metadata(
+                    refresh(token_code), refresh_using=refresh, method='cush-assume-role')
+        return self._refreshable_credentials
+
 
 
 class CushUser(NamespaceNodeBase):
@@ -119,15 +200,19 @@ class CushUser(NamespaceNodeBase):
     Description:
         User object is just a named credential set that will be added to the user Namespace
     """
-    def __init__(self, name, credential, *, nsid, namespace):
+    def __init__(self, name, credential, *, nsid, namespace, regions=None, services=None):
         """
         Input:
             name: logical name for this user
             credential: sdk-specific credential object
+            regions: optional list of region patterns to provision sessions in
+            services: optional list of services to provision clients for
         """
         super().__init__(nsid=nsid, namespace=namespace)
         self.name = name
         self.credential = credential
+        self.regions = regions
+        self.services = services
 
 
     def __str__(self):
@@ -1,9 +1,16 @@
 import cush.defaults as defaults
 import os
+import re
 import collections
+import hashlib
+import pickle
+import threading
+from collections.abc import Mapping
 from thewired import get_provider_classes
 import ruamel.yaml
 
+import cush.profiling as profiling
+
 
 from logging import getLogger, LoggerAdapter
 logger = getLogger(__name__)
@@ -28,27 +35,336 @@ def filename_to_fullpath(directory=None, filename=None):
 
 
 
-def load_yaml_file(filename=None, dir=defaults.config_dir):
+def _yaml12_loader(base):
+    """
+    Description:
+        subclass of a libyaml based safe loader that resolves plain scalars the way
+        ruamel.yaml's (YAML 1.2) loaders do; libyaml loaders follow YAML 1.1, where eg.
+        on/off/yes/no are booleans and 0777 is an octal int
+
+    Input:
+        base: CSafeLoader class of ruamel.yaml or PyYAML
+    """
+    replaced = ('tag:yaml.org,2002:bool', 'tag:yaml.org,2002:int', 'tag:yaml.org,2002:float')
+
+    def construct_int(loader, node):
+        value = loader.construct_scalar(node).replace('_', '')
+        sign = -1 if value[:1] == '-' else 1
+        value = value.lstrip('+-')
+        return sign * int(value, {'0o' : 8, '0x' : 16, '0b' : 2}.get(value[:2].lower(), 10))
+
+    loader = type(f"YAML12{base.__name__}", (base,), dict())
+    loader.yaml_implicit_resolvers = {first : [x for x in resolvers if x[0] not in replaced]\
+        for first, resolvers in base.yaml_implicit_resolvers.items()}
+    loader.add_implicit_resolver('tag:yaml.org,2002:bool',\
+        re.compile(r'^(?:true|True|TRUE|false|False|FALSE)$'), list('tTfF'))
+    #- tried before the float resolver, so it only has to tell ints from strings
+    loader.add_implicit_resolver('tag:yaml.org,2002:int',\
+        re.compile(r'^(?:[-+]?[0-9][0-9_]*|0o[0-7_]+|0x[0-9a-fA-F_]+|0b[01_]+)$'),\
+        list('-+0123456789'))
+    loader.add_implicit_resolver('tag:yaml.org,2002:float',\
+        re.compile(r'^(?:[-+]?(?:\.[0-9]+|[0-9][0-9_]*(?:\.[0-9_]*)?(?:[eE][-+]?[0-9]+)?)'\
+            r'|[-+]?\.(?:inf|Inf|INF)|\.(?:nan|NaN|NAN))$'), list('-+0123456789.'))
+    loader.add_constructor('tag:yaml.org,2002:int', construct_int)
+    return loader
+
+
+def _get_safe_loader():
     """
-    load and parse YAML into a dict
+    Description:
+        the fastest safe loader available: libyaml through ruamel.yaml or PyYAML if
+        either was built with it, otherwise ruamel.yaml's pure python SafeLoader
+
+    Output:
+        (name, function of a string returning the parsed YAML, exception classes it
+        raises for bad YAML)
+    """
+    if getattr(ruamel.yaml, '__with_libyaml__', False):
+        loader = _yaml12_loader(ruamel.yaml.CSafeLoader)
+        return "ruamel-libyaml", lambda text: ruamel.yaml.load(text, loader),\
+            (ruamel.yaml.YAMLError,)
+
+    try:
+        import yaml
+    except ImportError:
+        yaml = None
+    if yaml is not None and getattr(yaml, '__with_libyaml__', False):
+        loader = _yaml12_loader(yaml.CSafeLoader)
+        return "pyyaml-libyaml", lambda text: yaml.load(text, Loader=loader),\
+            (ruamel.yaml.YAMLError, yaml.YAMLError)
+
+    return "ruamel-safe", lambda text: ruamel.yaml.load(text, ruamel.yaml.SafeLoader),\
+        (ruamel.yaml.YAMLError,)
+
+_safe_loader_name, _safe_load, _yaml_errors = _get_safe_loader()
+
+
+
+class ParsedYamlCache(object):
+    """
+    Description:
+        parsed YAML files, pickled, in memory and on disk below cache_dir
+
+        An entry is used when the path, mtime, size and content hash of the file all
+        match the ones it was parsed from, and the same kind of loader parsed it. Each
+        hit is unpickled on its own, so callers can change what they get.
+    """
+    #- bump when the entry layout changes
+    version = 1
+
+    def __init__(self, cache_dir=defaults.cache_dir):
+        """
+        Input:
+            cache_dir: where the entries are written; None keeps them in memory only
+        """
+        self.cache_dir = cache_dir
+        self._entries = dict()      #- (path, loader name) -> entry
+        self._lock = threading.Lock()
+
+
+    def _get_entry_path(self, path, loader_name):
+        name = hashlib.sha256(f"{path}:{loader_name}".encode()).hexdigest()[:16]
+        return filename_to_fullpath(self.cache_dir,\
+            os.path.join(defaults.yaml_cache_subdir, f"{os.path.basename(path)}.{name}.pickle"))
+
+
+    def get(self, path, st, digest, loader_name):
+        """
+        Output:
+            the parsed YAML, or None if there is no matching entry
+        """
+        log = LoggerAdapter(logger, {'name_ext' : 'ParsedYamlCache.get'})
+        key = (path, loader_name)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self.cache_dir is not None:
+            try:
+                with open(self._get_entry_path(path, loader_name), 'rb') as fp:
+                    entry = pickle.load(fp)
+            except FileNotFoundError:
+                return None
+            except Exception as err:
+                log.warning(f"ignoring unreadable cache entry for {path}: {err}")
+                return None
+            if not isinstance(entry, dict) or entry.get('version') != self.version:
+                return None
+
+        if entry is None or entry['digest'] != digest:
+            return None
+        if (entry['mtime_ns'], entry['size']) != (st.st_mtime_ns, st.st_size):
+            #- touched, not changed
+            entry = dict(entry, mtime_ns=st.st_mtime_ns, size=st.st_size)
+            self._save(key, entry)
+        with self._lock:
+            self._entries[key] = entry
+        return pickle.loads(entry['data'])
+
+
+    def put(self, path, st, digest, loader_name, parsed):
+        log = LoggerAdapter(logger, {'name_ext' : 'ParsedYamlCache.put'})
+        try:
+            data = pickle.dumps(parsed, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as err:
+            log.debug(f"not caching {path}: {err}")
+            return
+        entry = dict(version=self.version, path=path, mtime_ns=st.st_mtime_ns,\
+            size=st.st_size, digest=digest, loader=loader_name, data=data)
+        self._save((path, loader_name), entry)
+
+
+    def _save(self, key, entry):
+        log = LoggerAdapter(logger, {'name_ext' : 'ParsedYamlCache._save'})
+        with self._lock:
+            self._entries[key] = entry
+        if self.cache_dir is None:
+            return
+        #- readable only by the current user: user.yaml has credentials in it
+        entry_path = self._get_entry_path(*key)
+        try:
+            os.makedirs(os.path.dirname(entry_path), mode=0o700, exist_ok=True)
+            tmp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as fp:
+                pickle.dump(entry, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, entry_path)
+        except OSError as err:
+            log.warning(f"could not write cache entry for {entry['path']}: {err}")
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+yaml_cache = ParsedYamlCache()
+
+
+
+def load_yaml_file(filename=None, dir=defaults.config_dir, round_trip=False, cache=None,
+        strict=False):
+    """
+    Description:
+        load and parse YAML into a dict
+
+        Parsed files are cached (see ParsedYamlCache), so a file that has not changed
+        since it was last loaded is not parsed again.
+
+    Input:
+        filename: name of the file in dir
+        dir: directory the file is in
+        round_trip: parse with ruamel.yaml's RoundTripLoader, which keeps comments and
+            formatting, instead of the (much faster) safe loader
+        cache: ParsedYamlCache to use; defaults to yaml_cache
+        strict: raise the parser's error instead of returning an empty dict when the
+            file can not be parsed
+
+    Output:
+        the parsed YAML; an empty dict if it could not be parsed
     """
 
     log = LoggerAdapter(logger, {'name_ext' : 'load_yaml_file'})
     if filename is None:
         raise ValueError("load_yaml_file: need a filename to load.")
+    if cache is None:
+        cache = yaml_cache
 
     config_filepath = filename_to_fullpath(dir, filename)
+    loader_name = "ruamel-roundtrip" if round_trip else _safe_loader_name
+
+    with open(config_filepath, 'rb') as fp:
+        st = os.fstat(fp.fileno())
+        data = fp.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    yaml_dict = cache.get(config_filepath, st, digest, loader_name)
+    if yaml_dict is not None:
+        log.debug(f"cached: {config_filepath}")
+        return yaml_dict
 
     yaml_dict = dict()
-    with open(config_filepath, 'rt') as fp:
+    with profiling.phase(f"yaml.load {filename}"):
         try:
-            yaml_dict = ruamel.yaml.load(fp, ruamel.yaml.RoundTripLoader)
-        except ruamel.yaml.YAMLError as err:
+            text = data.decode()
+            if round_trip:
+                yaml_dict = ruamel.yaml.load(text, ruamel.yaml.RoundTripLoader)
+            else:
+                yaml_dict = _safe_load(text)
+        except _yaml_errors as err:
             log.error('load_yaml_file: Error loading {}: {}'.format(config_filepath, str(err)))
+            if strict:
+                raise
+            return yaml_dict
+    cache.put(config_filepath, st, digest, loader_name, yaml_dict)
     return yaml_dict
 
 
 
+def is_leaf_config(value):
+    """
+    Description:
+        default test for diff_dict_config(): a mapping with no mappings in it (eg. one
+        credential in user.yaml) is compared as a single value
+    """
+    return not any(isinstance(x, Mapping) for x in value.values())
+
+
+
+def make_node_config_test(target_keys=()):
+    """
+    Description:
+        is_leaf test for diff_dict_config() on a namespace config: a mapping that is
+        parsed into one node (it has one of the parser's callback target keys or a
+        "__" key such as __raw__ in it) is compared as a single value, as is a mapping
+        with no mappings in it
+
+    Input:
+        target_keys: the callback target keys of the config's parser
+    """
+    target_keys = frozenset(target_keys)
+    def is_node_config(value):
+        return is_leaf_config(value)\
+            or any(key in target_keys or str(key).startswith('__') for key in value.keys())
+    return is_node_config
+
+
+
+ConfigDiff = collections.namedtuple('ConfigDiff', ['added', 'removed', 'changed'])
+
+def diff_dict_config(old, new, is_leaf=is_leaf_config, path=()):
+    """
+    Description:
+        structural diff of two parsed configs
+
+    Input:
+        old, new: parsed configs (nested mappings)
+        is_leaf: callable(mapping) -> True if the mapping is to be compared as a whole
+            instead of key by key
+        path: key path of old and new inside the whole config
+
+    Output:
+        ConfigDiff of three lists of key paths (tuples): added, removed and changed
+    """
+    diff = ConfigDiff(list(), list(), list())
+    for key in old.keys():
+        if key not in new.keys():
+            diff.removed.append(path + (key,))
+
+    for key in new.keys():
+        key_path = path + (key,)
+        if key not in old.keys():
+            diff.added.append(key_path)
+            continue
+
+        old_value, new_value = old[key], new[key]
+        if isinstance(old_value, Mapping) and isinstance(new_value, Mapping)\
+            and not (is_leaf(old_value) and is_leaf(new_value)):
+            sub_diff = diff_dict_config(old_value, new_value, is_leaf, key_path)
+            for x, y in zip(diff, sub_diff):
+                x.extend(y)
+        elif old_value != new_value:
+            diff.changed.append(key_path)
+
+    return diff
+
+
+
+def bulk_add_nodes(namespace, items):
+    """
+    Description:
+        add many nodes to a namespace at once.
+
+        Namespace.add() walks (and creates) every intermediate node on the way to each
+        new node. Here the nsids are grouped by their parent nodes: a handle to each
+        parent is made once, from the handle of its own parent, and every node below
+        it is added with a single-level add.
+
+    Input:
+        namespace: Namespace or namespace handle to add the nodes to
+        items: iterable of (nsid, node_factory, *args) tuples; nsids are relative to
+            namespace and args are passed to node_factory
+
+    Output:
+        list of the nsids added
+    """
+    #- parent nsid parts -> handle to the parent node
+    handles = {() : namespace}
+
+    def get_handle(parts):
+        if parts not in handles:
+            handles[parts] = get_handle(parts[:-1]).get_handle(f".{parts[-1]}",\
+                create_nodes=True)
+        return handles[parts]
+
+    added = list()
+    for nsid, node_factory, *args in items:
+        parts = tuple(x for x in str(nsid).split('.') if x)
+        if not parts:
+            raise ValueError(f"bulk_add_nodes: can't add a node at the root: {nsid}")
+        get_handle(parts[:-1]).add(f".{parts[-1]}", node_factory, *args)
+        added.append(nsid)
+    return added
+
+
+
 class ClassTable(collections.UserDict):
     def __init__(self, cls_list):
         '''
@@ -65,26 +381,106 @@ class ClassTable(collections.UserDict):
         super().__init__()
 
         for cls in cls_list:
-            #- strip the import namespacing, just leave the class name
-            class_lookup_name = cls.__name__.split('.')[-1]
-            self.data[class_lookup_name] = cls
+            self.add(cls)
+
+
+    def add(self, cls):
+        #- strip the import namespacing, just leave the class name
+        class_lookup_name = cls.__name__.split('.')[-1]
+        self.data[class_lookup_name] = cls
+        return class_lookup_name
 
 
 class ProviderClassTable(object):
     """
     Description:
         Singleton ClassTable of all the available provider classes.
-        Updates every time it is instantiated.
+        Built on first use and shared by every CushApplication in the process; the
+        table is only ever updated in place, so whoever holds it (or a view of its
+        keys) sees the provider classes added later.
 
         This is basically a simple way to wrap away the get_provider_classes() method and
         provide some kind of way to iterate and inspect the available providers.
 
+        get_provider_classes() scans the provider class hierarchy, so it is only called
+        when the table is built and by refresh(). A provider class defined later is
+        added with register(), or picked up by the next refresh().
+
     Notes:
         Initially this was going to be a ProviderNamespace, but there really doesn't seem
         to be a need for a namespace for these as they are already organized in the class
         hierarchy and namespaced according to the package-level / import namespace.
 
     """
+    _table = None
+    #- class name -> import path of the class, for the parser's "__class__" keys
+    _class_paths = dict()
+    _lock = threading.Lock()
+
     def __new__(cls):
-        #- always update and have only one
-        return ClassTable(get_provider_classes())
+        table = cls._table
+        if table is None:
+            table = cls.refresh()
+        return table
+
+
+    @classmethod
+    def _add(cls, provider_cls):
+        name = cls._table.add(provider_cls)
+        cls._class_paths[name] = f"{provider_cls.__module__}.{provider_cls.__qualname__}"
+
+
+    @classmethod
+    def refresh(cls):
+        """
+        Description:
+            add the provider classes defined since the table was last updated
+
+        Output:
+            the table
+        """
+        with cls._lock:
+            if cls._table is None:
+                cls._table = ClassTable([])
+            known = set(cls._table.values())
+            for provider_cls in get_provider_classes():
+                if provider_cls not in known:
+                    cls._add(provider_cls)
+            return cls._table
+
+
+    @classmethod
+    def register(cls, provider_cls):
+        """
+        Description:
+            add one provider class to the table without scanning for the others
+        """
+        with cls._lock:
+            if cls._table is None:
+                cls._table = ClassTable(get_provider_classes())
+                cls._class_paths.update((name, f"{x.__module__}.{x.__qualname__}")\
+                    for name, x in cls._table.items())
+            cls._add(provider_cls)
+
+
+    @classmethod
+    def invalidate(cls):
+        """
+        Description:
+            rebuild the table from scratch, eg. after provider classes were removed
+        """
+        with cls._lock:
+            if cls._table is not None:
+                cls._table.data.clear()
+                cls._class_paths.clear()
+        return cls.refresh()
+
+
+    @classmethod
+    def get_class_path(cls, name):
+        """
+        Output:
+            import path of the provider class with this name
+        """
+        cls()
+        return cls._class_paths[name]
@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+from thewired import Namespace, DelegateNode
+
+from cush.util import bulk_add_nodes
+
+
+
+class CountingHandle(object):
+    """
+    Description:
+        namespace handle wrapper that counts get_handle() calls
+    """
+    def __init__(self, handle, counter):
+        self.handle = handle
+        self.counter = counter
+
+    def get_handle(self, nsid, create_nodes=False):
+        self.counter.append(nsid)
+        return CountingHandle(self.handle.get_handle(nsid, create_nodes=create_nodes),
+            self.counter)
+
+    def add(self, nsid, node_factory, *args):
+        return self.handle.add(nsid, node_factory, *args)
+
+
+
+def test_bulk_add_nodes_makes_each_parent_once():
+    ns = Namespace()
+    ns.add_exactly_one('.implementor')
+    counter = list()
+    handle = CountingHandle(ns.get_handle('.implementor'), counter)
+
+    items = [(f".aws.session.{region}.cred_{i}", DelegateNode, SimpleNamespace(region=region))\
+        for region in ['us_east_1', 'eu_west_1'] for i in range(10)]
+    added = bulk_add_nodes(handle, items)
+
+    assert added == [x[0] for x in items]
+    #- aws, session, 2 regions
+    assert len(counter) == 4
+    assert ns.get('.implementor.aws.session.eu_west_1.cred_3').region == 'eu_west_1'
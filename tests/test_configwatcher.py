@@ -0,0 +1,65 @@
+import os
+import threading
+
+from cush.configwatcher import ConfigWatcher
+
+
+
+class FakeApp(object):
+    def __init__(self):
+        self.updated = list()
+
+    def update_namespace(self, filename):
+        if filename == 'broken.yaml':
+            raise ValueError("can't parse")
+        self.updated.append(filename)
+        return dict(added=[], changed=[], removed=[])
+
+
+
+def test_ConfigWatcher_check(tmp_path):
+    config_dir = str(tmp_path)
+    for name in ('provider.yaml', 'sdk_ns.yaml', 'broken.yaml'):
+        with open(os.path.join(config_dir, name), 'w') as fp:
+            fp.write('a: 1\n')
+
+    app = FakeApp()
+    errors = list()
+    watcher = ConfigWatcher(app, ['provider.yaml', 'sdk_ns.yaml', 'broken.yaml'],
+        config_dir=config_dir, on_reload=lambda f, result, error: errors.append(error))
+    assert watcher.check() == dict()
+
+    with open(os.path.join(config_dir, 'sdk_ns.yaml'), 'a') as fp:
+        fp.write('b: 2\n')
+    with open(os.path.join(config_dir, 'broken.yaml'), 'a') as fp:
+        fp.write('b: [\n')
+    assert list(watcher.check()) == ['sdk_ns.yaml']
+    assert app.updated == ['sdk_ns.yaml']
+    assert isinstance(errors[-1], ValueError)
+
+    #- removed files are left as they were
+    os.remove(os.path.join(config_dir, 'provider.yaml'))
+    assert watcher.check() == dict()
+
+
+
+def test_ConfigWatcher_thread(tmp_path):
+    config_dir = str(tmp_path)
+    path = os.path.join(config_dir, 'provider.yaml')
+    with open(path, 'w') as fp:
+        fp.write('a: 1\n')
+
+    for use_inotify in (True, False):
+        reloaded = threading.Event()
+        watcher = ConfigWatcher(FakeApp(), ['provider.yaml'], config_dir=config_dir,
+            poll_interval=0.01, use_inotify=use_inotify,
+            on_reload=lambda f, result, error: reloaded.set())
+        watcher.start()
+        try:
+            #- written as editors do: a new file renamed over the old one
+            with open(f"{path}.tmp", 'w') as fp:
+                fp.write(f"a: {use_inotify}\nb: 2\n")
+            os.replace(f"{path}.tmp", path)
+            assert reloaded.wait(5)
+        finally:
+            watcher.stop()
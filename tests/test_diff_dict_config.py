@@ -0,0 +1,34 @@
+from cush.util import diff_dict_config, make_node_config_test
+
+
+
+def test_diff_dict_config_compares_leaf_mappings_as_a_whole():
+    old = dict(aws=dict(
+        one=dict(access_key_id='A1', secret_access_key='S1'),
+        two=dict(access_key_id='A2', secret_access_key='S2')))
+    new = dict(aws=dict(
+        one=dict(access_key_id='A1', secret_access_key='S1-rotated'),
+        three=dict(access_key_id='A3', secret_access_key='S3')))
+
+    diff = diff_dict_config(old, new)
+    assert diff.added == [('aws', 'three')]
+    assert diff.removed == [('aws', 'two')]
+    assert diff.changed == [('aws', 'one')]
+
+
+
+def test_diff_dict_config_no_changes():
+    config = dict(aws=dict(one=dict(access_key_id='A1', regions=['us-east-1'])))
+    diff = diff_dict_config(config, dict(config))
+    assert diff.added == diff.removed == diff.changed == []
+
+
+
+def test_diff_dict_config_compares_namespace_nodes_as_a_whole():
+    old = dict(ec2=dict(keypairs=dict(get=dict(AddendumFormatter=dict(addendum='.all()')))),
+        amis=dict(zesty=dict(__raw__=dict(us_west_1='ami-1'))))
+    new = dict(ec2=dict(keypairs=dict(get=dict(AddendumFormatter=dict(addendum='.filter()')))),
+        amis=dict(zesty=dict(__raw__=dict(us_west_1='ami-2'))))
+
+    diff = diff_dict_config(old, new, is_leaf=make_node_config_test(['AddendumFormatter']))
+    assert diff.changed == [('ec2', 'keypairs', 'get'), ('amis', 'zesty')]
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from cush.fanout import FanoutExecutor, nsid_region, nsid_credential
+
+
+
+class FakeClient(object):
+    def __init__(self, delay=0, error=None):
+        self.delay = delay
+        self.error = error
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def describe(self, value):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            return value
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+
+def test_nsid_region_and_credential():
+    nsid = '.boto3.aws.ec2.client.eu_west_1.application.default.user.aws.credential_name_1'
+    assert nsid_region(nsid) == 'eu_west_1'
+    assert nsid_credential(nsid) == '.user.aws.credential_name_1'
+    assert nsid_region('.boto3.aws.regions') is None
+    assert nsid_credential('.boto3.aws.regions') is None
+
+
+
+def test_FanoutExecutor_limits_calls_per_region():
+    client = FakeClient(delay=0.02)
+    targets = [(f".client.us_east_1.user.u{n}", client) for n in range(6)]
+    executor = FanoutExecutor(max_workers=6, max_per_region=2, timeout=None)
+    results = list(executor.map(targets, 'describe', 'x'))
+
+    assert sorted(x.nsid for x in results) == sorted(x[0] for x in targets)
+    assert all(x.ok and x.value == 'x' for x in results)
+    assert client.max_running == 2
+
+
+
+def test_FanoutExecutor_captures_errors_and_timeouts():
+    slow, broken, fast = FakeClient(delay=0.5), FakeClient(error=KeyError('x')), FakeClient()
+    targets = [('.client.us_east_1', slow), ('.client.eu_west_1', broken),
+        ('.client.eu_central_1', fast)]
+    executor = FanoutExecutor(timeout=0.1)
+    results = {x.nsid : x for x in executor.map(targets, 'describe', 1)}
+
+    assert results['.client.eu_central_1'].value == 1
+    assert isinstance(results['.client.eu_west_1'].error, KeyError)
+    assert results['.client.us_east_1'].timed_out
+    assert isinstance(results['.client.us_east_1'].error, TimeoutError)
+
+
+
+def test_FanoutExecutor_does_not_queue_calls_behind_timed_out_ones():
+    ran = list()
+    class Implementor(object):
+        def __init__(self, name, delay):
+            self.name = name
+            self.delay = delay
+        def describe(self):
+            time.sleep(self.delay)
+            ran.append(self.name)
+            return self.name
+
+    targets = [('.client.slow', Implementor('slow', 0.5)),
+        ('.client.fast', Implementor('fast', 0))]
+    executor = FanoutExecutor(max_workers=1, max_per_region=None, timeout=0.1)
+    results = {x.nsid : x for x in executor.map(targets, 'describe')}
+
+    assert results['.client.slow'].timed_out
+    assert results['.client.fast'].ok and results['.client.fast'].value == 'fast'
+    assert 'fast' in ran
@@ -0,0 +1,221 @@
+import pytest
+
+from thewired import Namespace
+
+from cush.implementorlib.flipswitch import Flipswitch, FlipswitchGraph, FlipswitchTable,\
+    FlipswitchView, FlipswitchCycleError
+
+
+
+def make_flipswitches(graph, ns, *names):
+    return [ns.add_exactly_one(f".flipswitch.{x}", Flipswitch, 'on', graph) for x in names]
+
+
+
+@pytest.mark.parametrize('graph_cls', [FlipswitchGraph, FlipswitchTable])
+def test_FlipswitchGraph_propagates_once_through_shared_children(graph_cls):
+    ns = Namespace()
+    graph = graph_cls(ns)
+    region, user, session, client = make_flipswitches(graph, ns,
+        'region', 'user', 'session', 'client')
+    region.add_child(session)
+    user.add_child(session)
+    session.add_child(client)
+
+    assert graph.descendants(region) == [session, client]
+    region.state = 'off'
+    assert not session and not client
+    assert user
+
+    user.state = 'on'
+    assert session and client
+
+
+
+@pytest.mark.parametrize('graph_cls', [FlipswitchGraph, FlipswitchTable])
+def test_FlipswitchGraph_rejects_cycles(graph_cls):
+    ns = Namespace()
+    graph = graph_cls(ns)
+    a, b, c = make_flipswitches(graph, ns, 'a', 'b', 'c')
+    a.add_child(b)
+    b.add_child(c)
+    with pytest.raises(FlipswitchCycleError):
+        c.add_child(a)
+    assert c.children == []
+
+
+
+@pytest.mark.parametrize('graph_cls', [FlipswitchGraph, FlipswitchTable])
+def test_FlipswitchGraph_resolves_children_linked_before_they_exist(graph_cls):
+    ns = Namespace()
+    graph = graph_cls(ns)
+    parent, = make_flipswitches(graph, ns, 'parent')
+    parent.add_child('.flipswitch.child')
+    assert graph.children(parent) == ()
+
+    version = graph.version
+    child, = make_flipswitches(graph, ns, 'child')
+    assert graph.version > version
+    parent.state = 'off'
+    assert not child
+
+
+
+def test_FlipswitchTable_sets_states_by_pattern():
+    ns = Namespace()
+    table = FlipswitchTable(ns)
+    regions = make_flipswitches(table, ns, 'client.eu_west_1', 'client.eu_central_1',
+        'client.us_east_1')
+    user, = make_flipswitches(table, ns, 'user')
+    user.add_children(x.nsid for x in regions)
+    sessions = [table.view(f"{x.nsid}.session") for x in regions]
+    for region, session in zip(regions, sessions):
+        region.add_child(session)
+    assert isinstance(sessions[0], FlipswitchView)
+
+    assert table.set_states('.flipswitch.client.eu-*', 'off') == 4
+    assert [bool(x) for x in regions] == [False, False, True]
+    assert [x.state for x in sessions] == ['off', 'off', 'on']
+    assert table.get_state(sessions[0].nsid) == 'off'
+
+    user.state = 'on'
+    assert all(regions) and all(sessions)
+
+
+
+def test_FlipswitchTable_rejects_cycles_through_views():
+    table = FlipswitchTable()
+    a, b = table.view('.a'), table.view('.b')
+    a.add_child(b)
+    with pytest.raises(FlipswitchCycleError):
+        b.add_child('.a')
+
+
+
+def test_FlipswitchTable_is_active_checks_every_controlling_flipswitch():
+    ns = Namespace()
+    table = FlipswitchTable(ns)
+    region, user, session = make_flipswitches(table, ns, 'region', 'user', 'session')
+    region.add_child(session)
+    user.add_child(session)
+
+    assert table.is_active(session.nsid)
+    epoch = table.epoch
+    region.state = 'off'
+    assert table.epoch > epoch
+    assert not table.is_active(session.nsid)
+
+    #- turning the other parent on pushes 'on' down, but region still controls it
+    user.state = 'on'
+    assert session
+    assert not table.is_active(session.nsid)
+
+    region.state = 'on'
+    assert table.is_active(session.nsid)
+    assert table.is_active('.flipswitch.unknown')
+
+
+
+def test_FlipswitchTable_restores_states_before_flipswitches_are_made():
+    ns = Namespace()
+    table = FlipswitchTable(ns)
+    table.restore([('off', ['.flipswitch.region'])])
+    turned_on = list()
+    table.add_on_listener(turned_on.extend)
+
+    region, = make_flipswitches(table, ns, 'region')
+    assert region.state == 'off'
+    assert not table.is_active('.flipswitch.region')
+
+    region.state = 'on'
+    assert turned_on == ['.flipswitch.region']
+
+
+
+@pytest.mark.parametrize('graph_cls', [FlipswitchGraph, FlipswitchTable])
+def test_Flipswitch_add_children_of_objects_with_non_str_nsids(graph_cls):
+    class Nsid(object):
+        def __init__(self, nsid):
+            self._nsid = nsid
+        def __str__(self):
+            return self._nsid
+
+    class Ref(object):
+        def __init__(self, nsid):
+            self.nsid = Nsid(nsid)
+
+    ns = Namespace()
+    graph = graph_cls(ns)
+    parent, child = make_flipswitches(graph, ns, 'parent', 'child')
+    parent.add_children([Ref(str(child.nsid))])
+
+    assert parent.children == [str(child.nsid)]
+    parent.state = 'off'
+    assert not child
+
+
+
+def test_FlipswitchTable_views_take_less_memory_than_nodes():
+    import tracemalloc
+    names = [f".flipswitch.implementor.client.region_{n}" for n in range(2000)]
+
+    def footprint(make):
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            kept = make()
+            return (tracemalloc.get_traced_memory()[0] - before) / len(names), kept
+        finally:
+            tracemalloc.stop()
+
+    def make_views():
+        table = FlipswitchTable(Namespace())
+        for name in names:
+            table.view(name).add_child('.flipswitch.implementor.client')
+        return table
+
+    def make_nodes():
+        ns = Namespace()
+        table = FlipswitchTable(ns)
+        for name in names:
+            ns.add_exactly_one(name, Flipswitch, 'on', table).add_child('.flipswitch.implementor.client')
+        return ns, table
+
+    view_bytes, table = footprint(make_views)
+    node_bytes, _ = footprint(make_nodes)
+    assert view_bytes * 2 < node_bytes
+    assert len(table) == 2000 and not table._nodes
+
+
+
+def test_FlipswitchTable_listeners_run_without_the_table_lock():
+    import threading
+    from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+
+    table = FlipswitchTable(Namespace())
+    region = table.view('.flipswitch.region', 'off')
+    in_listener = threading.Event()
+    has_lock = threading.Event()
+    def provision(nsids):
+        #- like CushApplication._provision_turned_on did, before it queued inputs
+        in_listener.set()
+        with ImplementorProvisioner._ns_lock:
+            pass
+    table.add_on_listener(provision)
+
+    def provisioner():
+        #- provisioners take the namespace lock, then the table lock
+        with ImplementorProvisioner._ns_lock:
+            has_lock.set()
+            in_listener.wait(timeout=5)
+            table.view('.flipswitch.session')
+
+    threads = [threading.Thread(target=provisioner, daemon=True),
+        threading.Thread(target=region.flip, daemon=True)]
+    threads[0].start()
+    has_lock.wait(timeout=5)
+    threads[1].start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert not any(x.is_alive() for x in threads)
+    assert region and '.flipswitch.session' in table
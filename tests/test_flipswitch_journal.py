@@ -0,0 +1,48 @@
+from cush.implementorlib.flipswitchjournal import FlipswitchJournal
+
+
+
+def make_journal(tmp_path, compact_after=None):
+    return FlipswitchJournal(str(tmp_path / 'flipswitch.json'),
+        str(tmp_path / 'flipswitch.journal'), compact_after=compact_after)
+
+
+
+def test_FlipswitchJournal_applies_journal_over_snapshot(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.append([('.user.aws.a', 'off'), ('.implementor.regions.eu_west_1', 'off')])
+    journal.compact()
+    journal.append([('.user.aws.a', 'on')])
+    #- a line cut short by a crash is ignored
+    with open(journal.journal_path, 'at') as fp:
+        fp.write('off\t.user.aws.b')
+
+    assert make_journal(tmp_path).read_states() == {'.user.aws.a': 'on',
+        '.implementor.regions.eu_west_1': 'off'}
+
+
+
+def test_FlipswitchJournal_compacts_after_enough_lines(tmp_path):
+    journal = make_journal(tmp_path, compact_after=3)
+    journal.append([('.a', 'off'), ('.b', 'off')])
+    journal.append([('.a', 'on')])
+
+    with open(journal.journal_path) as fp:
+        assert fp.read() == ''
+    assert make_journal(tmp_path).load() == [('on', ['.a']), ('off', ['.b'])]
+
+
+
+def test_FlipswitchJournal_appends_after_a_torn_line(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.append([('.user.aws.a', 'off')])
+    with open(journal.journal_path, 'at') as fp:
+        fp.write('off\t.user.aws.b')
+    journal.append([('.user.aws.c', 'off')])
+
+    assert make_journal(tmp_path).read_states() == {'.user.aws.a': 'off',
+        '.user.aws.c': 'off'}
+    #- a torn line joined with the next one by an older cush is ignored too
+    with open(journal.journal_path, 'at') as fp:
+        fp.write('on\t.user.aws.don\t.user.aws.e\n')
+    assert '.user.aws.don\t.user.aws.e' not in make_journal(tmp_path).read_states()
@@ -0,0 +1,29 @@
+import threading
+
+import cush
+
+
+
+def test_make_init_graph_respects_namespace_dependencies():
+    order = list()
+    lock = threading.Lock()
+    def recorder(ns_name):
+        def init_namespace():
+            with lock:
+                order.append(ns_name)
+        return init_namespace
+
+    name_to_init_method = {x : recorder(x) for x in cush.init_namespaces}
+    graph = cush.make_init_graph(name_to_init_method)
+    graph.run(max_workers=len(cush.init_namespaces))
+
+    assert sorted(order) == sorted(cush.init_namespaces)
+    for ns_name, deps in cush.init_namespace_deps.items():
+        for dep in deps:
+            assert order.index(dep) < order.index(ns_name)
+
+
+
+def test_make_init_graph_drops_namespaces_not_initialized():
+    graph = cush.make_init_graph({'sdk' : lambda: None}, namespaces=['sdk'])
+    assert graph.topological_order() == ['sdk']
@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+from thewired import Namespace
+
+from cush.implementorlib.lazy import LazyImplementor, LazyImplementorNode
+
+
+
+def test_LazyImplementor_metadata():
+    spec = LazyImplementor(dict, metadata={'meta.region_name': 'us-east-1'},
+        attrs={'_cush_credential_nsid': '.user.aws.test'})
+    assert spec.metadata.meta.region_name == 'us-east-1'
+    assert spec.metadata._cush_credential_nsid == '.user.aws.test'
+
+
+
+def test_LazyImplementorNode_builds_once_on_first_access():
+    calls = list()
+    def factory(service):
+        calls.append(service)
+        return SimpleNamespace(service=service)
+
+    spec = LazyImplementor(factory, 'ec2', attrs={'_cush_credential_nsid': '.user.aws.test'})
+    ns = Namespace()
+    ns.add('.lazy', LazyImplementorNode, spec)
+    node = ns.get('.lazy')
+
+    assert calls == []
+    assert not node.materialized
+    assert node.service == 'ec2'
+    assert node._cush_credential_nsid == '.user.aws.test'
+    assert node.service == 'ec2'
+    assert calls == ['ec2']
+    assert node.materialized
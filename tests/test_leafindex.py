@@ -0,0 +1,76 @@
+import pytest
+
+from thewired import NamespaceLookupError
+
+from cush.implementorlib.leafindex import LeafIndex
+
+
+
+class Node(object):
+    def __init__(self, nsid, **kwargs):
+        self.nsid = nsid
+        self.__dict__.update(kwargs)
+
+
+
+class FakeNamespace(object):
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.walks = 0
+
+    def get_leaf_nodes(self, nsid):
+        self.walks += 1
+        return list(self.nodes)
+
+
+
+def get_node_nsid(node, ns_name):
+    return node.nsid[len(f".{ns_name}"):]
+
+
+
+def make_index():
+    nodes = [
+        Node('.user.aws.prod.admin', access_key_id='AKIA1', tags=['prod']),
+        Node('.user.aws.prod.deploy', arn='arn:aws:iam::111122223333:role/deploy',
+            tags={'env' : 'prod'}),
+        Node('.user.aws.dev.admin', session_token='x', account_id='444455556666',
+            tags=['dev']),
+    ]
+    ns = FakeNamespace(nodes)
+    return LeafIndex(ns, 'user', get_node_nsid), ns, nodes
+
+
+
+def test_LeafIndex_query_by_prefix_and_attributes():
+    index, ns, (prod_admin, prod_deploy, dev_admin) = make_index()
+
+    assert index.lookup('.aws.prod') == [prod_admin, prod_deploy]
+    assert index.query('.', tags='prod') == [prod_admin]
+    assert index.query('.', tags='env=prod') == [prod_deploy]
+    assert index.query('.aws', credential_type='role', account_id='111122223333') == [prod_deploy]
+    assert index.query('.', credential_type='session') == [dev_admin]
+    assert index.query('.aws.dev', tags=['dev', 'prod']) == []
+    with pytest.raises(NamespaceLookupError):
+        index.lookup('.aws.test')
+    assert ns.walks == 1
+
+
+
+def test_LeafIndex_add_and_remove():
+    index, ns, (prod_admin, prod_deploy, dev_admin) = make_index()
+    index.lookup('.')
+
+    #- adding below a leaf makes it an inner node
+    ro = Node('.user.aws.dev.admin.ro', access_key_id='AKIA2')
+    index.add('.aws.dev.admin.ro', ro)
+    assert index.lookup('.aws.dev') == [ro]
+    assert index.query('.', credential_type='session') == []
+
+    index.remove('.aws.prod')
+    assert index.lookup('.') == [ro]
+    assert index.query('.', credential_type='access_key') == [ro]
+
+    index.invalidate()
+    assert len(index.lookup('.')) == 3
+    assert ns.walks == 2
@@ -0,0 +1,49 @@
+import os
+
+import cush.util
+from cush.util import load_yaml_file, ParsedYamlCache
+
+
+
+def test_load_yaml_file_resolves_scalars_like_yaml_1_2(tmp_path):
+    with open(os.path.join(str(tmp_path), 'x.yaml'), 'w') as fp:
+        fp.write("a: on\nb: yes\nc: 0777\nd: 0o17\ne: 1_000\nf: 12:30\ng: true\nh: 1e3\n")
+
+    for round_trip in (False, True):
+        config = load_yaml_file('x.yaml', dir=str(tmp_path), round_trip=round_trip,
+            cache=ParsedYamlCache(None))
+        assert dict(config) == dict(a='on', b='yes', c=777, d=15, e=1000, f='12:30',
+            g=True, h=1000.0)
+
+
+
+def test_load_yaml_file_cache(tmp_path, monkeypatch):
+    config_dir = str(tmp_path)
+    path = os.path.join(config_dir, 'user.yaml')
+    with open(path, 'w') as fp:
+        fp.write("aws:\n  one: {access_key_id: A1}\n")
+
+    cache_dir = os.path.join(config_dir, 'cache')
+    first = load_yaml_file('user.yaml', dir=config_dir, cache=ParsedYamlCache(cache_dir))
+    entries = os.listdir(os.path.join(cache_dir, 'yaml'))
+    assert len(entries) == 1
+    assert os.stat(os.path.join(cache_dir, 'yaml', entries[0])).st_mode & 0o777 == 0o600
+
+    #- a new process (fresh cache) does not parse the file again
+    def no_parse(text):
+        raise AssertionError("parsed a cached file")
+    monkeypatch.setattr(cush.util, '_safe_load', no_parse)
+    cache = ParsedYamlCache(cache_dir)
+    second = load_yaml_file('user.yaml', dir=config_dir, cache=cache)
+    assert second == first == dict(aws=dict(one=dict(access_key_id='A1')))
+
+    #- every hit is a copy of its own
+    second['aws'].clear()
+    assert load_yaml_file('user.yaml', dir=config_dir, cache=cache) == first
+
+    #- a changed file is parsed again
+    monkeypatch.undo()
+    with open(path, 'a') as fp:
+        fp.write("  two: {access_key_id: A2}\n")
+    third = load_yaml_file('user.yaml', dir=config_dir, cache=cache)
+    assert set(third['aws']) == {'one', 'two'}
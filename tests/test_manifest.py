@@ -0,0 +1,108 @@
+import os
+
+import pytest
+
+from cush.implementorlib.manifest import ImplementorManifest
+
+
+
+provisioner_source = '''
+from cush.implementorlib.implementorprovisioner import ImplementorProvisioner
+
+class RegionProvisioner(ImplementorProvisioner):
+    def __init__(self, root_nsid='.cloud.regions', priority=1):
+        super().__init__(root_nsid=root_nsid, priority=priority)
+
+class SessionProvisioner(ImplementorProvisioner):
+    def __init__(self, root_nsid='cloud.session'):
+        super().__init__(root_nsid=root_nsid)
+
+    def make_implementors(self, credentials='cloud', regions='cloud.regions'):
+        return list()
+'''
+
+def make_package(tmp_path):
+    pkg_dir = tmp_path / 'impl'
+    (pkg_dir / 'cloud').mkdir(parents=True)
+    (pkg_dir / '__init__.py').write_text('')
+    (pkg_dir / 'cloud' / '__init__.py').write_text('')
+    (pkg_dir / 'cloud' / 'provisioners.py').write_text(provisioner_source)
+    (pkg_dir / 'cloud' / 'helpers.py').write_text('import does_not_exist\n')
+    return str(pkg_dir)
+
+
+
+def test_ImplementorManifest_scans_without_importing(tmp_path):
+    path = make_package(tmp_path)
+    cache_path = str(tmp_path / 'cache' / 'manifest.json')
+    manifest = ImplementorManifest.load(path=[path], prefix='impl', cache_path=cache_path)
+
+    entries = {x.root_nsid : x for x in manifest.entries}
+    assert set(entries) == {'.cloud.regions', '.cloud.session'}
+    session = entries['.cloud.session']
+    assert session.module == 'impl.cloud.provisioners'
+    assert session.cls == 'SessionProvisioner'
+    assert session.inputs == {'credentials' : 'cloud', 'regions' : 'cloud.regions'}
+    assert entries['.cloud.regions'].priority == 1
+    assert [x.root_nsid for x in manifest.dependencies(session)] == ['.cloud.regions']
+    assert manifest.eager_modules == []
+    assert os.path.exists(cache_path)
+
+
+
+def test_ImplementorManifest_rescans_only_changed_files(tmp_path, monkeypatch):
+    path = make_package(tmp_path)
+    cache_path = str(tmp_path / 'cache' / 'manifest.json')
+    ImplementorManifest.load(path=[path], prefix='impl', cache_path=cache_path)
+
+    scanned = list()
+    scan_file = ImplementorManifest.scan_file
+    def counting_scan_file(file_path, module, st):
+        scanned.append(module)
+        return scan_file(file_path, module, st)
+    monkeypatch.setattr(ImplementorManifest, 'scan_file', staticmethod(counting_scan_file))
+
+    ImplementorManifest.load(path=[path], prefix='impl', cache_path=cache_path)
+    assert scanned == []
+
+    with open(os.path.join(path, 'cloud', 'helpers.py'), 'a') as fp:
+        fp.write('# changed\n')
+    ImplementorManifest.load(path=[path], prefix='impl', cache_path=cache_path)
+    assert scanned == ['impl.cloud.helpers']
+
+
+
+def test_LazyProvisionerLoader_retries_failed_provisioner(monkeypatch):
+    import cush.implementorlib.manifest as manifest_module
+    from cush.implementorlib.manifest import LazyProvisionerLoader
+
+    class Entry(object):
+        root_nsid, module, cls = '.cloud.regions', 'impl.cloud.provisioners', 'RegionProvisioner'
+
+    class Manifest(object):
+        entries = [Entry()]
+        def dependencies(self, entry):
+            return list()
+
+    runs = list()
+    class Provisioner(object):
+        def call_make_implementors(self, overwrite=False):
+            runs.append(overwrite)
+
+    attempts = list()
+    def load_provisioner(module, cls):
+        attempts.append(module)
+        if len(attempts) == 1:
+            raise ImportError(f"no module named {module}")
+        return Provisioner()
+    monkeypatch.setattr(manifest_module, 'load_provisioner', load_provisioner)
+
+    loader = LazyProvisionerLoader(app=None, manifest=Manifest())
+    with pytest.raises(ImportError):
+        loader.ensure_provisioned('.cloud.regions')
+    assert not loader.is_provisioned('.cloud.regions')
+
+    loader.ensure_provisioned('.cloud.regions')
+    loader.ensure_provisioned('.cloud.regions')
+    assert loader.is_provisioned('.cloud.regions')
+    assert len(attempts) == 2 and runs == [True]
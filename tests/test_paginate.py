@@ -0,0 +1,64 @@
+import time
+
+from cush.fanout import FanoutExecutor
+from cush.paginate import PaginatedStream
+
+
+
+class FakePaginator(object):
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, **kwargs):
+        for n in range(self.client.pages):
+            if self.client.error is not None and n == 1:
+                raise self.client.error
+            time.sleep(self.client.delay)
+            self.client.served += 1
+            yield {'Items' : [f"{self.client.name}-{n}-{i}" for i in range(3)]}
+
+
+
+class FakeClient(object):
+    def __init__(self, name, pages=5, delay=0.0, error=None):
+        self.name = name
+        self.pages = pages
+        self.delay = delay
+        self.error = error
+        self.served = 0
+
+    def get_paginator(self, operation):
+        return FakePaginator(self)
+
+
+
+def test_PaginatedStream_interleaves_regions():
+    clients = [FakeClient(name, delay=0.01) for name in ('us_east_1', 'eu_west_1')]
+    stream = PaginatedStream([(f".client.{x.name}", x) for x in clients], 'list_items',
+        search='Items[]')
+    items = list(stream)
+
+    assert len(items) == 30 and stream.pages == 10 and not stream.errors
+    #- both regions show up before either one is done
+    first_half = {nsid for nsid, _ in items[:15]}
+    assert first_half == {'.client.us_east_1', '.client.eu_west_1'}
+
+
+
+def test_PaginatedStream_stops_early_and_reports_errors():
+    many = FakeClient('us_east_1', pages=1000)
+    stream = PaginatedStream([('.client.us_east_1', many)], 'list_items', search='Items[]',
+        where=lambda item: item.endswith('-0'), limit=5, queue_pages=2)
+    items = [item for _, item in stream]
+
+    assert items == [f"us_east_1-{n}-0" for n in range(5)]
+    time.sleep(0.3)
+    #- no more pages than were read, plus the ones in the queue and in flight
+    assert many.served <= 5 + 2 + 2
+
+    broken = FakeClient('eu_west_1', error=KeyError('x'))
+    stream = PaginatedStream([('.client.eu_west_1', broken)], 'list_items',
+        executor=FanoutExecutor(timeout=0.001))
+    pages = list(stream)
+    assert len(pages) == 1 and pages[0][1]['Items'][0] == 'eu_west_1-0-0'
+    assert isinstance(stream.errors[0].error, KeyError)
@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+
+from cush.implementor.default.boto3.aws.plan import AwsSessionPlan, session_uses_service
+
+
+
+def test_AwsSessionPlan_limits_regions_and_services():
+    regions = ['eu-west-1', 'eu-west-2', 'us-east-1', 'us-west-2']
+    creds = [
+        SimpleNamespace(nsid='.user.aws.all'),
+        SimpleNamespace(nsid='.user.aws.eu', regions=['eu-*'], services=['ec2']),
+        SimpleNamespace(nsid='.user.aws.one', regions='us-east-1'),
+    ]
+    plan = AwsSessionPlan.from_inputs(creds, regions)
+
+    assert len(plan) == 4 + 2 + 1
+    assert plan.regions_for('.user.aws.eu') == ['eu-west-1', 'eu-west-2']
+    assert plan.regions_for('.user.aws.one') == ['us-east-1']
+    assert {'credential': '.user.aws.eu', 'region': 'eu-west-1', 'services': ['ec2']}\
+        in plan.as_data()
+
+    entry = [x for x in plan if x.credential_nsid == '.user.aws.eu'][0]
+    assert entry.allows('ec2') and not entry.allows('s3')
+
+
+
+def test_session_uses_service():
+    assert session_uses_service(SimpleNamespace(), 's3')
+    assert session_uses_service(SimpleNamespace(_cush_services=None), 's3')
+    assert not session_uses_service(SimpleNamespace(_cush_services=('ec2',)), 's3')
@@ -0,0 +1,40 @@
+import json
+
+import cush.profiling as profiling
+
+
+
+def test_phase_is_a_noop_without_a_profiler():
+    assert profiling._active_profiler is None
+    with profiling.phase('nothing') as record:
+        assert record is None
+
+
+
+def test_profiler_records_nested_phases(tmp_path):
+    profiling.start_profiling(count_objects=False)
+    try:
+        with profiling.phase('outer'):
+            with profiling.phase('inner'):
+                data = [object() for _ in range(1000)]
+    finally:
+        report = profiling.stop_profiling()
+
+    assert [x.name for x in report.phases] == ['outer', 'inner']
+    outer, inner = report.phases
+    assert inner.parent == 'outer' and inner.depth == 1
+    assert outer.wall_time >= inner.wall_time > 0
+    assert inner.alloc_bytes > 0
+    assert profiling.get_last_report() is report
+
+    path = str(tmp_path / 'profile.json')
+    report.save(path)
+    with open(path) as fp:
+        assert [x['name'] for x in json.load(fp)['phases']] == ['outer', 'inner']
+
+
+
+def test_profiling_requested():
+    assert profiling.profiling_requested({'CUSH_PROFILE' : '1'})
+    assert not profiling.profiling_requested({'CUSH_PROFILE' : '0'})
+    assert not profiling.profiling_requested({})
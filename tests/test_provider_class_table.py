@@ -0,0 +1,50 @@
+import pytest
+
+import cush.util
+from cush.util import ProviderClassTable
+
+
+
+class FirstProvider(object):
+    pass
+
+class SecondProvider(object):
+    pass
+
+
+
+@pytest.fixture
+def provider_classes(monkeypatch):
+    classes = [FirstProvider]
+    scans = list()
+    def get_provider_classes():
+        scans.append(1)
+        return list(classes)
+    monkeypatch.setattr(cush.util, 'get_provider_classes', get_provider_classes)
+    monkeypatch.setattr(ProviderClassTable, '_table', None)
+    monkeypatch.setattr(ProviderClassTable, '_class_paths', dict())
+    return classes, scans
+
+
+
+def test_ProviderClassTable_is_built_once(provider_classes):
+    classes, scans = provider_classes
+    table = ProviderClassTable()
+    keys = table.keys()
+    assert ProviderClassTable() is table
+    assert list(keys) == ['FirstProvider']
+    assert len(scans) == 1
+
+    #- added in place: holders of the table and its keys see the new class
+    ProviderClassTable.register(SecondProvider)
+    assert 'SecondProvider' in keys
+    assert len(scans) == 1
+    assert ProviderClassTable.get_class_path('SecondProvider') ==\
+        f"{__name__}.SecondProvider"
+
+    classes.remove(FirstProvider)
+    assert ProviderClassTable.invalidate() is table
+    assert list(keys) == []
+    classes.append(SecondProvider)
+    ProviderClassTable.refresh()
+    assert list(keys) == ['SecondProvider']
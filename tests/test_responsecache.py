@@ -0,0 +1,73 @@
+from cush.responsecache import ResponseCache, CachedCall, make_key
+
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+
+class Provider(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return [self.calls, args, kwargs]
+
+
+
+def test_CachedCall_ttl_bypass_refresh_and_key():
+    clock = Clock()
+    cache = ResponseCache(clock=clock)
+    provider = Provider()
+    epoch = [0]
+    call = CachedCall(provider, '.provider.x.get', 30, cache, lambda: epoch[0])
+
+    assert call(Filters=[{'Name' : 'a'}])[0] == 1
+    assert call(Filters=[{'Name' : 'a'}])[0] == 1
+    assert call(Filters=[{'Name' : 'b'}])[0] == 2
+    assert call(Filters=[{'Name' : 'a'}], cache_bypass=True)[0] == 3
+    assert call(Filters=[{'Name' : 'a'}], cache_refresh=True)[0] == 4
+    assert call(Filters=[{'Name' : 'a'}])[0] == 4
+
+    #- switching implementors on or off changes the key
+    epoch[0] += 1
+    assert call(Filters=[{'Name' : 'a'}])[0] == 5
+
+    clock.now = 31
+    assert call(Filters=[{'Name' : 'a'}])[0] == 6
+    assert cache.stats['hits'] == 2
+
+    call.invalidate()
+    assert len(cache) == 0 and cache.size == 0
+
+
+
+def test_ResponseCache_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.put('a', 1, 10)
+    cache.put('b', 2, 10)
+    cache.get('a')
+    cache.put('c', 3, 10)
+    assert [cache.get(x)[0] for x in 'abc'] == [True, False, True]
+    assert cache.stats['evictions'] == 1
+
+    #- bounded by size too
+    cache = ResponseCache(max_bytes=5000)
+    cache.put('small', 'x', 10)
+    cache.put('big', 'x' * 4000, 10)
+    cache.put('bigger', 'x' * 4500, 10)
+    assert [cache.get(x)[0] for x in ('small', 'big', 'bigger')] == [False, False, True]
+    cache.put('huge', 'x' * 10000, 10)
+    assert not cache.get('huge')[0] and cache.stats['uncacheable'] == 1
+
+
+
+def test_make_key_of_unhashable_arguments():
+    assert make_key(1, f={'b' : [1], 'a' : 2}) == make_key(1, f={'a' : 2, 'b' : [1]})
+    assert make_key([1]) != make_key((1,))
@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from cush.snapshot import ProvisioningSnapshot, get_fingerprint
+
+
+
+def test_ProvisioningSnapshot_save_load(tmp_path):
+    config_dir = str(tmp_path)
+    with open(os.path.join(config_dir, 'user.yaml'), 'w') as fp:
+        fp.write('aws: {}\n')
+
+    fingerprint = get_fingerprint(config_files=['user.yaml'], config_dir=config_dir,
+        source_paths=[])
+    provisioners = {
+        '.boto3.aws.ec2.regions': dict(module='m', cls='C', deps=[],
+            implementors=['.boto3.aws.ec2.regions.us_east_1'])}
+    snapshot = ProvisioningSnapshot(fingerprint, {'user.yaml': {'aws': {}}}, provisioners)
+
+    path = os.path.join(config_dir, 'cache', 'default.snapshot.pickle')
+    snapshot.save(path)
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    loaded = ProvisioningSnapshot.load(fingerprint, path)
+    assert loaded.configs == {'user.yaml': {'aws': {}}}
+    assert loaded.provisioners == provisioners
+
+    #- any change to the inputs invalidates the snapshot
+    with open(os.path.join(config_dir, 'user.yaml'), 'a') as fp:
+        fp.write('# changed\n')
+    new_fingerprint = get_fingerprint(config_files=['user.yaml'], config_dir=config_dir,
+        source_paths=[])
+    assert new_fingerprint != fingerprint
+    assert ProvisioningSnapshot.load(new_fingerprint, path) is None
+
+
+
+def test_ProvisioningSnapshot_warm_start_of_lazy_implementors(tmp_path, monkeypatch):
+    from thewired import Namespace
+    import cush.snapshot as snapshot_module
+    from cush.implementorlib.manifest import LazyProvisionerLoader
+
+    class Entry(object):
+        def __init__(self, root_nsid):
+            self.root_nsid, self.module, self.cls = root_nsid, 'impl.cloud', 'Provisioner'
+
+    class Manifest(object):
+        entries = [Entry('.cloud.regions'), Entry('.cloud.session')]
+        def dependencies(self, entry):
+            return self.entries[:1] if entry is self.entries[1] else list()
+
+    #- nothing has been used, so no provisioner has run
+    loader = LazyProvisionerLoader(app=None, manifest=Manifest())
+    snapshot = ProvisioningSnapshot.capture('x', dict(), list(),
+        pending=loader.pending_specs())
+    path = str(tmp_path / 'default.snapshot.pickle')
+    snapshot.save(path)
+    loaded = ProvisioningSnapshot.load('x', path)
+    assert loaded.pending_roots() == ['.cloud.regions', '.cloud.session']
+    assert loaded.provisioners['.cloud.session']['deps'] == ['.cloud.regions']
+
+    class App(object):
+        def __init__(self):
+            self._ns = Namespace()
+            self._ns.get_handle('.implementor', create_nodes=True)
+        def invalidate_leaf_index(self, nsid):
+            pass
+
+    runs = list()
+    class Provisioner(object):
+        def __init__(self, root_nsid):
+            self.root_nsid = root_nsid
+        def call_make_implementors(self, overwrite=False):
+            runs.append(self.root_nsid)
+
+    order = iter(['.cloud.regions', '.cloud.session'])
+    monkeypatch.setattr(snapshot_module, 'load_provisioner',
+        lambda module, cls: Provisioner(next(order)))
+
+    app = App()
+    loaded.restore_implementors(app)
+    placeholder = app._ns.get('.implementor.cloud.session')
+    assert runs == []
+    with pytest.raises(AttributeError):
+        placeholder.does_not_exist
+    assert runs == ['.cloud.regions', '.cloud.session']
+    assert loaded.pending_specs() == dict()
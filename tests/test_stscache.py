@@ -0,0 +1,164 @@
+import os
+import threading
+
+from cush.stscache import StsCredentialCache
+from cush.user import AwsCredential, AwsRole
+
+
+
+class FakeSts(object):
+    """
+    stand-in for STS: hands out numbered credentials that expire duration seconds
+    after the fake clock's current time
+    """
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = list()
+        self.lock = threading.Lock()
+
+    def __call__(self, source_creds):
+        return self
+
+    def assume_role(self, RoleArn, RoleSessionName, DurationSeconds, **kwargs):
+        with self.lock:
+            self.calls.append(RoleArn)
+            n = len(self.calls)
+        return dict(Credentials=dict(AccessKeyId=f"ASIA{n}", SecretAccessKey=f"secret{n}",
+            SessionToken=f"token{n}", Expiration=self.clock() + DurationSeconds))
+
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+
+def make_cache(path, clock, sts):
+    return StsCredentialCache(path, duration=3600, expiry_margin=60, refresh_ahead=300,
+        client_factory=sts, clock=clock)
+
+
+
+def test_StsCredentialCache_reuses_credentials(tmp_path):
+    clock = Clock()
+    sts = FakeSts(clock)
+    path = os.path.join(str(tmp_path), 'cache', 'sts_credentials.json')
+    source = AwsCredential('AKIA1', 'secret')
+    role = 'arn:aws:iam::123456789012:role/admin'
+
+    cache = make_cache(path, clock, sts)
+    first = cache.get(role, source, 'cush_admin')
+    assert cache.get(role, source, 'cush_admin').access_key_id == first.access_key_id
+    assert cache.get(role, source, 'other_session').access_key_id != first.access_key_id
+    assert len(sts.calls) == 2
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    #- another process uses the saved credentials
+    other = make_cache(path, clock, sts)
+    assert other.get(role, source, 'cush_admin').session_token == first.session_token
+    assert len(sts.calls) == 2
+
+    #- refreshed in the background shortly before they expire
+    clock.now += 3400
+    assert cache.get(role, source, 'cush_admin').access_key_id == first.access_key_id
+    cache.wait_for_refreshes()
+    assert len(sts.calls) == 3
+    refreshed = cache.get(role, source, 'cush_admin')
+    assert refreshed.access_key_id != first.access_key_id
+    assert refreshed.expiration == clock.now + 3600
+
+    #- never handed out once they are about to expire
+    clock.now += 3590
+    assert other.get(role, source, 'cush_admin').access_key_id not in\
+        (first.access_key_id, refreshed.access_key_id)
+
+
+
+def test_AwsRole_assume_role(tmp_path):
+    clock = Clock()
+    sts = FakeSts(clock)
+    cache = make_cache(None, clock, sts)
+
+    class Users(object):
+        def lookup(self, name):
+            return AwsCredential('AKIA1', 'secret')
+    class Root(object):
+        user = Users()
+
+    role = AwsRole(Root(), 'admin', 'arn:aws:iam::123456789012:role/admin', 'aws.one')
+    creds = role.assume_role(cache=cache)
+    assert role.session_token == creds.session_token == 'token1'
+    assert role.assume_role(cache=cache).access_key_id == 'ASIA1'
+    assert sts.calls == ['arn:aws:iam::123456789012:role/admin']
+
+
+
+def test_AwsRole_refreshable_credentials_are_shared_by_sessions():
+    import time
+    from cush.implementor.default.boto3.aws.sharedcomponents import get_shared_components
+
+    sts = FakeSts(time.time)
+    #- inside botocore's (15 minute) advisory refresh window from the start
+    cache = StsCredentialCache(None, duration=800, client_factory=sts, clock=time.time)
+
+    class Users(object):
+        def lookup(self, name):
+            return AwsCredential('AKIA1', 'secret')
+    class Root(object):
+        user = Users()
+
+    role = AwsRole(Root(), 'admin', 'arn:aws:iam::123456789012:role/admin', 'aws.one')
+    creds = role.get_refreshable_credentials(cache=cache)
+    assert role.get_refreshable_credentials(cache=cache) is creds
+    assert sts.calls == []
+
+    components = get_shared_components()
+    clients = [components.make_session(credentials=creds, region_name=region).client('ec2')
+        for region in ('us-east-1', 'eu-west-1')]
+    assert all(x._request_signer._credentials is creds for x in clients)
+
+    #- each use in the refresh window gets new keys for every client, in place
+    first = creds.get_frozen_credentials().access_key
+    second = creds.get_frozen_credentials().access_key
+    assert first != second
+    assert clients[1]._request_signer._credentials.get_frozen_credentials().access_key != first
+
+
+
+def test_StsCredentialCache_get_many_backs_off_while_throttled():
+    from botocore.exceptions import ClientError
+    clock = Clock()
+
+    class ThrottlingSts(FakeSts):
+        def assume_role(self, RoleArn, **kwargs):
+            with self.lock:
+                attempts = self.calls.count(RoleArn)
+            if attempts < 2:
+                with self.lock:
+                    self.calls.append(RoleArn)
+                raise ClientError(dict(Error=dict(Code='Throttling')), 'AssumeRole')
+            return super().assume_role(RoleArn, **kwargs)
+
+    sts = ThrottlingSts(clock)
+    backoffs = list()
+    cache = StsCredentialCache(None, client_factory=sts, clock=clock, backoff_base=0.1,
+        backoff_cap=1, sleep=backoffs.append)
+    source = AwsCredential('AKIA1', 'secret')
+    arns = [f"arn:aws:iam::{100000000000 + i}:role/OrgAdmin" for i in range(50)]
+    results = cache.get_many([dict(role_arn=x, source_creds=source, session_name='cush')
+        for x in arns], max_workers=8)
+
+    assert all(isinstance(x, AwsCredential) for x in results)
+    assert len(set(x.access_key_id for x in results)) == 50
+    assert len(sts.calls) == 150
+    assert len(backoffs) == 100 and max(backoffs) <= 0.2
+
+    #- other errors are not retried
+    failing = StsCredentialCache(None, client_factory=lambda creds: None, clock=clock)
+    [error] = failing.get_many([dict(role_arn=arns[0], source_creds=source,
+        session_name='cush')])
+    assert isinstance(error, AttributeError)
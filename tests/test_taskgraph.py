@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from cush.taskgraph import TaskGraph, TaskGraphCycleError
+
+
+
+def test_TaskGraph_runs_dependencies_first():
+    order = list()
+    graph = TaskGraph()
+    graph.add_task('session', lambda: order.append('session'), deps=['regions'])
+    graph.add_task('client', lambda: order.append('client'), deps=['session'])
+    graph.add_task('regions', lambda: order.append('regions'))
+
+    timings = graph.run(max_workers=4)
+    assert order == ['regions', 'session', 'client']
+    assert set(timings.keys()) == {'regions', 'session', 'client'}
+
+
+
+def test_TaskGraph_serial_order_uses_priority():
+    graph = TaskGraph()
+    graph.add_task('b', lambda: None, priority=2)
+    graph.add_task('a', lambda: None, priority=1)
+    graph.add_task('c', lambda: None, deps=['b'], priority=0)
+    assert graph.topological_order() == ['a', 'b', 'c']
+
+
+
+def test_TaskGraph_runs_independent_tasks_concurrently():
+    #- both tasks must be running at the same time for either to finish
+    barrier = threading.Barrier(2, timeout=5)
+    graph = TaskGraph()
+    graph.add_task('ec2', barrier.wait)
+    graph.add_task('s3', barrier.wait)
+    graph.run(max_workers=2)
+
+
+
+def test_TaskGraph_cycle_detection():
+    graph = TaskGraph()
+    graph.add_task('a', lambda: None, deps=['c'])
+    graph.add_task('b', lambda: None, deps=['a'])
+    graph.add_task('c', lambda: None, deps=['b'])
+    with pytest.raises(TaskGraphCycleError) as err:
+        graph.run()
+    assert set(err.value.cycle) == {'a', 'b', 'c'}
+
+
+
+def test_TaskGraph_failure_skips_dependents():
+    ran = list()
+    def fail():
+        raise RuntimeError('boom')
+
+    graph = TaskGraph()
+    graph.add_task('a', fail)
+    graph.add_task('b', lambda: ran.append('b'), deps=['a'])
+    graph.add_task('c', lambda: ran.append('c'))
+
+    timings = graph.run(continue_after_failure=True)
+    assert ran == ['c']
+    assert isinstance(timings['a'].error, RuntimeError)
+    assert 'b' not in timings
+
+    with pytest.raises(RuntimeError):
+        graph.run()